@@ -0,0 +1,229 @@
+import numpy as np
+import pandas as pd
+from autogluon.timeseries import TimeSeriesDataFrame
+from Orange.data import Table, Domain, ContinuousVariable, StringVariable, TimeVariable
+from orangewidget.tests.base import WidgetTest
+
+from orangecontrib.autogluon_timeseries.widgets.widget_autogluon import (
+    OWAutoGluonTimeSeries, table_fingerprint, classify_table_change, lttb_downsample)
+
+
+def make_table(ids, times, values):
+    """Таблица Orange: время и значение - атрибуты, ID - мета-атрибут"""
+    domain = Domain([TimeVariable("time"), ContinuousVariable("value")], metas=[StringVariable("id")])
+    X = np.column_stack([np.asarray(times, dtype=float), np.asarray(values, dtype=float)])
+    return Table.from_numpy(domain, X, metas=np.asarray(ids, dtype=object).reshape(-1, 1))
+
+
+def fingerprint(table):
+    return table_fingerprint(table, "id", "time", chunk_rows=2)
+
+
+class TestTableChange(WidgetTest):
+    def setUp(self):
+        self.old = make_table(["a", "b", "a"], [1, 1, 2], [10, 20, 11])
+        self.old_print = fingerprint(self.old)
+
+    def classify(self, table):
+        return classify_table_change(self.old_print, table, fingerprint(table))
+
+    def test_new_and_unchanged(self):
+        self.assertEqual(classify_table_change(None, self.old, self.old_print), "new")
+        self.assertEqual(self.classify(make_table(["a", "b", "a"], [1, 1, 2], [10, 20, 11])), "unchanged")
+
+    def test_append(self):
+        # Неполный последний блок старой таблицы пересчитывается по новой
+        table = make_table(["a", "b", "a", "b", "c"], [1, 1, 2, 2, 1], [10, 20, 11, 21, 30])
+        self.assertEqual(self.classify(table), "append")
+
+    def test_modified(self):
+        self.assertEqual(self.classify(make_table(["a", "b", "a"], [1, 1, 2], [10, 25, 11])), "modified")
+        self.assertEqual(self.classify(make_table(["a", "b"], [1, 1], [10, 20])), "modified")
+        # Дописанная строка раньше последней метки своего ряда
+        table = make_table(["a", "b", "a", "a"], [1, 1, 2, 1.5], [10, 20, 11, 12])
+        self.assertEqual(self.classify(table), "modified")
+
+
+class TestLTTB(WidgetTest):
+    def test_downsample(self):
+        x = np.arange(1000, dtype=float)
+        y = np.sin(x / 50)
+        y[500] = 10
+        dx, dy = lttb_downsample(x, y, 50)
+        self.assertEqual(len(dx), 50)
+        self.assertEqual((dx[0], dx[-1]), (0, 999))
+        self.assertTrue(np.all(np.diff(dx) > 0))
+        self.assertIn(10, dy)
+
+    def test_short_series_unchanged(self):
+        x, y = np.arange(10.), np.arange(10.)
+        dx, dy = lttb_downsample(x, y, 20)
+        np.testing.assert_array_equal(dx, x)
+        np.testing.assert_array_equal(dy, y)
+
+
+class TestOWAutoGluonTimeSeries(WidgetTest):
+    def setUp(self):
+        self.widget = self.create_widget(OWAutoGluonTimeSeries)
+        self.widget.id_column = "item_id"
+        self.widget.timestamp_column = "timestamp"
+        self.widget.target_column = "sales"
+        self.widget.multi_target = False
+        self.widget.aggregation_method = 0  # сумма
+
+    @staticmethod
+    def fill_index(name):
+        return [key for key, _ in OWAutoGluonTimeSeries.FILL_STRATEGIES].index(name)
+
+    def gappy_frame(self):
+        return pd.DataFrame({
+            "item_id": ["a", "a", "b", "b"],
+            "timestamp": pd.to_datetime(["2024-01-01", "2024-01-04", "2024-01-01", "2024-01-03"]),
+            "sales": [1., 2., 3., 4.],
+            "price": [5., 6., 7., 8.],
+        })
+
+    def test_aggregate_duplicates(self):
+        df = pd.DataFrame({
+            "item_id": ["a", "a", "a", "b"],
+            "timestamp": pd.to_datetime(["2024-01-01", "2024-01-01", "2024-01-02", "2024-01-01"]),
+            "sales": [1., np.nan, 2., np.nan],
+            "price": [10., 20., 30., 40.],
+        })
+        result = self.widget.aggregate_duplicates(df).set_index(["item_id", "timestamp"])
+        self.assertEqual(len(result), 3)
+        self.assertEqual(self.widget.prep_stats["duplicates_merged"], 1)
+        # Цель суммируется, ковариата усредняется
+        self.assertEqual(result.loc[("a", pd.Timestamp("2024-01-01")), "sales"], 1)
+        self.assertEqual(result.loc[("a", pd.Timestamp("2024-01-01")), "price"], 15)
+        # Сумма одних пропусков остается пропуском
+        self.assertTrue(np.isnan(result.loc[("b", pd.Timestamp("2024-01-01")), "sales"]))
+
+    def test_regularize_zero_fill(self):
+        self.widget.fill_strategy = self.fill_index("zero")
+        result = self.widget.regularize_frame(self.gappy_frame(), "D")
+        self.assertEqual(len(result), 7)
+        a = result[result["item_id"] == "a"]
+        np.testing.assert_array_equal(a["sales"], [1, 0, 0, 2])
+        # Ковариаты не обнуляются, а держат последнее значение ряда
+        np.testing.assert_array_equal(a["price"], [5, 5, 5, 6])
+        self.assertEqual(self.widget.gap_report.to_dict(), {"a": 2, "b": 1})
+
+    def test_regularize_ffill_and_period_aggregation(self):
+        self.widget.fill_strategy = self.fill_index("ffill")
+        df = pd.DataFrame({
+            "item_id": "a",
+            "timestamp": pd.to_datetime(["2024-01-01 08:00", "2024-01-01 18:00", "2024-01-03 00:00"]),
+            "sales": [1., 2., 5.],
+        })
+        result = self.widget.regularize_frame(df, "D")
+        np.testing.assert_array_equal(result["sales"], [3, 3, 5])
+        self.assertEqual(list(result["timestamp"].dt.day), [1, 2, 3])
+
+    def test_profile_repeated_periods(self):
+        # 48 часовых точек при дневной частоте - два полных периода, а не 46 пропусков
+        df = pd.DataFrame({"item_id": "a", "sales": 1.,
+                           "timestamp": pd.date_range("2024-01-01", periods=48, freq="h")})
+        report = self.widget.profile_series(df, "sales", "D")
+        self.assertEqual(report["length"].iloc[0], 48)
+        self.assertEqual(report["missing_share"].iloc[0], 0)
+
+    def test_profile_seasonality_and_gaps(self):
+        dates = pd.date_range("2024-01-01", periods=140, freq="D")
+        values = np.sin(2 * np.pi * np.arange(140) / 7) + 2
+        keep = np.ones(140, dtype=bool)
+        keep[[20, 21, 60]] = False
+        df = pd.DataFrame({"item_id": "a", "timestamp": dates[keep], "sales": values[keep]})
+        report = self.widget.profile_series(df, "sales", "D").iloc[0]
+        self.assertAlmostEqual(report["missing_share"], 3 / 140)
+        self.assertEqual(report["max_gap"], 2)
+        self.assertEqual(report["season_length"], 7)
+        self.assertGreater(report["seasonal_corr"], 0.99)
+        self.assertTrue(report["seasonal"])
+
+    def test_tsb_fallback(self):
+        self.widget.prediction_length = 3
+        dates = pd.date_range("2024-01-01", periods=20, freq="D")
+        df = pd.DataFrame({
+            "item_id": np.repeat(["sparse", "empty"], 20),
+            "timestamp": np.tile(dates, 2),
+            "sales": np.r_[np.tile([0., 4.], 10), np.zeros(20)],
+        })
+        ts_data = TimeSeriesDataFrame.from_data_frame(df, id_column="item_id", timestamp_column="timestamp")
+        methods = pd.Series("croston_tsb", index=["sparse", "empty"])
+        forecast = self.widget.fallback_forecast(ts_data, "sales", "D", [0.1, 0.5, 0.9], methods)
+        self.assertEqual(len(forecast), 6)
+        sparse = forecast.loc["sparse", "mean"].to_numpy()
+        # Спрос 4 в половине периодов: прогноз - около среднего 2, одинаковый на всем горизонте
+        self.assertAlmostEqual(sparse[0], 2, delta=0.3)
+        np.testing.assert_array_equal(sparse, sparse[0])
+        np.testing.assert_array_equal(forecast.loc["empty", "mean"], 0)
+        self.assertTrue((forecast >= 0).all().all())
+
+    def test_reconcile_bottom_up(self):
+        self.widget.hierarchy_columns = ["region"]
+        self.widget.reconciliation_method = 0  # bottom-up
+        dates = pd.date_range("2024-01-01", periods=4, freq="D")
+        df = pd.DataFrame({
+            "item_id": np.repeat(["a", "b", "c"], 4),
+            "region": np.repeat(["r1", "r1", "r2"], 4),
+            "timestamp": np.tile(dates, 3),
+            "sales": np.arange(12, dtype=float),
+        })
+        history = self.widget.build_hierarchy(df)
+        labels = self.widget.hierarchy["labels"]
+        self.assertEqual(labels[-1], OWAutoGluonTimeSeries.HIERARCHY_TOTAL)
+
+        future = pd.date_range("2024-01-05", periods=2, freq="D")
+        rng = np.random.default_rng(0)
+        index = pd.MultiIndex.from_product([labels, future], names=["item_id", "timestamp"])
+        predictions = TimeSeriesDataFrame(pd.DataFrame(
+            {"mean": rng.uniform(0, 10, len(index)), "0.5": rng.uniform(0, 10, len(index))}, index=index))
+        ts_data = TimeSeriesDataFrame.from_data_frame(history.astype({"item_id": str}),
+                                                      id_column="item_id", timestamp_column="timestamp")
+        reconciled = self.widget.reconcile_predictions(predictions, ts_data, "sales")["mean"]
+        for date in future:
+            step = reconciled.xs(date, level=1)
+            self.assertAlmostEqual(step["region=r1"], step["a"] + step["b"])
+            self.assertAlmostEqual(step[OWAutoGluonTimeSeries.HIERARCHY_TOTAL], step["a"] + step["b"] + step["c"])
+
+    def test_split_single_series(self):
+        df = pd.DataFrame({"timestamp": pd.date_range("2024-01-01", periods=100, freq="D"),
+                           "sales": np.arange(100, dtype=float)})
+        self.widget.split_n_series = 3
+        self.widget.split_window = 0
+
+        # Частей не больше, чем позволяет минимальная длина ряда
+        chunks = self.widget.split_single_series(df, "chunks")
+        self.assertEqual(chunks["item_id"].value_counts().to_dict(), {"series_1": 50, "series_2": 50})
+
+        windows = self.widget.split_single_series(df, "windows")
+        self.assertEqual(len(windows), 150)
+        second = windows[windows["item_id"] == "series_2"]
+        self.assertEqual(second["sales"].iloc[0], 25)
+        self.assertEqual(len(second), 50)
+
+    def test_infer_timestamp_parser(self):
+        infer = self.widget.infer_timestamp_parser
+        self.assertEqual(infer(pd.Series(["31.01.2024", "01.02.2024"])), ("format", "%d.%m.%Y"))
+        self.assertEqual(infer(pd.Series([20240131, 20240201])), ("format", "%Y%m%d"))
+        self.assertEqual(infer(pd.Series([1.7e9, 1.7e9 + 86400])), ("unit", "s"))
+        self.assertEqual(infer(pd.Series([1.7e12, 1.7e12 + 86400000])), ("unit", "ms"))
+        self.assertIsNone(infer(pd.Series(["a", "b"])))
+
+    def test_parse_timestamps_failures(self):
+        values = pd.Series(["2024-01-01", "2024-01-02", "не дата"])
+        parsed = self.widget.parse_timestamps(values, "timestamp")
+        self.assertEqual(parsed.isna().sum(), 1)
+        self.assertEqual(self.widget.timestamp_failures["row"].tolist(), [2])
+        self.assertTrue(self.widget.Warning.timestamp_failures.is_shown())
+
+        # Повторный разбор из кэша сообщает о тех же строках
+        self.widget.parse_timestamps(values, "timestamp")
+        self.assertTrue(self.widget.Warning.timestamp_failures.is_shown())
+
+        # Отложенная выборка не меняет кэш и предупреждение основных данных
+        cache = dict(self.widget.timestamp_cache)
+        self.widget.parse_timestamps(pd.Series(["2024-02-01", "2024-02-02"]), "timestamp", holdout=True)
+        self.assertEqual(self.widget.timestamp_cache, cache)
+        self.assertTrue(self.widget.Warning.timestamp_failures.is_shown())
@@ -1,8 +1,15 @@
 import logging
 import os
-from Orange.widgets.widget import OWWidget, Input, Output
+import copy
+import hashlib
+import json
+import shutil
+import time
+import zipfile
+from Orange.widgets.widget import OWWidget, Input, Output, Msg
 from Orange.widgets import gui, settings
 from Orange.data import Table, Domain, ContinuousVariable, StringVariable, DiscreteVariable, TimeVariable, Variable
+from Orange.misc.environ import data_dir
 import pandas as pd
 import numpy as np
 import tempfile
@@ -10,17 +17,164 @@ from autogluon.timeseries import TimeSeriesPredictor, TimeSeriesDataFrame
 from datetime import datetime, timedelta
 from pathlib import Path
 import traceback
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from Orange.widgets.utils.widgetpreview import WidgetPreview
-from PyQt5.QtWidgets import QPlainTextEdit, QCheckBox, QComboBox, QLabel
-from PyQt5.QtCore import QCoreApplication
+from PyQt5.QtWidgets import QPlainTextEdit, QCheckBox, QComboBox, QLabel, QListWidget, QAbstractItemView, QFileDialog
+from PyQt5.QtCore import QCoreApplication, QThread, QTimer
 from PyQt5.QtGui import QFont
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
+from collections import OrderedDict
 import holidays # Импортируем библиотеку holidays
+try:
+    from pandas.tseries.api import guess_datetime_format
+except ImportError:  # pandas < 2.2
+    from pandas._libs.tslibs.parsing import guess_datetime_format
 import warnings
+from statistics import NormalDist
 
 warnings.filterwarnings('ignore')
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Предиктор, загруженный в процессе-обработчике пакетного прогноза
+_batch_predictor = None
+
+
+def _init_predict_worker(predictor_path, threads):
+    """Инициализация процесса пакетного прогноза: лимит потоков и однократная загрузка модели"""
+    global _batch_predictor
+    for var in OWAutoGluonTimeSeries.THREAD_ENV_VARS:
+        os.environ[var] = str(threads)
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except Exception:
+        pass
+    _batch_predictor = TimeSeriesPredictor.load(predictor_path)
+
+
+def _predict_with_model(predictor, data, known_covariates, model=None, use_cache=True):
+    """Прогноз моделью предиктора. Словарь {модель: вес} - урезанный ансамбль: взвешенная сумма прогнозов членов"""
+    if not isinstance(model, dict):
+        return predictor.predict(data, known_covariates=known_covariates, model=model, use_cache=use_cache)
+    total_weight = sum(model.values())
+    result = None
+    for name, weight in model.items():
+        member = predictor.predict(data, known_covariates=known_covariates, model=name, use_cache=use_cache)
+        result = member * (weight / total_weight) if result is None else result + member * (weight / total_weight)
+    return result
+
+
+def _predict_batch(data, known_covariates, model=None):
+    """Прогноз одного пакета рядов в процессе-обработчике"""
+    return _predict_with_model(_batch_predictor, data, known_covariates, model, use_cache=False)
+
+
+# Строк в блоке хэширования входной таблицы: память не зависит от размера таблицы
+FINGERPRINT_CHUNK_ROWS = 1 << 16
+
+
+def _hash_table_rows(table, start, stop):
+    """Хэш строк [start, stop) таблицы Orange: X, Y и metas одного блока подряд"""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(np.ascontiguousarray(table.X[start:stop]).tobytes())
+    digest.update(np.ascontiguousarray(table.Y[start:stop]).tobytes())
+    if table.metas.shape[1]:
+        digest.update(pd.util.hash_pandas_object(pd.DataFrame(table.metas[start:stop]), index=False)
+                      .to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def _table_column(table, name):
+    """Значения колонки таблицы Orange по имени (None, если колонки нет)"""
+    if not name or name not in table.domain:
+        return None
+    var = table.domain[name]
+    column = table.get_column(var) if hasattr(table, "get_column") else table.get_column_view(var)[0]
+    return np.asarray(column)
+
+
+def table_fingerprint(table, id_name=None, time_name=None, chunk_rows=FINGERPRINT_CHUNK_ROWS):
+    """Отпечаток таблицы Orange без копирования всей таблицы.
+
+    Буферы X, Y и metas хэшируются блоками по chunk_rows строк; хэши блоков позволяют
+    проверить, является ли старая таблица началом новой. Для колонок ID и времени
+    за один векторный проход считаются количество строк и последняя метка по каждому ряду.
+    """
+    domain = tuple((type(var).__name__, var.name) for var in
+                   list(table.domain.attributes) + list(table.domain.class_vars) + list(table.domain.metas))
+    n_rows = len(table)
+    chunks = [_hash_table_rows(table, start, min(start + chunk_rows, n_rows))
+              for start in range(0, n_rows, chunk_rows)]
+    digest = hashlib.blake2b("".join(chunks).encode(), digest_size=16).hexdigest()
+
+    id_stats = None
+    ids, times = _table_column(table, id_name), _table_column(table, time_name)
+    if ids is not None and times is not None:
+        codes, uniques = pd.factorize(ids)
+        id_stats = pd.DataFrame({
+            "count": np.bincount(codes[codes >= 0], minlength=len(uniques)),
+            "last": pd.Series(times).groupby(codes).max().reindex(range(len(uniques))).to_numpy(),
+        }, index=uniques)
+    return {"rows": n_rows, "domain": domain, "chunk_rows": chunk_rows, "chunks": chunks,
+            "digest": digest, "id_name": id_name, "time_name": time_name, "id_stats": id_stats}
+
+
+def classify_table_change(old, table, new):
+    """Тип изменения входа: 'new', 'unchanged', 'append' (строки дописаны в конец и позже
+    последних меток своих рядов) или 'modified'"""
+    if old is None:
+        return "new"
+    if old["domain"] != new["domain"] or old["chunk_rows"] != new["chunk_rows"]:
+        return "modified"
+    if old["digest"] == new["digest"]:
+        return "unchanged"
+    if new["rows"] <= old["rows"]:
+        return "modified"
+
+    # Старая таблица - начало новой: полные блоки совпадают, неполный последний блок пересчитывается
+    chunk_rows, old_rows = old["chunk_rows"], old["rows"]
+    full = old_rows // chunk_rows
+    if old["chunks"][:full] != new["chunks"][:full]:
+        return "modified"
+    if old_rows % chunk_rows and _hash_table_rows(table, full * chunk_rows, old_rows) != old["chunks"][full]:
+        return "modified"
+
+    # Дописанные строки должны продолжать свои ряды во времени
+    if old["id_stats"] is not None and (old["id_name"], old["time_name"]) == (new["id_name"], new["time_name"]):
+        tail_ids = _table_column(table, new["id_name"])[old_rows:]
+        tail_times = _table_column(table, new["time_name"])[old_rows:]
+        first_new = pd.Series(tail_times).groupby(tail_ids).min()
+        previous_last = old["id_stats"]["last"].reindex(first_new.index)
+        if (first_new <= previous_last).any():
+            return "modified"
+    return "append"
+
+
+def lttb_downsample(x, y, n_out):
+    """Largest-Triangle-Three-Buckets: n_out точек, сохраняющих форму ряда (пики и провалы)"""
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return x, y
+    # Границы корзин: первая и последняя точки берутся всегда
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    previous = 0
+    for bucket in range(n_out - 2):
+        start, stop = edges[bucket], edges[bucket + 1]
+        next_stop = edges[bucket + 2] if bucket + 2 < len(edges) else n
+        # Вершина треугольника в следующей корзине - ее средняя точка
+        mean_x = x[stop:next_stop].mean()
+        mean_y = y[stop:next_stop].mean()
+        area = np.abs((x[previous] - mean_x) * (y[start:stop] - y[previous])
+                      - (x[previous] - x[start:stop]) * (mean_y - y[previous]))
+        previous = start + int(np.argmax(area))
+        selected[bucket + 1] = previous
+    return x[selected], y[selected]
+
+
 class OWAutoGluonTimeSeries(OWWidget):
     name = "AutoGluon Time Series"
     description = "Прогнозирование временных рядов с AutoGluon"
@@ -34,6 +188,8 @@ class OWAutoGluonTimeSeries(OWWidget):
     selected_metric = settings.Setting("MAE")
     selected_preset = settings.Setting("best_quality")
     target_column = settings.Setting("sales")
+    multi_target = settings.Setting(False)  # Прогноз нескольких целей за один запуск
+    extra_target_columns = settings.Setting([])  # Дополнительные целевые колонки
     id_column = settings.Setting("item_id")
     timestamp_column = settings.Setting("timestamp")
     include_holidays = settings.Setting(False)
@@ -42,6 +198,40 @@ class OWAutoGluonTimeSeries(OWWidget):
     auto_frequency = settings.Setting(True)  # Автоопределение частоты
     selected_model = settings.Setting("auto") # выбор моделей
     holiday_country = settings.Setting("RU") # Страна для праздников
+    regularize_series = settings.Setting(True)  # Приводить ряды к регулярной сетке частоты
+    fill_strategy = settings.Setting(0)  # Заполнение пропусков (индекс в FILL_STRATEGIES)
+    aggregation_method = settings.Setting(0)  # Агрегация дубликатов и точек одного периода (индекс в AGGREGATION_METHODS)
+    hierarchical = settings.Setting(False)  # Иерархический прогноз по уровням
+    hierarchy_columns = settings.Setting([])  # Колонки уровней иерархии над ID (категория, регион...)
+    reconciliation_method = settings.Setting(0)  # Согласование уровней (индекс в RECONCILIATION_METHODS)
+    split_strategy = settings.Setting(0)  # Разбиение одиночного ряда (индекс в SPLIT_STRATEGIES)
+    split_n_series = settings.Setting(3)  # Количество искусственных рядов
+    split_window = settings.Setting(0)  # Длина скользящего окна (0 = авто)
+    sample_training = settings.Setting(False)  # Обучение на стратифицированной выборке рядов
+    sample_fraction = settings.Setting(20)  # Доля рядов в выборке, %
+    fallback_tier = settings.Setting(False)  # Простые методы для холодного старта и разреженных рядов
+    cold_start_length = settings.Setting(20)  # Ряды короче - холодный старт
+    sparse_zero_share = settings.Setting(70)  # Доля нулей (%), начиная с которой спрос прерывистый
+    fallback_method = settings.Setting(0)  # Метод для коротких рядов (индекс в FALLBACK_METHODS)
+    predict_batch_size = settings.Setting(0)  # Рядов в пакете прогноза (0 = все сразу)
+    predict_workers = settings.Setting(1)  # Процессов пакетного прогноза (1 = в текущем процессе)
+    fast_model_tolerance = settings.Setting(5)  # Допуск по оценке для рекомендации быстрой модели, %
+    inference_mode = settings.Setting(0)  # Модель для прогноза (индекс в INFERENCE_MODES)
+    inference_model = settings.Setting("")  # Имя модели для режима "Выбранная модель"
+    ensemble_weight_threshold = settings.Setting(10)  # Минимальный вес члена урезанного ансамбля, %
+    refit_full = settings.Setting(False)  # Дообучить модели на всех данных (refit_full) после fit
+    quality_filter = settings.Setting(False)  # Автоматическая очистка рядов по профилю качества
+    max_missing_share = settings.Setting(50)  # Ряды с большей долей пропусков (%) исключаются
+    auto_budget = settings.Setting(False)  # Лимит времени и пресет по оценке стоимости обучения
+    target_wall_time = settings.Setting(600)  # Целевое время обучения в режиме автобюджета, сек
+    evaluate_mode = settings.Setting(False)  # Оценка: последние точки рядов (все окна бэктеста) не участвуют в обучении
+    backtest_windows = settings.Setting(1)  # Окон бэктеста (точек отсечения) в режиме оценки
+    backtest_step = settings.Setting(0)  # Шаг между точками отсечения (0 = длина прогноза)
+    auto_apply = settings.Setting(False)  # Автозапуск при изменении входных данных
+    persist_models = settings.Setting(True)  # Держать модели в памяти (predictor.persist)
+    model_export_path = settings.Setting("")  # Последний путь сохранения/загрузки модели
+    num_cpus = settings.Setting(0)  # Лимит ядер CPU для обучения (0 = все доступные)
+    threads_per_model = settings.Setting(0)  # Потоков на одну модель (0 = по лимиту ядер)
 
     # Метрики
     METRICS = ["MAE", "MAPE", "MSE", "RMSE", "WQL"]
@@ -59,24 +249,160 @@ class OWAutoGluonTimeSeries(OWWidget):
     ]
     # Доступные страны для праздников (можно расширить)
     HOLIDAY_COUNTRIES = ["RU", "US", "GB", "DE", "FR", "CA"]
+    # Стратегии заполнения пропусков после регуляризации
+    FILL_STRATEGIES = [
+        ("ffill", "Предыдущее значение"),
+        ("zero", "Нули"),
+        ("interpolate", "Линейная интерполяция"),
+        ("nan", "Оставить пропуски")
+    ]
+    # Агрегация дубликатов (ID, время) и нескольких точек, попавших в один период
+    AGGREGATION_METHODS = [
+        ("sum", "Сумма"),
+        ("mean", "Среднее"),
+        ("max", "Максимум"),
+        ("last", "Последнее")
+    ]
+    # Методы согласования иерархических прогнозов
+    RECONCILIATION_METHODS = [
+        ("bottom_up", "Снизу вверх (bottom-up)"),
+        ("mint", "MinT (взвешенный)"),
+        ("none", "Без согласования")
+    ]
+    # Ключ ряда верхнего уровня иерархии
+    HIERARCHY_TOTAL = "__total__"
+    # Предел числа нижних рядов для MinT (плотная матрица n x n)
+    MINT_MAX_BOTTOM_SERIES = 5000
+    # Стратегии разбиения одиночного ряда на искусственные ряды
+    SPLIT_STRATEGIES = [
+        ("off", "Не разбивать"),
+        ("chunks", "N последовательных частей"),
+        ("rolling", "Скользящие окна")
+    ]
+    # AutoGluon требует минимум 29 точек на ряд, добавим запас и сделаем 35
+    MIN_POINTS_PER_SERIES = 35
+    # Окна валидации при обучении: влияют на минимальную длину ряда
+    NUM_VAL_WINDOWS = 1
+    VAL_STEP_SIZE = 1
+    # Сезонный период резервного прогноза по базовой частоте
+    SEASON_LENGTHS = {"D": 7, "W": 52, "M": 12, "ME": 12, "Q": 4, "QE": 4, "H": 24, "h": 24,
+                      "T": 60, "min": 60, "B": 5, "Y": 1, "YE": 1, "A": 1}
+    # Резервные методы для коротких рядов (прерывистый спрос всегда прогнозируется TSB)
+    FALLBACK_METHODS = [
+        ("auto", "Авто"),
+        ("naive", "Наивный"),
+        ("seasonal_naive", "Сезонный наивный"),
+        ("moving_average", "Скользящее среднее")
+    ]
+    # Глубина истории резервных методов и параметры сглаживания TSB
+    FALLBACK_HISTORY = 100
+    # Квантили прогноза AutoGluon по умолчанию (используются, когда модели не обучались)
+    QUANTILE_LEVELS = [0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9]
+    TSB_ALPHA = 0.1
+    TSB_BETA = 0.1
+    # Фиксированное зерно выборки рядов - повторяемые запуски
+    SAMPLE_SEED = 42
+    # Число квантильных корзин по длине и по объему для стратификации
+    SAMPLE_STRATA_BINS = 4
+    # Объем выборки для вывода формата времени и число форматов-кандидатов из нее
+    TIMESTAMP_SAMPLE_SIZE = 1000
+    TIMESTAMP_FORMAT_CANDIDATES = 20
+    # Задержка автозапуска: серия быстрых изменений входа дает один запуск
+    AUTO_APPLY_DELAY_MS = 500
+    # Версия формата файла модели и настройки, сохраняемые вместе с предикторами
+    MODEL_ARTIFACT_VERSION = 1
+    SAVED_SETTINGS = [
+        "prediction_length", "selected_metric", "selected_preset", "frequency", "auto_frequency",
+        "include_holidays", "holiday_country", "use_current_date", "multi_target", "extra_target_columns",
+        "regularize_series", "fill_strategy", "aggregation_method", "hierarchical", "hierarchy_columns",
+        "reconciliation_method", "split_strategy", "split_n_series", "split_window",
+        "fallback_tier", "cold_start_length", "sparse_zero_share", "fallback_method",
+        "time_limit", "sample_training", "sample_fraction", "refit_full", "evaluate_mode",
+        "backtest_windows", "backtest_step", "auto_budget", "target_wall_time", "quality_filter",
+        "max_missing_share"
+    ]
+    # Настройки, изменение которых требует переобучения. Остальные (длина прогноза в пределах
+    # обученного горизонта, страна праздников, даты, согласование, пакеты) обслуживаются моделью в памяти
+    REFIT_SETTINGS = [
+        "selected_metric", "selected_preset", "time_limit", "frequency", "auto_frequency",
+        "include_holidays", "multi_target", "extra_target_columns", "regularize_series", "fill_strategy",
+        "aggregation_method", "hierarchical", "hierarchy_columns", "split_strategy", "split_n_series",
+        "split_window", "fallback_tier", "cold_start_length", "sparse_zero_share", "fallback_method",
+        "sample_training", "sample_fraction", "refit_full", "evaluate_mode",
+        "backtest_windows", "backtest_step", "auto_budget", "target_wall_time", "quality_filter",
+        "max_missing_share"
+    ]
+    PREDICT_SETTINGS = [
+        "prediction_length", "holiday_country", "use_current_date", "reconciliation_method",
+        "predict_batch_size", "predict_workers", "fast_model_tolerance", "inference_mode",
+        "inference_model", "ensemble_weight_threshold"
+    ]
+    # Модель, которой выполняется прогноз
+    INFERENCE_MODES = [
+        ("best", "Лучшая модель"),
+        ("fast", "Рекомендованная быстрая"),
+        ("pruned", "Урезанный ансамбль"),
+        ("chosen", "Выбранная модель")
+    ]
+    # Профиль качества: порог автокорреляции на сезонном лаге, порог выброса (|z|),
+    # доля отрицательных значений, до которой они считаются ошибками и обнуляются
+    SEASONALITY_MIN_CORR = 0.3
+    OUTLIER_Z = 4.0
+    NEGATIVE_CLIP_SHARE = 0.05
+    # Пресеты AutoGluon от лучшего к быстрому и их относительная стоимость обучения
+    PRESETS = ["best_quality", "high_quality", "medium_quality", "fast_training"]
+    # Набор моделей (ключ get_default_hps), который выбирает пресет AutoGluon
+    PRESET_HYPERPARAMETERS = {"best_quality": "default", "high_quality": "default",
+                              "medium_quality": "light", "fast_training": "very_light"}
+    PRESET_COSTS = {"best_quality": 16.0, "high_quality": 8.0, "medium_quality": 3.0, "fast_training": 1.0}
+    # Автобюджет: скорость по умолчанию (единиц стоимости на ядро в секунду) до накопления истории,
+    # запас лимита над оценкой, доля целевого времени на обучение, размер истории запусков
+    BUDGET_DEFAULT_RATE = 5000.0
+    BUDGET_MARGIN = 1.5
+    BUDGET_FIT_SHARE = 0.9
+    BUDGET_HISTORY_SIZE = 50
+    MIN_TIME_LIMIT = 10
+    # График: точек истории после прореживания, размер кэша по рядам и задержка перерисовки
+    PLOT_MAX_POINTS = 1000
+    PLOT_CACHE_SIZE = 500
+    PLOT_DELAY_MS = 50
+    # Переменные окружения, ограничивающие потоки torch/OpenMP/MKL
+    THREAD_ENV_VARS = ["OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS",
+                       "NUMEXPR_NUM_THREADS", "VECLIB_MAXIMUM_THREADS"]
+    # Локальные модели AutoGluon, которые распараллеливаются через n_jobs
+    LOCAL_MODELS = ["Naive", "SeasonalNaive", "ETS", "AutoETS", "Theta",
+                    "DynamicOptimizedTheta", "NPTS"]
+    # Табличные модели AutoGluon (LightGBM внутри)
+    TABULAR_MODELS = ["RecursiveTabular", "DirectTabular"]
 
 
     class Inputs:
         data = Input("Data", Table)
+        holdout = Input("Holdout", Table)
 
     class Outputs:
         prediction = Output("Prediction", Table)
         leaderboard = Output("Leaderboard", Table)
         model_info = Output("Model Info", Table)
+        evaluation = Output("Evaluation", Table)
+        backtest = Output("Backtest", Table)
+        data_quality = Output("Data Quality", Table)
         log_messages = Output("Log", str)
 
+    class Warning(OWWidget.Warning):
+        # Отдельное сообщение: общий self.warning("") проверок длины прогноза его не сбрасывает
+        timestamp_failures = Msg("Не удалось разобрать время в {} строках колонки '{}', строки исключены")
+
     def __init__(self):
         super().__init__()
         self.data = None
         self.predictor = None
         self.log_messages = ""
         self.detected_frequency = "D"  # Определенная частота данных по умолчанию
-        self.mainArea.hide()
+        self.fit_budget = None  # (лимит времени, пресет, оценка сек) последнего обучения
+        self.fit_timings = []  # Замеры обучения по целям для истории автобюджета
+        self.plot_data = None  # (ряды, история, прогноз) основной цели для графика
+        self.plot_cache = OrderedDict()  # Прореженные данные графика по рядам (LRU)
         self.setup_ui()
         self.warning("")
         self.error("")
@@ -85,8 +411,37 @@ class OWAutoGluonTimeSeries(OWWidget):
         # Данные для валидации длины прогноза
         self.max_allowed_prediction = 0
         self.data_length = 0
+        self.series_lengths = None  # Длины рядов входных данных (по колонке ID)
         self.from_form_timeseries = False  # Флаг для определения источника данных
         self.categorical_mapping = {} # для сопоставления категориальных значений
+        self.prep_stats = {}  # Статистика этапов подготовки (дубликаты, пропуски)
+        self.gap_report = None  # Количество заполненных пропусков по рядам
+        self.fallback_series = {}  # Ряды по целям, прогнозируемые резервными методами (item_id -> метод)
+        self.sampling_report = {}  # Выборка рядов для обучения по целям (доля, разрыв валидации)
+        self.hierarchy = None  # Структура иерархии последней подготовки (метки и родители рядов)
+        self.ts_cache = None  # (отпечаток, ts_data, df_sorted, колонки) последней подготовки
+        self.trained_holiday_country = None  # Страна праздников истории при прогнозе моделью в памяти
+        self.quality_report = None  # Профиль качества рядов последней подготовки
+        self.trained = {}  # Обученные или загруженные предикторы по целям: target -> (predictor, ts_data)
+        self.model_meta = None  # Частота, роли колонок и настройки обученной модели
+        self.model_dir = None  # Каталог предикторов, принадлежащий виджету
+        self.input_fingerprint = None  # Отпечаток последней принятой входной таблицы
+        self.holdout_table = None  # Пользовательская отложенная выборка для лидерборда
+        self.inference_models = {}  # Модель прогноза по целям (None - лучшая модель предиктора)
+        self.timestamp_cache = {}  # Разобранные колонки времени: колонка -> (хэш значений, способ, результат)
+        self.timestamp_failures = None  # Строки, время в которых не удалось разобрать
+        self.input_change = None  # Тип последнего изменения входа: new/unchanged/append/modified
+        self.applied_state = None  # Отпечаток входа и настроек последнего успешного запуска
+        self.running = False  # Идет обучение или прогноз
+        self.pending_input = None  # (таблица,) - последний вход, пришедший во время расчета
+        self.apply_timer = QTimer(self)
+        self.apply_timer.setSingleShot(True)
+        self.apply_timer.setInterval(self.AUTO_APPLY_DELAY_MS)
+        self.apply_timer.timeout.connect(self.auto_run)
+        self.plot_timer = QTimer(self)
+        self.plot_timer.setSingleShot(True)
+        self.plot_timer.setInterval(self.PLOT_DELAY_MS)
+        self.plot_timer.timeout.connect(self.draw_plot)
 
     def setup_ui(self):
 
@@ -108,10 +463,18 @@ class OWAutoGluonTimeSeries(OWWidget):
         
         self.model_selector = gui.comboBox(
             box, self, "selected_preset",
-            items=["best_quality", "high_quality", "medium_quality", "fast_training"],
+            items=self.PRESETS,
             label="Пресет:",
             sendSelectedValue=True
         )
+        # Автобюджет: лимит времени и пресет подбираются под целевое время по размеру данных
+        self.auto_budget_checkbox = QCheckBox("Автобюджет времени и пресета")
+        self.auto_budget_checkbox.setChecked(self.auto_budget)
+        self.auto_budget_checkbox.stateChanged.connect(self.on_auto_budget_changed)
+        box.layout().addWidget(self.auto_budget_checkbox)
+        self.wall_time_spin = gui.spin(box, self, "target_wall_time", 10, 86400, 10,
+                                       label="Целевое время обучения (сек):")
+        self.wall_time_spin.setEnabled(self.auto_budget)
 
         # Добавляем выбор моделей
         self.model_selector = gui.comboBox(
@@ -130,10 +493,36 @@ class OWAutoGluonTimeSeries(OWWidget):
         self.target_combo = gui.comboBox(col_box, self, "target_column", label="Целевая:", 
                                          items=[], sendSelectedValue=True,
                                          callback=self.on_target_column_changed) 
+        # Дополнительные цели (режим нескольких целей)
+        self.multi_target_checkbox = QCheckBox("Несколько целей")
+        self.multi_target_checkbox.setChecked(self.multi_target)
+        self.multi_target_checkbox.stateChanged.connect(self.on_multi_target_changed)
+        col_box.layout().addWidget(self.multi_target_checkbox)
+        self.extra_targets_list = QListWidget()
+        self.extra_targets_list.setSelectionMode(QAbstractItemView.MultiSelection)
+        self.extra_targets_list.setMaximumHeight(100)
+        self.extra_targets_list.itemSelectionChanged.connect(self.on_extra_targets_changed)
+        self.extra_targets_list.setEnabled(self.multi_target)
+        col_box.layout().addWidget(self.extra_targets_list)
         # ID ряда
         self.id_combo = gui.comboBox(col_box, self, "id_column", label="ID ряда:", 
                                      items=[], sendSelectedValue=True,
                                      callback=self.on_id_column_changed) 
+        # Иерархия: колонки уровней и метод согласования
+        self.hierarchical_checkbox = QCheckBox("Иерархический прогноз")
+        self.hierarchical_checkbox.setChecked(self.hierarchical)
+        self.hierarchical_checkbox.stateChanged.connect(self.on_hierarchical_changed)
+        col_box.layout().addWidget(self.hierarchical_checkbox)
+        self.hierarchy_list = QListWidget()
+        self.hierarchy_list.setSelectionMode(QAbstractItemView.MultiSelection)
+        self.hierarchy_list.setMaximumHeight(100)
+        self.hierarchy_list.itemSelectionChanged.connect(self.on_hierarchy_columns_changed)
+        col_box.layout().addWidget(self.hierarchy_list)
+        self.reconciliation_combo = gui.comboBox(col_box, self, "reconciliation_method",
+                                                 items=[label for _, label in self.RECONCILIATION_METHODS],
+                                                 label="Согласование:")
+        self.hierarchy_list.setEnabled(self.hierarchical)
+        self.reconciliation_combo.setEnabled(self.hierarchical)
         # Временная метка
         self.timestamp_combo = gui.comboBox(col_box, self, "timestamp_column", label="Время:", 
                                             items=[], sendSelectedValue=True,
@@ -163,6 +552,19 @@ class OWAutoGluonTimeSeries(OWWidget):
         self.detected_freq_label = QLabel("Определенная частота: N/A")
         freq_box.layout().addWidget(self.detected_freq_label)
 
+        # Регуляризация рядов
+        self.regularize_checkbox = QCheckBox("Приводить ряды к регулярной сетке")
+        self.regularize_checkbox.setChecked(self.regularize_series)
+        self.regularize_checkbox.stateChanged.connect(self.on_regularize_changed)
+        freq_box.layout().addWidget(self.regularize_checkbox)
+        self.fill_combo = gui.comboBox(freq_box, self, "fill_strategy",
+                                       items=[label for _, label in self.FILL_STRATEGIES],
+                                       label="Заполнение пропусков:")
+        self.aggregation_combo = gui.comboBox(freq_box, self, "aggregation_method",
+                                              items=[label for _, label in self.AGGREGATION_METHODS],
+                                              label="Агрегация дубликатов:")
+        self.fill_combo.setEnabled(self.regularize_series)
+
         # Дополнительные настройки
         extra_box = gui.widgetBox(self.controlArea, "Дополнительно")
         self.holidays_checkbox = QCheckBox("Учитывать праздники")
@@ -183,8 +585,108 @@ class OWAutoGluonTimeSeries(OWWidget):
         self.date_checkbox.stateChanged.connect(self.on_date_option_changed)
         extra_box.layout().addWidget(self.date_checkbox)
 
+        # Профиль качества данных и автоматическая очистка
+        quality_box = gui.widgetBox(self.controlArea, "Качество данных")
+        self.quality_checkbox = QCheckBox("Очищать ряды по профилю качества")
+        self.quality_checkbox.setChecked(self.quality_filter)
+        self.quality_checkbox.stateChanged.connect(self.on_quality_filter_changed)
+        quality_box.layout().addWidget(self.quality_checkbox)
+        self.missing_spin = gui.spin(quality_box, self, "max_missing_share", 1, 100, 5,
+                                     label="Исключать ряды с пропусками более, %:")
+        self.missing_spin.setEnabled(self.quality_filter)
+
+        # Разбиение одиночного ряда
+        split_box = gui.widgetBox(self.controlArea, "Разбиение одиночного ряда")
+        gui.comboBox(split_box, self, "split_strategy",
+                     items=[label for _, label in self.SPLIT_STRATEGIES],
+                     label="Стратегия:")
+        gui.spin(split_box, self, "split_n_series", 2, 1000, 1, label="Количество рядов:")
+        gui.spin(split_box, self, "split_window", 0, 10000000, 10, label="Длина окна (0 = авто):")
+
+        # Резервные методы для холодного старта и прерывистого спроса
+        fallback_box = gui.widgetBox(self.controlArea, "Резервные методы")
+        self.fallback_checkbox = QCheckBox("Простые методы для коротких и разреженных рядов")
+        self.fallback_checkbox.setChecked(self.fallback_tier)
+        self.fallback_checkbox.stateChanged.connect(self.on_fallback_tier_changed)
+        fallback_box.layout().addWidget(self.fallback_checkbox)
+        self.cold_start_spin = gui.spin(fallback_box, self, "cold_start_length", 1, 10000, 1,
+                                        label="Холодный старт, точек меньше:")
+        self.sparse_spin = gui.spin(fallback_box, self, "sparse_zero_share", 1, 100, 5,
+                                    label="Прерывистый спрос, нулей % от:")
+        gui.comboBox(fallback_box, self, "fallback_method",
+                     items=[label for _, label in self.FALLBACK_METHODS],
+                     label="Метод для коротких рядов:")
+        self.cold_start_spin.setEnabled(self.fallback_tier)
+        self.sparse_spin.setEnabled(self.fallback_tier)
+
+        # Большие каталоги: обучение на выборке рядов
+        scale_box = gui.widgetBox(self.controlArea, "Большие каталоги")
+        self.sample_checkbox = QCheckBox("Обучать на выборке рядов")
+        self.sample_checkbox.setChecked(self.sample_training)
+        self.sample_checkbox.stateChanged.connect(self.on_sample_training_changed)
+        scale_box.layout().addWidget(self.sample_checkbox)
+        self.sample_spin = gui.spin(scale_box, self, "sample_fraction", 1, 100, 1, label="Доля рядов, %:")
+        self.sample_spin.setEnabled(self.sample_training)
+        gui.spin(scale_box, self, "predict_batch_size", 0, 1000000, 1000,
+                 label="Пакет прогноза, рядов (0 = все):")
+        gui.spin(scale_box, self, "predict_workers", 1, 64, 1, label="Процессов прогноза:")
+
+        # Ресурсы CPU
+        res_box = gui.widgetBox(self.controlArea, "Ресурсы")
+        max_cpus = os.cpu_count() or 1
+        gui.spin(res_box, self, "num_cpus", 0, max_cpus, 1, label="Ядер CPU (0 = все):")
+        gui.spin(res_box, self, "threads_per_model", 0, max_cpus, 1, label="Потоков на модель (0 = авто):")
+
+        # Выбор модели для прогноза по скорости
+        inference_box = gui.widgetBox(self.controlArea, "Модель для прогноза")
+        gui.spin(inference_box, self, "fast_model_tolerance", 0, 100, 1,
+                 label="Быстрая модель в пределах, % от лучшей оценки:")
+        gui.comboBox(inference_box, self, "inference_mode",
+                     items=[label for _, label in self.INFERENCE_MODES],
+                     label="Прогнозировать:")
+        gui.spin(inference_box, self, "ensemble_weight_threshold", 0, 100, 1,
+                 label="Урезанный ансамбль: вес члена от, %:")
+        gui.lineEdit(inference_box, self, "inference_model", label="Выбранная модель:")
+        self.refit_full_checkbox = QCheckBox("Дообучить на всех данных (refit_full)")
+        self.refit_full_checkbox.setChecked(self.refit_full)
+        self.refit_full_checkbox.stateChanged.connect(self.on_refit_full_changed)
+        inference_box.layout().addWidget(self.refit_full_checkbox)
+        self.evaluate_checkbox = QCheckBox("Оценка на последних точках рядов (без них в обучении)")
+        self.evaluate_checkbox.setChecked(self.evaluate_mode)
+        self.evaluate_checkbox.stateChanged.connect(self.on_evaluate_mode_changed)
+        inference_box.layout().addWidget(self.evaluate_checkbox)
+        self.backtest_spin = gui.spin(inference_box, self, "backtest_windows", 1, 100, 1,
+                                      label="Окон бэктеста:")
+        self.backtest_step_spin = gui.spin(inference_box, self, "backtest_step", 0, 10000, 1,
+                                           label="Шаг окон (0 = длина прогноза):")
+        self.backtest_spin.setEnabled(self.evaluate_mode)
+        self.backtest_step_spin.setEnabled(self.evaluate_mode)
+
+        # Сохранение и загрузка обученной модели
+        model_box = gui.widgetBox(self.controlArea, "Модель")
+        self.persist_checkbox = QCheckBox("Держать модели в памяти")
+        self.persist_checkbox.setChecked(self.persist_models)
+        self.persist_checkbox.stateChanged.connect(self.on_persist_changed)
+        model_box.layout().addWidget(self.persist_checkbox)
+        gui.button(model_box, self, "Сохранить модель...", callback=self.save_model)
+        gui.button(model_box, self, "Загрузить модель...", callback=self.load_model)
+        self.predict_button = gui.button(model_box, self, "Прогноз без обучения", callback=self.predict_with_model)
+        self.predict_button.setEnabled(False)
+        self.model_status_label = QLabel("Модель не обучена")
+        self.model_status_label.setWordWrap(True)
+        model_box.layout().addWidget(self.model_status_label)
+        for name in self.REFIT_SETTINGS + self.PREDICT_SETTINGS + ["target_column", "id_column", "timestamp_column"]:
+            self.connect_control(name, lambda _: self.update_model_status())
+        # Минимальная длина ряда зависит от окон бэктеста и резервных методов
+        for name in ["evaluate_mode", "backtest_windows", "backtest_step", "fallback_tier"]:
+            self.connect_control(name, lambda _: self.check_prediction_length())
+
         # кнопка
         self.run_button = gui.button(self.controlArea, self, "Запустить", callback=self.run_model)
+        self.auto_apply_checkbox = QCheckBox("Автозапуск при изменении данных")
+        self.auto_apply_checkbox.setChecked(self.auto_apply)
+        self.auto_apply_checkbox.stateChanged.connect(self.on_auto_apply_changed)
+        self.controlArea.layout().addWidget(self.auto_apply_checkbox)
 
         # логи
         log_box_main = gui.widgetBox(self.controlArea, "Логи", addSpace=True)
@@ -195,10 +697,36 @@ class OWAutoGluonTimeSeries(OWWidget):
         self.log_widget.setFont(font)
         log_box_main.layout().addWidget(self.log_widget)
 
+        # График истории и прогноза выбранного ряда
+        plot_box = gui.widgetBox(self.mainArea, "Прогноз")
+        self.plot_item_combo = QComboBox()
+        self.plot_item_combo.setEditable(True)
+        self.plot_item_combo.setInsertPolicy(QComboBox.NoInsert)
+        self.plot_item_combo.currentIndexChanged.connect(lambda _: self.plot_timer.start())
+        plot_box.layout().addWidget(self.plot_item_combo)
+        self.plot_figure = Figure(figsize=(6, 4), tight_layout=True)
+        self.plot_axes = self.plot_figure.add_subplot(111)
+        self.plot_canvas = FigureCanvas(self.plot_figure)
+        plot_box.layout().addWidget(self.plot_canvas)
+
     def on_target_column_changed(self):
         self.log(f"Пользователь выбрал целевую колонку: {self.target_column}")
+    def on_multi_target_changed(self, state):
+        self.multi_target = state > 0
+        self.extra_targets_list.setEnabled(self.multi_target)
+    def on_extra_targets_changed(self):
+        self.extra_target_columns = [item.text() for item in self.extra_targets_list.selectedItems()]
+    def on_hierarchical_changed(self, state):
+        self.hierarchical = state > 0
+        self.hierarchy_list.setEnabled(self.hierarchical)
+        self.reconciliation_combo.setEnabled(self.hierarchical)
+    def on_hierarchy_columns_changed(self):
+        self.hierarchy_columns = [item.text() for item in self.hierarchy_list.selectedItems()]
     def on_id_column_changed(self):
         self.log(f"Пользователь выбрал ID колонку: {self.id_column}")
+        self.ensure_id_codes()
+        self.update_series_lengths()
+        self.check_prediction_length()
     def on_timestamp_column_changed(self):
         self.log(f"Пользователь выбрал временную колонку: {self.timestamp_column}")
 
@@ -206,6 +734,45 @@ class OWAutoGluonTimeSeries(OWWidget):
         self.include_holidays = state > 0
         self.holiday_country_combo.setEnabled(self.include_holidays) # Включаем/отключаем выбор страны
 
+    def on_regularize_changed(self, state):
+        self.regularize_series = state > 0
+        self.fill_combo.setEnabled(self.regularize_series)
+
+    def on_fallback_tier_changed(self, state):
+        self.fallback_tier = state > 0
+        self.cold_start_spin.setEnabled(self.fallback_tier)
+        self.sparse_spin.setEnabled(self.fallback_tier)
+
+    def on_quality_filter_changed(self, state):
+        self.quality_filter = state > 0
+        self.missing_spin.setEnabled(self.quality_filter)
+
+    def on_auto_budget_changed(self, state):
+        self.auto_budget = state > 0
+        self.wall_time_spin.setEnabled(self.auto_budget)
+
+    def on_refit_full_changed(self, state):
+        self.refit_full = state > 0
+
+    def on_evaluate_mode_changed(self, state):
+        self.evaluate_mode = state > 0
+        self.backtest_spin.setEnabled(self.evaluate_mode)
+        self.backtest_step_spin.setEnabled(self.evaluate_mode)
+
+    def on_auto_apply_changed(self, state):
+        self.auto_apply = state > 0
+        if self.auto_apply and self.data is not None:
+            self.apply_timer.start()
+
+    def on_persist_changed(self, state):
+        self.persist_models = state > 0
+        if self.persist_models and self.trained:
+            self.persist_predictors()
+
+    def on_sample_training_changed(self, state):
+        self.sample_training = state > 0
+        self.sample_spin.setEnabled(self.sample_training)
+
     def on_date_option_changed(self, state):
         self.use_current_date = state > 0
         
@@ -266,44 +833,111 @@ class OWAutoGluonTimeSeries(OWWidget):
             self.log(f"Ошибка при определении частоты: {str(e)}")
             return "D"  # По умолчанию день
 
-    def check_prediction_length(self):
-        """Проверяет длину прогноза и обновляет интерфейс"""
-        if self.data_length == 0:
+    def ensure_id_codes(self):
+        """Дискретная ID колонка, выбранная после загрузки, хранит float-коды - приводим к целым кодам"""
+        if self.data is None or self.id_column not in self.data.columns:
             return
-            
-        # Корректируем формулу расчета максимальной длины прогноза
-        # Предыдущая формула: max(1, (self.data_length - 3) // 2)
-        # Новая формула: более либеральная для данных средней длины
-        
-        if self.data_length <= 10:
-            # Для очень коротких временных рядов очень строгое ограничение
-            self.max_allowed_prediction = max(1, self.data_length // 3)
-        elif self.data_length <= 30:
-            # Для средних временных рядов - более либеральное ограничение
-            # Для 21 строки: (21 - 1) // 2 = 10
-            self.max_allowed_prediction = max(1, (self.data_length - 1) // 2)
+        column = self.data[self.id_column]
+        if self.id_column in self.categorical_mapping and pd.api.types.is_float_dtype(column):
+            self.data = self.data[column.notna()].copy()
+            self.data[self.id_column] = self.data[self.id_column].astype(np.int64)
+            self.log(f"ID '{self.id_column}' приведен к кодам категорий "
+                     f"({len(self.categorical_mapping[self.id_column])} значений)")
+
+    def update_series_lengths(self):
+        """Длины рядов входных данных одним groupby по колонке ID"""
+        if self.data is None:
+            self.series_lengths = None
+        elif self.id_column in self.data.columns:
+            self.series_lengths = self.data.groupby(self.id_column, sort=False, observed=True).size().to_numpy()
         else:
-            # Для длинных временных рядов - стандартное ограничение
-            self.max_allowed_prediction = max(1, (self.data_length - 3) // 2)
-            
-        self.max_length_label.setText(f"Максимальная длина прогноза: {self.max_allowed_prediction}")
-        
-        # Проверка текущего значения
-        if self.prediction_length > self.max_allowed_prediction:
-            self.warning(f"Длина прогноза слишком велика для ваших данных. Максимум: {self.max_allowed_prediction}")
-            # Визуальное предупреждение
+            self.series_lengths = np.array([len(self.data)])
+
+    def check_prediction_length(self):
+        """Проверяет длину прогноза по длинам отдельных рядов и обновляет интерфейс.
+
+        Минимальная длина ряда учитывает окна валидации и, в режиме оценки, отложенные окна бэктеста.
+        """
+        if self.data_length == 0 or self.series_lengths is None or not len(self.series_lengths):
+            return
+        lengths = self.series_lengths
+        # Допустимая длина прогноза каждого ряда: наибольшая h, для которой ряд не короче минимума
+        horizons = np.arange(1, int(lengths.max()) + 1)
+        allowed = np.searchsorted(self.min_series_length(horizons), lengths, side="right")
+        self.max_allowed_prediction = int(allowed.max())
+        min_length = self.min_series_length()
+        n_short = int((lengths < min_length).sum())
+
+        self.max_length_label.setText(
+            f"Максимальная длина прогноза: {self.max_allowed_prediction}\n"
+            f"Рядов: {len(lengths)}, длина мин/медиана/макс: {lengths.min()}/{np.median(lengths):.0f}/{lengths.max()}\n"
+            f"Короче минимума ({min_length} точек): {n_short}")
+
+        if n_short == len(lengths) and not self.fallback_tier:
+            # Ни один ряд не пригоден для моделей, а резервные методы отключены - обучение завершится ошибкой
+            self.warning(f"Длина прогноза слишком велика для ваших данных: все ряды короче {min_length} точек. "
+                         f"Максимум: {self.max_allowed_prediction}")
             self.max_length_label.setStyleSheet("color: red; font-weight: bold")
-            # Отключаем кнопку запуска, если прогноз слишком длинный
             self.run_button.setDisabled(True)
         else:
-            self.warning("")
+            if n_short:
+                self.warning(f"{n_short} из {len(lengths)} рядов короче {min_length} точек "
+                             f"и будут спрогнозированы резервными методами")
+            else:
+                self.warning("")
             self.max_length_label.setStyleSheet("")
             self.run_button.setDisabled(False)
 
+    def get_resource_budget(self):
+        """Возвращает бюджет ресурсов: (число ядер, потоков на модель)"""
+        available = os.cpu_count() or 1
+        cpus = available if self.num_cpus <= 0 else min(self.num_cpus, available)
+        threads = cpus if self.threads_per_model <= 0 else min(self.threads_per_model, cpus)
+        return cpus, threads
+
+    def apply_resource_limits(self):
+        """Ограничивает потоки torch/OpenMP/MKL для процесса обучения"""
+        cpus, threads = self.get_resource_budget()
+        for var in self.THREAD_ENV_VARS:
+            os.environ[var] = str(threads)
+        try:
+            import torch
+            torch.set_num_threads(threads)
+        except Exception as e:
+            self.log(f"Не удалось ограничить потоки torch: {str(e)}")
+        self.log(f"Бюджет ресурсов: {cpus} CPU, {threads} потоков на модель")
+        return cpus, threads
+
+    def resource_hyperparameters(self, cpus, threads, preset):
+        """Гиперпараметры набора моделей пресета с ограничением CPU (None - без ограничений).
+
+        Явные hyperparameters заменяют набор моделей пресета, поэтому берется набор того же пресета.
+        """
+        if self.num_cpus <= 0 and self.threads_per_model <= 0:
+            return None
+        try:
+            from autogluon.timeseries.models.presets import get_default_hps
+            hyperparameters = copy.deepcopy(get_default_hps(self.PRESET_HYPERPARAMETERS.get(preset, "default")))
+        except Exception as e:
+            self.log(f"Не удалось получить гиперпараметры по умолчанию: {str(e)}")
+            return None
+
+        for model_name, params in hyperparameters.items():
+            for model_params in (params if isinstance(params, list) else [params]):
+                if model_name in self.LOCAL_MODELS:
+                    model_params.setdefault("n_jobs", cpus)
+                elif model_name in self.TABULAR_MODELS:
+                    model_params.setdefault("tabular_hyperparameters",
+                                            {"GBM": {"ag_args_fit": {"num_cpus": threads}}})
+        return hyperparameters
+
     def log(self, message):
-        """Надежное логирование"""
+        """Надежное логирование (из рабочих потоков - только в журнал, без обращения к интерфейсу)"""
         log_entry = f"{datetime.now().strftime('%H:%M:%S')} - {message}"
         self.log_messages += log_entry + "\n"
+        if QThread.currentThread() is not self.thread():
+            logger.info(log_entry)
+            return
         self.log_widget.appendPlainText(log_entry)
         self.log_widget.verticalScrollBar().setValue(
             self.log_widget.verticalScrollBar().maximum()
@@ -312,11 +946,59 @@ class OWAutoGluonTimeSeries(OWWidget):
 
     @Inputs.data
     def set_data(self, dataset):
+        """Прием входа: очередь во время расчета, пропуск неизменных таблиц, отложенный автозапуск"""
+        if self.running:
+            # Во время расчета запоминаем только последний вход, он будет обработан после завершения
+            self.pending_input = (dataset,)
+            self.log("Идет расчет: новые входные данные будут обработаны после его завершения")
+            return
+        fingerprint = table_fingerprint(dataset, self.id_column, self.timestamp_column) \
+            if dataset is not None else None
+        previous = self.input_fingerprint
+        change = classify_table_change(previous, dataset, fingerprint) if fingerprint is not None else "new"
+        if change == "unchanged" and self.data is not None:
+            self.log("Входные данные не изменились")
+        else:
+            self.load_input(dataset)
+            self.input_fingerprint = fingerprint if self.data is not None else None
+            self.input_change = change
+            if change == "append":
+                added = fingerprint["rows"] - previous["rows"]
+                self.log(f"Входные данные дополнены: +{added} строк в конце таблицы")
+            elif change == "modified":
+                self.log("Входные данные изменены")
+        if self.auto_apply and self.data is not None:
+            self.apply_timer.start()
+
+    @Inputs.holdout
+    def set_holdout(self, dataset):
+        """Отложенная выборка: лидерборд оценивает модели и время прогноза на ней"""
+        self.holdout_table = dataset
+        if dataset is not None:
+            self.log(f"Получена отложенная выборка: {len(dataset)} строк")
+
+    def run_state(self):
+        """Отпечаток входа и всех настроек, влияющих на результат"""
+        return (self.data_hash(), self.id_column, self.timestamp_column, self.target_column,
+                tuple(repr(getattr(self, name)) for name in self.REFIT_SETTINGS + self.PREDICT_SETTINGS))
+
+    def auto_run(self):
+        """Автозапуск по таймеру: пропускается, если результат для текущего входа уже актуален"""
+        if self.data is None or self.running:
+            return
+        if self.applied_state == self.run_state():
+            self.log("Результат для текущих данных и настроек актуален, автозапуск пропущен")
+            return
+        self.run_model()
+
+    def load_input(self, dataset):
         self.error("")
         self.warning("")
+        self.Warning.timestamp_failures.clear()
         try:
             if dataset is None:
                 self.data = None
+                self.ts_cache = None
                 self.log("Данные очищены")
                 self.data_length = 0
                 self.max_length_label.setText("Максимальная длина прогноза: N/A")
@@ -518,14 +1200,10 @@ class OWAutoGluonTimeSeries(OWWidget):
                     # 3. Пытаемся распарсить
                     for col in self.all_columns:
                         if col not in [self.target_column, self.id_column] and col in temp_df_for_types.columns:
-                            try:
-                                parsed_sample = pd.to_datetime(temp_df_for_types[col].dropna().iloc[:5], errors='coerce')
-                                if not parsed_sample.isna().all():
-                                    potential_ts = col
-                                    self.log(f"Найдена подходящая по типу временная колонка: '{potential_ts}' (можно преобразовать в дату)")
-                                    break
-                            except Exception:
-                                continue
+                            if self.infer_timestamp_parser(temp_df_for_types[col]) is not None:
+                                potential_ts = col
+                                self.log(f"Найдена подходящая по типу временная колонка: '{potential_ts}' (можно преобразовать в дату)")
+                                break
                 self.timestamp_column = potential_ts if potential_ts else (next((c for c in self.all_columns if c not in [self.target_column, self.id_column]), self.all_columns[0] if self.all_columns else ""))
                 self.log(f"Автоматически выбран временной столбец: '{self.timestamp_column}'")
             
@@ -545,6 +1223,31 @@ class OWAutoGluonTimeSeries(OWWidget):
             self.target_combo.setCurrentText(self.target_column)
             self.id_combo.setCurrentText(self.id_column)
             self.timestamp_combo.setCurrentText(self.timestamp_column)
+
+            # Кандидаты в дополнительные цели - числовые колонки
+            selected_extra = list(self.extra_target_columns)
+            self.extra_targets_list.blockSignals(True)
+            self.extra_targets_list.clear()
+            for col in self.all_columns:
+                if col in self.data.columns and pd.api.types.is_numeric_dtype(self.data[col]) \
+                        and col not in [self.id_column, self.timestamp_column]:
+                    self.extra_targets_list.addItem(col)
+                    if col in selected_extra:
+                        self.extra_targets_list.item(self.extra_targets_list.count() - 1).setSelected(True)
+            self.extra_targets_list.blockSignals(False)
+            self.extra_target_columns = [col for col in selected_extra if col in self.data.columns]
+
+            # Кандидаты в уровни иерархии - все колонки, кроме цели, ID и времени
+            selected_levels = list(self.hierarchy_columns)
+            self.hierarchy_list.blockSignals(True)
+            self.hierarchy_list.clear()
+            for col in self.all_columns:
+                if col in self.data.columns and col not in [self.target_column, self.id_column, self.timestamp_column]:
+                    self.hierarchy_list.addItem(col)
+                    if col in selected_levels:
+                        self.hierarchy_list.item(self.hierarchy_list.count() - 1).setSelected(True)
+            self.hierarchy_list.blockSignals(False)
+            self.hierarchy_columns = [col for col in selected_levels if col in self.data.columns]
             
             # Логируем финальный выбор колонок после автоопределения (если оно было) и установки в UI
             self.log(f"Автоопределены колонки — Target: {self.target_column}, ID: {self.id_column}, Timestamp: {self.timestamp_column}")
@@ -563,7 +1266,8 @@ class OWAutoGluonTimeSeries(OWWidget):
                 self.detected_frequency = self.detect_frequency(self.data)
                 self.detected_freq_label.setText(f"Определенная частота: {self.detected_frequency}")
             
-            # Обновляем максимальную длину прогноза
+            # Обновляем максимальную длину прогноза по длинам рядов
+            self.update_series_lengths()
             self.check_prediction_length()
             
             # Если нужно заменить даты на текущую
@@ -595,8 +1299,8 @@ class OWAutoGluonTimeSeries(OWWidget):
             self.data_length = 0
             self.max_length_label.setText("Максимальная длина прогноза: N/A")
 
-    def prepare_data(self, table, for_type_check_only=False):
-        """Подготовка данных"""
+    def prepare_data(self, table, for_type_check_only=False, holdout=False):
+        """Подготовка данных. Отложенная выборка (holdout) не меняет кэш и предупреждения основных данных"""
         self.log(f"prepare_data вызвана: for_type_check_only={for_type_check_only}")
         
         if table is None:
@@ -628,231 +1332,29 @@ class OWAutoGluonTimeSeries(OWWidget):
             self.log("Возвращаем данные для проверки типов")
             return df
 
-        # ПРИНУДИТЕЛЬНАЯ ЗАЩИТА ОТ СОЗДАНИЯ ИСКУССТВЕННЫХ ДАТ
-        self.log("🔒 ПРИНУДИТЕЛЬНАЯ ПРОВЕРКА: НЕ СОЗДАЕМ ИСКУССТВЕННЫЕ ДАТЫ для корректных данных!")
-
-        # Если это реальные данные (не для проверки типов), проверяем корректность дат
+        # Временная колонка: единый разбор с выводом формата по выборке и кэшированием
         if self.timestamp_column and self.timestamp_column in df.columns:
-            
-            # Преобразуем в datetime если нужно
-            if not pd.api.types.is_datetime64_dtype(df[self.timestamp_column]):
-                try:
-                    df[self.timestamp_column] = pd.to_datetime(df[self.timestamp_column])
-                    self.log("✅ Временная колонка преобразована в datetime")
-                except:
-                    self.log("❌ Не удалось преобразовать временную колонку")
-            
-            # Проверяем корректность дат
-            if pd.api.types.is_datetime64_dtype(df[self.timestamp_column]):
-                min_year = df[self.timestamp_column].dt.year.min()
-                max_year = df[self.timestamp_column].dt.year.max()
-                date_range = df[self.timestamp_column].max() - df[self.timestamp_column].min()
-                
-                self.log(f"📊 Анализ дат: годы {min_year}-{max_year}, диапазон {date_range.days} дней")
-                
-                # Если данные корректны - НЕ ТРОГАЕМ их!
-                if (2020 <= min_year <= max_year <= 2030) and (date_range > pd.Timedelta(days=30)):
-                    self.log("✅ ДАННЫЕ КОРРЕКТНЫ - ПРОПУСКАЕМ ВСЮ ОБРАБОТКУ ДАТ!")
-                    
-                    # Обрабатываем только остальные колонки
-                    if self.target_column and self.target_column in df.columns:
-                        df[self.target_column] = pd.to_numeric(df[self.target_column], errors="coerce")
-                        self.log(f"Target колонка обработана: {df[self.target_column].dtype}")
-
-                    if self.id_column and self.id_column in df.columns:
-                        df[self.id_column] = df[self.id_column].astype(str)
-                        self.log(f"ID колонка обработана: {df[self.id_column].dtype}")
-                    
-                    # ПРИНУДИТЕЛЬНО показываем реальные даты по странам
-                    if self.id_column in df.columns:
-                        self.log("📈 РЕАЛЬНЫЕ ДАТЫ ПО СТРАНАМ:")
-                        for country in df[self.id_column].unique():
-                            country_data = df[df[self.id_column] == country]
-                            if len(country_data) > 0:
-                                country_sorted = country_data.sort_values(self.timestamp_column)
-                                first_date = country_sorted[self.timestamp_column].iloc[0]
-                                last_date = country_sorted[self.timestamp_column].iloc[-1]
-                                self.log(f"  {country}: {len(country_data)} записей, {first_date.date()} - {last_date.date()}")
-                    
-                    # Удаляем пустые строки и возвращаем
-                    cols_to_check_na = [col for col in [self.timestamp_column, self.target_column, self.id_column] if col and col in df.columns]
-                    result = df.dropna(subset=cols_to_check_na) if cols_to_check_na else df
-                    
-                    self.log(f"🎯 ВОЗВРАЩАЕМ {len(result)} КОРРЕКТНЫХ ЗАПИСЕЙ С РЕАЛЬНЫМИ ДАТАМИ")
-                    return result
-
-        # Если дошли сюда - данные требуют обработки
-        self.log("⚠️ Данные требуют дополнительной обработки...")
-
-        # ЗДЕСЬ продолжается остальная логика prepare_data...
-
-        self.log(f"Начинаем полную обработку данных. timestamp_column = '{self.timestamp_column}'")
-
-        # --- ПРИНУДИТЕЛЬНАЯ РАННЯЯ ПРОВЕРКА ---
-        if self.timestamp_column and self.timestamp_column in df.columns:
-            self.log(f"Колонка {self.timestamp_column} найдена, начинаем проверку корректности")
-            
-            # Проверяем, является ли это TimeVariable
-            is_datetime_var = any(var.name == self.timestamp_column and isinstance(var, TimeVariable) for var in domain.variables + domain.metas)
-            self.log(f"TimeVariable обнаружена: {is_datetime_var}")
-            
-            if is_datetime_var:
-                self.log(f"Тип данных колонки {self.timestamp_column}: {df[self.timestamp_column].dtype}")
-                
-                if pd.api.types.is_datetime64_dtype(df[self.timestamp_column]):
-                    min_date = df[self.timestamp_column].min()
-                    max_date = df[self.timestamp_column].max()
-                    min_year = df[self.timestamp_column].dt.year.min()
-                    max_year = df[self.timestamp_column].dt.year.max()
-                    date_range = max_date - min_date
-                    
-                    self.log(f"ДИАГНОСТИКА TimeVariable:")
-                    self.log(f"  Мин. дата: {min_date}")
-                    self.log(f"  Макс. дата: {max_date}")
-                    self.log(f"  Годы: {min_year}-{max_year}")
-                    self.log(f"  Диапазон: {date_range.days} дней")
-                    
-                    # Условие: разумные годы И большой диапазон
-                    years_ok = 2020 <= min_year <= max_year <= 2030
-                    range_ok = date_range > pd.Timedelta(days=30)
-                    
-                    self.log(f"  Годы OK: {years_ok}")
-                    self.log(f"  Диапазон OK: {range_ok}")
-                    
-                    if years_ok and range_ok:
-                        self.log("НАЙДЕНЫ КОРРЕКТНЫЕ ДАННЫЕ! Пропускаем все преобразования.")
-                        
-                        # Быстрая обработка остальных колонок
-                        if self.target_column and self.target_column in df.columns:
-                            df[self.target_column] = pd.to_numeric(df[self.target_column], errors="coerce")
-                            self.log(f"Target колонка обработана: {df[self.target_column].dtype}")
-
-                        if self.id_column and self.id_column in df.columns:
-                            df[self.id_column] = df[self.id_column].astype(str)
-                            self.log(f"ID колонка обработана: {df[self.id_column].dtype}")
-                        
-                        # Показываем образец реальных дат по странам
-                        if self.id_column in df.columns:
-                            for country in df[self.id_column].unique():
-                                country_data = df[df[self.id_column] == country]
-                                country_last_date = country_data[self.timestamp_column].max()
-                                self.log(f"Реальная последняя дата для {country}: {country_last_date}")
-                        
-                        # Финальная очистка
-                        cols_to_check_na = [col for col in [self.timestamp_column, self.target_column, self.id_column] if col and col in df.columns]
-                        result = df.dropna(subset=cols_to_check_na) if cols_to_check_na else df
-                        
-                        self.log(f"Возвращаем {len(result)} корректных записей БЕЗ искусственных дат")
-                        return result
-                    else:
-                        self.log("Данные требуют преобразования, продолжаем стандартную обработку")
-                else:
-                    self.log("TimeVariable не содержит datetime, продолжаем стандартную обработку")
-            else:
-                self.log("Не TimeVariable, продолжаем стандартную обработку")
+            is_time_variable = isinstance(domain[self.timestamp_column], TimeVariable)
+            try:
+                df[self.timestamp_column] = self.parse_timestamps(df[self.timestamp_column], self.timestamp_column,
+                                                                  is_time_variable, holdout)
+            except ValueError as e:
+                # Колонку можно сменить в интерфейсе, разбор повторится при запуске
+                self.log(str(e))
+                if not holdout:
+                    self.warning(str(e))
+                return df
         else:
             self.log(f"Колонка {self.timestamp_column} не найдена в данных")
 
-        
-        # --- ИСПРАВЛЕННАЯ обработка временной колонки ---
-        if self.timestamp_column and self.timestamp_column in df.columns:
-            try:
-                self.log(f"Обработка временной колонки '{self.timestamp_column}'")
-                
-                # Проверяем, является ли это TimeVariable
-                is_datetime_var = any(var.name == self.timestamp_column and isinstance(var, TimeVariable) for var in domain.variables + domain.metas)
-                self.log(f"TimeVariable обнаружена: {is_datetime_var}")
-                
-                # Получаем исходные значения
-                original_values = df[self.timestamp_column].copy()
-                self.log(f"Исходный тип данных: {original_values.dtype}")
-                
-                # КРИТИЧЕСКОЕ ИСПРАВЛЕНИЕ: НЕ СОЗДАЕМ ИСКУССТВЕННЫЕ ДАТЫ для корректных данных!
-                if pd.api.types.is_datetime64_dtype(df[self.timestamp_column]):
-                    min_year = df[self.timestamp_column].dt.year.min()
-                    max_year = df[self.timestamp_column].dt.year.max()
-                    date_range = df[self.timestamp_column].max() - df[self.timestamp_column].min()
-                    
-                    self.log(f"Данные уже в формате datetime. Диапазон лет: {min_year}-{max_year}, дней: {date_range.days}")
-                    
-                    # Если годы разумные И диапазон больше месяца - НЕ ТРОГАЕМ данные!
-                    if (2020 <= min_year <= max_year <= 2030) and (date_range > pd.Timedelta(days=30)):
-                        self.log("✅ Данные корректны, оставляем как есть")
-                        # НЕ вызываем create_reasonable_dates!
-                    else:
-                        self.log("⚠️ Данные требуют исправления")
-                        df = self.create_reasonable_dates(df)
-                else:
-                    # Если данные не datetime - пытаемся преобразовать
-                    if pd.api.types.is_object_dtype(original_values) or pd.api.types.is_string_dtype(original_values):
-                        self.log("Попытка преобразования строковых дат...")
-                        try:
-                            df[self.timestamp_column] = pd.to_datetime(original_values, errors='raise')
-                            self.log("✅ Строковые даты успешно преобразованы")
-                            
-                            # Проверяем результат
-                            min_year = df[self.timestamp_column].dt.year.min()
-                            max_year = df[self.timestamp_column].dt.year.max()
-                            date_range = df[self.timestamp_column].max() - df[self.timestamp_column].min()
-                            
-                            if (2020 <= min_year <= max_year <= 2030) and (date_range > pd.Timedelta(days=30)):
-                                self.log("✅ Преобразованные данные корректны")
-                            else:
-                                self.log("⚠️ Преобразованные данные требуют исправления")
-                                df = self.create_reasonable_dates(df)
-                        except:
-                            self.log("❌ Ошибка преобразования строк, создание искусственных дат")
-                            df = self.create_reasonable_dates(df)
-                            
-                    elif pd.api.types.is_numeric_dtype(original_values):
-                        self.log("Обработка числовых дат...")
-                        min_val = original_values.min()
-                        max_val = original_values.max()
-                        
-                        try:
-                            if 1000000000 <= min_val <= 3000000000:  # Секунды
-                                df[self.timestamp_column] = pd.to_datetime(original_values, unit='s')
-                                self.log("✅ Числовые даты преобразованы из секунд")
-                            elif 1000000000000 <= min_val <= 3000000000000:  # Миллисекунды
-                                df[self.timestamp_column] = pd.to_datetime(original_values, unit='ms')
-                                self.log("✅ Числовые даты преобразованы из миллисекунд")
-                            else:
-                                self.log("❌ Неопознанный формат числовых дат")
-                                df = self.create_reasonable_dates(df)
-                        except:
-                            self.log("❌ Ошибка преобразования числовых дат")
-                            df = self.create_reasonable_dates(df)
-                    else:
-                        self.log("❌ Неопознанный тип временной колонки")
-                        df = self.create_reasonable_dates(df)
-                        
-                # Финальная проверка результата
-                if pd.api.types.is_datetime64_dtype(df[self.timestamp_column]):
-                    min_year = df[self.timestamp_column].dt.year.min()
-                    max_year = df[self.timestamp_column].dt.year.max()
-                    self.log(f"Итоговый диапазон лет: {min_year}-{max_year}")
-                    
-                    # Если результат все еще неразумный - принудительно исправляем
-                    if min_year < 1990 or max_year > 2050:
-                        self.log("❌ Финальная коррекция: создание искусственных дат")
-                        df = self.create_reasonable_dates(df)
-                else:
-                    self.log("❌ Финальная коррекция: данные не в формате datetime")
-                    df = self.create_reasonable_dates(df)
-                        
-                self.log(f"Финальный тип временной колонки: {df[self.timestamp_column].dtype}")
-                self.log(f"Финальные даты: {df[self.timestamp_column].min()} - {df[self.timestamp_column].max()}")
-                        
-            except Exception as e:
-                self.log(f"❌ Критическая ошибка при обработке временной колонки: {str(e)}")
-                df = self.create_reasonable_dates(df)
-
         # Обработка остальных колонок
         if self.target_column and self.target_column in df.columns:
             df[self.target_column] = pd.to_numeric(df[self.target_column], errors="coerce")
             self.log(f"Тип данных '{self.target_column}' после преобразования в числовой: {df[self.target_column].dtype}")
 
-        if self.id_column and self.id_column in df.columns:
+        # Дискретный ID остается целым кодом категории, метки подставляются только в выходной таблице
+        id_is_discrete = self.id_column in self.categorical_mapping
+        if self.id_column and self.id_column in df.columns and not id_is_discrete:
             df[self.id_column] = df[self.id_column].astype(str)
             self.log(f"Тип данных '{self.id_column}' после преобразования в строку: {df[self.id_column].dtype}")
         
@@ -863,40 +1365,110 @@ class OWAutoGluonTimeSeries(OWWidget):
         if self.target_column and self.target_column in df.columns: cols_to_check_na.append(self.target_column)
         if self.id_column and self.id_column in df.columns: cols_to_check_na.append(self.id_column)
         
-        return df.dropna(subset=cols_to_check_na) if cols_to_check_na else df
+        df = df.dropna(subset=cols_to_check_na) if cols_to_check_na else df
+        if self.id_column and self.id_column in df.columns and id_is_discrete:
+            df[self.id_column] = df[self.id_column].astype(np.int64)
+            self.log(f"ID '{self.id_column}' хранится кодами категорий ({len(self.categorical_mapping[self.id_column])} значений)")
+        return df
 
-    def create_reasonable_dates(self, df):
-        """Создает разумные последовательные даты для каждой категории"""
-        self.log("Создание разумных дат для каждой категории...")
-        
-        # Если есть ID колонка, создаем даты для каждой категории отдельно
-        if self.id_column and self.id_column in df.columns:
-            df_list = []
-            start_date = pd.Timestamp('2023-01-01')
-            
-            for id_val in df[self.id_column].unique():
-                id_data = df[df[self.id_column] == id_val].copy()
-                num_records = len(id_data)
-                
-                # Создаем последовательные даты для этой категории
-                dates = pd.date_range(start=start_date, periods=num_records, freq='D')
-                id_data[self.timestamp_column] = dates
-                
-                df_list.append(id_data)
-                
-                # Следующая категория начинается после окончания предыдущей
-                start_date = dates[-1] + pd.Timedelta(days=1)
-                
-                self.log(f"Категория {id_val}: {num_records} дат от {dates[0].date()} до {dates[-1].date()}")
-            
-            return pd.concat(df_list, ignore_index=True)
+    def infer_timestamp_parser(self, values, is_time_variable=False):
+        """Способ разбора колонки времени по выборке значений.
+
+        Возвращает ("datetime", None), ("unit", единица эпохи), ("format", формат strftime)
+        или None, если колонка не похожа на время.
+        """
+        if pd.api.types.is_datetime64_any_dtype(values):
+            return "datetime", None
+        sample = values.dropna().iloc[:self.TIMESTAMP_SAMPLE_SIZE]
+        if sample.empty:
+            return None
+
+        if pd.api.types.is_numeric_dtype(sample):
+            if is_time_variable:
+                return "unit", "s"  # TimeVariable Orange хранит секунды эпохи
+            numbers = sample.to_numpy(dtype=np.float64)
+            # Целые вида ГГГГММДД
+            if np.all(numbers == np.round(numbers)) and np.all((numbers >= 1e7) & (numbers < 1e8)):
+                as_text = pd.Series(numbers.astype(np.int64).astype(str))
+                if pd.to_datetime(as_text, format="%Y%m%d", errors="coerce").notna().all():
+                    return "format", "%Y%m%d"
+            # Единица эпохи по порядку величины
+            magnitude = np.median(np.abs(numbers))
+            if magnitude < 1e8:
+                return None
+            for unit, limit in (("s", 1e11), ("ms", 1e14), ("us", 1e17)):
+                if magnitude < limit:
+                    return "unit", unit
+            return "unit", "ns"
+
+        # Строки: кандидаты формата из первых значений, проверка на всей выборке
+        sample = sample.astype(str)
+        candidates = []
+        for text in sample.iloc[:self.TIMESTAMP_FORMAT_CANDIDATES]:
+            for dayfirst in (False, True):
+                fmt = guess_datetime_format(text, dayfirst=dayfirst)
+                if fmt and fmt not in candidates:
+                    candidates.append(fmt)
+        best, best_share = None, 0.0
+        for fmt in candidates + ["ISO8601"]:
+            share = pd.to_datetime(sample, format=fmt, errors="coerce").notna().mean()
+            if share > best_share:
+                best, best_share = fmt, share
+            if share == 1.0:
+                break
+        return ("format", best) if best_share >= 0.5 else None
+
+    def parse_timestamps(self, values, column, is_time_variable=False, holdout=False):
+        """Единый разбор колонки времени: один векторный вызов с явным форматом или единицей.
+
+        Результат кэшируется по колонке и хэшу значений. Строки, которые не удалось
+        разобрать, становятся NaT и перечисляются в журнале и в self.timestamp_failures.
+        Отложенная выборка разбирается без кэша, о неразобранных строках сообщает только журнал.
+        """
+        if pd.api.types.is_datetime64_any_dtype(values):
+            return values
+        cached = values_hash = None
+        if not holdout:
+            values_hash = hashlib.blake2b(pd.util.hash_pandas_object(values, index=False).to_numpy().tobytes(),
+                                          digest_size=16).hexdigest()
+            cached = self.timestamp_cache.get(column)
+        if cached is not None and cached[0] == values_hash:
+            self.log(f"Колонка времени '{column}' уже разобрана ({cached[1]}), используем кэш")
+            parsed = pd.Series(cached[2], index=values.index, name=values.name)
         else:
-            # Если нет ID колонки, создаем простую последовательность
-            start_date = pd.Timestamp('2023-01-01')
-            dates = pd.date_range(start=start_date, periods=len(df), freq='D')
-            df[self.timestamp_column] = dates
-            self.log(f"Создана единая последовательность дат от {dates[0].date()} до {dates[-1].date()}")
-            return df
+            parser = self.infer_timestamp_parser(values, is_time_variable)
+            if parser is None:
+                raise ValueError(f"Не удалось определить формат времени в колонке '{column}'")
+            kind, spec = parser
+            if kind == "unit":
+                parsed = pd.to_datetime(pd.to_numeric(values, errors="coerce"), unit=spec, errors="coerce")
+            elif pd.api.types.is_numeric_dtype(values):
+                as_text = values.astype("Int64").astype(str)
+                parsed = pd.to_datetime(as_text, format=spec, errors="coerce")
+            else:
+                parsed = pd.to_datetime(values.astype(str), format=spec, errors="coerce")
+            if getattr(parsed.dt, "tz", None) is not None:
+                parsed = parsed.dt.tz_localize(None)
+            self.log(f"Колонка времени '{column}' разобрана: {kind}={spec}")
+            if not holdout:
+                self.timestamp_cache[column] = (values_hash, f"{kind}={spec}", parsed.to_numpy())
+
+        # Неразобранные строки сообщаются и при разборе из кэша
+        failed = parsed.isna().to_numpy() & values.notna().to_numpy()
+        if holdout:
+            if failed.any():
+                self.log(f"Отложенная выборка: не удалось разобрать время в {int(failed.sum())} строках")
+            return parsed
+        self.timestamp_failures = None
+        self.Warning.timestamp_failures.clear()
+        if failed.any():
+            rows = np.flatnonzero(failed)
+            self.timestamp_failures = pd.DataFrame({"row": rows, "value": values.to_numpy()[rows]})
+            examples = ", ".join(f"{row}: '{value}'" for row, value in
+                                 self.timestamp_failures.head(10).itertuples(index=False))
+            self.log(f"Не удалось разобрать время в {len(rows)} строках (строка: значение): {examples}")
+            self.Warning.timestamp_failures(len(rows), column)
+        return parsed
 
     def create_future_dates(self, periods):
         """Создает будущие даты с учетом нужной частоты"""
@@ -989,53 +1561,1864 @@ class OWAutoGluonTimeSeries(OWWidget):
         self.log(f"Создан диапазон дат для прогноза: с {dates[0]} по {dates[-1]}")
         return dates
 
-    def create_future_dates_for_specific_id(self, last_date):
+    def data_hash(self):
+        """Хэш содержимого входных данных: отпечаток входной таблицы или хэш self.data"""
+        if self.input_fingerprint is not None:
+            return self.input_fingerprint["digest"]
+        data_hash = pd.util.hash_pandas_object(self.data, index=True).values
+        return hashlib.blake2b(data_hash.tobytes(), digest_size=16).hexdigest()
+
+    def get_prep_fingerprint(self):
+        """Отпечаток self.data и настроек, влияющих на подготовку ts_data"""
+        return (
+            self.data_hash(),
+            tuple(self.data.columns),
+            self.id_column,
+            self.timestamp_column,
+            self.target_column,
+            self.detected_frequency if self.auto_frequency else self.frequency,
+            self.include_holidays,
+            self.history_holiday_country() if self.include_holidays else None,
+            self.from_form_timeseries,
+            self.split_strategy,
+            self.split_n_series,
+            self.split_window,
+            self.regularize_series,
+            self.fill_strategy,
+            self.aggregation_method,
+            tuple(self.get_target_columns()),
+            self.hierarchical,
+            tuple(self.hierarchy_columns) if self.hierarchical else (),
+            self.quality_filter,
+            self.max_missing_share if self.quality_filter else None,
+        )
+
+    def split_single_series(self, df_sorted, strategy):
+        """Разбивает единственный ряд на искусственные ряды (векторно, с категориальным ID)"""
+        n = len(df_sorted)
+        min_points = self.MIN_POINTS_PER_SERIES
+        n_series = min(self.split_n_series, n // min_points)
+
+        if strategy == "chunks":
+            if n_series < 2:
+                self.log(f"Недостаточно точек для разбиения на части ({n}). Используем единый временной ряд.")
+                return df_sorted
+            # Равномерно распределяем точки, остаток уходит в последний ряд
+            points_per_series = n // n_series
+            codes = np.minimum(np.arange(n) // points_per_series, n_series - 1)
+            result = df_sorted
+        else:
+            window = self.split_window if self.split_window > 0 else 2 * n // (self.split_n_series + 1)
+            window = min(max(window, min_points), n)
+            n_series = self.split_n_series
+            step = (n - window) // (n_series - 1)
+            if step < 1:
+                self.log(f"Недостаточно точек для {n_series} окон длиной {window}. Используем единый временной ряд.")
+                return df_sorted
+            # Матрица позиций: строка - окно, столбец - смещение внутри окна
+            starts = np.arange(n_series) * step
+            positions = (starts[:, None] + np.arange(window)).ravel()
+            codes = np.repeat(np.arange(n_series), window)
+            result = df_sorted.iloc[positions]
+            self.log(f"Скользящие окна: длина {window}, шаг {step}")
+
+        labels = [f"series_{i + 1}" for i in range(n_series)]
+        result = result.assign(**{self.id_column: pd.Categorical.from_codes(codes, categories=labels)})
+        self.log(f"Создано {n_series} искусственных рядов ({strategy}), всего {len(result)} точек")
+        return result
+
+    def hierarchy_labels(self, col, values):
+        """Человекочитаемые значения колонки уровня (через categorical_mapping для дискретных)"""
+        mapping = self.categorical_mapping.get(col)
+        if mapping and pd.api.types.is_numeric_dtype(values):
+            return [mapping[int(v)] if 0 <= v < len(mapping) else str(v) for v in values]
+        return [str(v) for v in values]
+
+    def build_hierarchy(self, df):
+        """Строит ряды всех уровней иерархии одним групповым суммированием.
+
+        Нижний уровень - исходные ID, выше - ряды "колонка=значение" для каждой колонки
+        уровня и общий ряд __total__. Ковариаты в этом режиме не используются.
         """
-        УНИВЕРСАЛЬНАЯ функция создания будущих дат для конкретного ID
-        Работает с любыми типами дат и частотами
+        id_col, ts_col = self.id_column, self.timestamp_column
+        targets = self.get_target_columns()
+        levels = [col for col in self.hierarchy_columns if col in df.columns and col not in targets]
+        self.log(f"Иерархический режим: уровни {levels}, цели {targets}")
+
+        # Коды рядов каждого уровня в общем пространстве ключей
+        bottom_codes, bottom_ids = pd.factorize(df[id_col])
+        level_codes = [bottom_codes]
+        labels = list(self.hierarchy_labels(id_col, bottom_ids))
+        offset = len(bottom_ids)
+        for col in levels:
+            codes, uniques = pd.factorize(df[col])
+            level_codes.append(np.where(codes >= 0, codes + offset, -1))
+            labels += [f"{col}={label}" for label in self.hierarchy_labels(col, uniques)]
+            offset += len(uniques)
+        level_codes.append(np.full(len(df), offset))
+        labels.append(self.HIERARCHY_TOTAL)
+
+        # Родитель каждого нижнего ряда на каждом уровне (первое встреченное значение)
+        parents = np.empty((len(level_codes) - 1, len(bottom_ids)))
+        for i, codes in enumerate(level_codes[1:]):
+            known = pd.Series(np.where(codes >= 0, codes, np.nan))
+            parents[i] = known.groupby(bottom_codes).first().reindex(range(len(bottom_ids))).to_numpy()
+        self.hierarchy = {"labels": labels, "n_bottom": len(bottom_ids), "parents": parents}
+
+        # Один groupby по длинной таблице всех уровней
+        key = np.concatenate(level_codes)
+        long = pd.DataFrame({"_key": key, ts_col: np.tile(df[ts_col].to_numpy(), len(level_codes))})
+        for target in targets:
+            long[target] = np.tile(df[target].to_numpy(), len(level_codes))
+        long = long[long["_key"] >= 0]
+        result = long.groupby(["_key", ts_col], sort=True)[targets].sum().reset_index()
+        result.insert(0, id_col, pd.Categorical.from_codes(result.pop("_key"), categories=labels))
+
+        dropped = [col for col in df.columns if col not in [id_col, ts_col] + targets]
+        if dropped:
+            self.log(f"Иерархический режим: колонки {dropped} не используются как ковариаты")
+        self.log(f"Иерархия: {len(bottom_ids)} нижних рядов, всего рядов {len(labels)}, строк {len(result)}")
+        return result
+
+    def summing_matrix(self):
+        """Матрица суммирования S (все ряды x нижние ряды)"""
+        n_bottom = self.hierarchy["n_bottom"]
+        parents = self.hierarchy["parents"]
+        S = np.zeros((len(self.hierarchy["labels"]), n_bottom))
+        S[np.arange(n_bottom), np.arange(n_bottom)] = 1
+        bottom = np.tile(np.arange(n_bottom), len(parents))
+        flat = parents.ravel()
+        known = ~np.isnan(flat)
+        S[flat[known].astype(int), bottom[known]] = 1
+        return S
+
+    def reconcile_predictions(self, predictions, ts_data, target):
+        """Согласует прогнозы всех уровней иерархии (bottom-up или MinT с диагональной W)"""
+        method = self.RECONCILIATION_METHODS[self.reconciliation_method][0]
+        if method == "none":
+            return predictions
+
+        labels = self.hierarchy["labels"]
+        n_bottom = self.hierarchy["n_bottom"]
+        position = {label: i for i, label in enumerate(labels)}
+        frame = predictions.reset_index()
+        item_col, time_col = frame.columns[0], frame.columns[1]
+        rows = frame[item_col].astype(str).map(position)
+        steps = frame.groupby(item_col, sort=False).cumcount().to_numpy()
+        horizon = steps.max() + 1 if len(steps) else 0
+        if rows.isna().any() or frame[item_col].nunique() != len(labels):
+            self.log("Согласование пропущено: прогноз есть не для всех рядов иерархии")
+            return predictions
+        rows = rows.to_numpy(dtype=int)
+
+        forecast = np.full((len(labels), horizon), np.nan)
+        forecast[rows, steps] = frame["mean"].to_numpy()
+        if np.isnan(forecast).any():
+            self.log("Согласование пропущено: у рядов разная длина прогноза")
+            return predictions
+
+        S = self.summing_matrix()
+        if method == "mint" and n_bottom > self.MINT_MAX_BOTTOM_SERIES:
+            self.log(f"MinT: {n_bottom} нижних рядов - слишком много для плотной матрицы, используем bottom-up")
+            method = "bottom_up"
+
+        if method == "bottom_up":
+            reconciled = S @ forecast[:n_bottom]
+        else:
+            # Диагональная W: дисперсия остатков наивного прогноза каждого ряда
+            residual_var = ts_data[target].groupby(level=0).diff().groupby(level=0).var()
+            residual_var.index = residual_var.index.astype(str)
+            variances = residual_var.reindex(labels).to_numpy(dtype=float)
+            valid = np.isfinite(variances) & (variances > 0)
+            variances = np.where(valid, variances, variances[valid].mean() if valid.any() else 1.0)
+            weights = 1.0 / variances
+            # P = (S' W^-1 S)^-1 S' W^-1, согласованный прогноз = S P y
+            StW = S.T * weights
+            P = np.linalg.solve(StW @ S, StW)
+            reconciled = S @ (P @ forecast)
+
+        # Сдвигаем среднее и все квантили на величину поправки
+        delta = (reconciled - forecast)[rows, steps]
+        for col in frame.columns:
+            if col not in (item_col, time_col) and pd.api.types.is_numeric_dtype(frame[col]):
+                frame[col] = frame[col] + delta
+        self.log(f"Прогнозы согласованы ({method}), средняя абсолютная поправка: {np.abs(delta).mean():.4f}")
+        return frame.set_index([item_col, time_col])
+
+    def aggregation_spec(self, df, columns):
+        """Агрегация колонок: выбранный метод - только для целей, числовые ковариаты усредняются,
+        остальные берутся из последней строки"""
+        agg = self.AGGREGATION_METHODS[self.aggregation_method][0]
+        targets = set(self.get_target_columns())
+        return {col: agg if col in targets else ("mean" if pd.api.types.is_numeric_dtype(df[col]) else "last")
+                for col in columns}
+
+    def group_aggregate(self, grouped, spec):
+        """grouped.agg(spec), где сумма группы из одних пропусков остается пропуском (sum(min_count=1))"""
+        result = grouped.agg(spec)
+        sum_cols = [col for col, how in spec.items() if how == "sum"]
+        if sum_cols:
+            counts = grouped[sum_cols].count()
+            result[sum_cols] = result[sum_cols].where(counts.to_numpy() > 0)
+        return result
+
+    def aggregate_duplicates(self, df):
+        """Схлопывает строки с одинаковыми (ID, время) выбранной агрегацией одним groupby"""
+        keys = [self.id_column, self.timestamp_column]
+        agg = self.AGGREGATION_METHODS[self.aggregation_method][0]
+        duplicates = int(df.duplicated(subset=keys).sum())
+        self.prep_stats["duplicates_merged"] = duplicates
+        if duplicates == 0:
+            return df
+
+        self.log(f"Обнаружено {duplicates} дублирующихся записей с одинаковыми ID и датой, агрегация: {agg}")
+        agg_spec = self.aggregation_spec(df, [col for col in df.columns if col not in keys])
+        result = self.group_aggregate(df.groupby(keys, sort=False, observed=True), agg_spec).reset_index()
+        self.log(f"Объединено {duplicates} строк: {len(df)} -> {len(result)} записей")
+        return result
+
+    def regularize_frame(self, df, freq):
+        """Приводит каждый ряд к регулярной сетке частоты freq одним векторным проходом.
+
+        Точки одного периода агрегируются, пропущенные периоды заполняются выбранной
+        стратегией. Количество заполненных пропусков по рядам сохраняется в self.gap_report.
         """
+        id_col, ts_col = self.id_column, self.timestamp_column
+        agg = self.AGGREGATION_METHODS[self.aggregation_method][0]
+        fill = self.FILL_STRATEGIES[self.fill_strategy][0]
+        value_cols = [col for col in df.columns
+                      if col not in (id_col, ts_col) and pd.api.types.is_numeric_dtype(df[col])]
+        dropped_cols = [col for col in df.columns if col not in value_cols and col not in (id_col, ts_col)]
+        if dropped_cols:
+            self.log(f"Регуляризация: нечисловые колонки исключены: {dropped_cols}")
+
+        # Номер периода (ordinal) каждой точки и агрегация точек одного периода
+        periods = df[ts_col].dt.to_period(freq).array.asi8
+        frame = df[[id_col] + value_cols].assign(_period=periods)
+        grouped = self.group_aggregate(frame.groupby([id_col, "_period"], sort=True, observed=True),
+                                       self.aggregation_spec(df, value_cols))
+
+        # Ряды идут подряд - границы рядов находим по смене кода ID
+        item_codes, items = pd.factorize(grouped.index.get_level_values(0))
+        item_periods = grouped.index.get_level_values(1).to_numpy()
+        boundaries = np.flatnonzero(np.diff(item_codes)) + 1
+        first = item_periods[np.r_[0, boundaries]]
+        last = item_periods[np.r_[boundaries - 1, len(item_periods) - 1]]
+        lengths = last - first + 1
+        grid_start = np.cumsum(lengths) - lengths
+        total = int(lengths.sum())
+
+        # Полная сетка: для каждого ряда все периоды от первого до последнего
+        grid_items = np.repeat(np.arange(len(items)), lengths)
+        grid_periods = np.repeat(first, lengths) + (np.arange(total) - np.repeat(grid_start, lengths))
+        positions = grid_start[item_codes] + (item_periods - first[item_codes])
+        values = np.full((total, len(value_cols)), np.nan)
+        values[positions] = grouped.to_numpy(dtype=float)
+        observed = np.zeros(total, dtype=bool)
+        observed[positions] = True
+
+        filled = pd.DataFrame(values, columns=value_cols)
+        if fill == "ffill":
+            filled = filled.groupby(grid_items).ffill()
+        elif fill == "zero":
+            # Нулями заполняются только цели (нет продаж); ковариаты держат последнее значение ряда
+            target_cols = [col for col in value_cols if col in self.get_target_columns()]
+            covariate_cols = [col for col in value_cols if col not in target_cols]
+            filled[target_cols] = filled[target_cols].fillna(0)
+            if covariate_cols:
+                filled[covariate_cols] = filled[covariate_cols].groupby(grid_items).ffill()
+        elif fill == "interpolate":
+            # Интерполируем только внутри ряда: значения вне первой/последней точки ряда не трогаем
+            outside = filled.groupby(grid_items).ffill().isna() | filled.groupby(grid_items).bfill().isna()
+            filled = filled.interpolate(limit_area="inside").mask(outside)
+
+        # Периоды с якорем в конце (неделя, месяц, квартал, год) ставим на последний день периода
+        how = "end" if freq in ("W", "M", "Q", "Y") else "start"
+        timestamps = pd.PeriodIndex.from_ordinals(grid_periods, freq=freq).to_timestamp(how=how)
+        if how == "end":
+            timestamps = timestamps.normalize()
+
+        result = filled
+        result.insert(0, ts_col, timestamps)
+        result.insert(0, id_col, items.take(grid_items))
+
+        gaps = np.bincount(grid_items, weights=~observed, minlength=len(items)).astype(int)
+        self.gap_report = pd.Series(gaps, index=items, name="gaps_filled")
+        self.prep_stats["gaps_filled"] = int(gaps.sum())
+        self.log(f"Регуляризация ({freq}, агрегация: {agg}, заполнение: {fill}): "
+                 f"{len(df)} -> {len(result)} строк, пропусков: {gaps.sum()}")
+        if gaps.sum() > 0:
+            worst = self.gap_report.sort_values(ascending=False).head(5)
+            self.log(f"Больше всего пропусков: {worst[worst > 0].to_dict()}")
+        return result
+
+    def profile_series(self, df, target, freq):
+        """Профиль качества рядов одной групповой агрегацией по компактному кадру периодов.
+
+        По каждому ID: число строк, доля пропусков (NaN и пропущенные периоды), доля нулей, число
+        отрицательных значений, наибольший разрыв в периодах, автокорреляция на сезонном лаге и
+        число выбросов (|z| > OUTLIER_Z). Несколько строк одного периода сначала агрегируются
+        выбранным методом, как при регуляризации: доли и лаги считаются по периодам, а не по строкам.
+        """
+        row_codes, items = pd.factorize(df[self.id_column])
+        row_periods = df[self.timestamp_column].dt.to_period(freq).array.asi8
+        order = np.lexsort((row_periods, row_codes))
+        row_codes, row_periods = row_codes[order], row_periods[order]
+        row_values = df[target].to_numpy(dtype=np.float64)[order]
+        # Число строк и отрицательных значений - по строкам: очистка обнуляет именно строки
+        rows = np.bincount(row_codes, minlength=len(items))
+        negatives = np.bincount(row_codes, weights=row_values < 0, minlength=len(items))
+
+        # Один период - одна точка
+        new_period = np.r_[True, (row_codes[1:] != row_codes[:-1]) | (row_periods[1:] != row_periods[:-1])]
+        period_ids = np.cumsum(new_period) - 1
+        codes, periods = row_codes[new_period], row_periods[new_period]
+        period_frame = pd.DataFrame({target: row_values})
+        values = self.group_aggregate(period_frame.groupby(period_ids, sort=True),
+                                      self.aggregation_spec(period_frame, [target]))[target].to_numpy(dtype=np.float64)
+        is_valid = ~np.isnan(values)
+        x = np.where(is_valid, values, 0.0)
+
+        # Сезонная пара: точка и точка того же ряда ровно на m периодов раньше (ищется по номеру
+        # периода, а не по позиции - в рядах с разрывами позиционный лаг не равен m периодам)
+        season = self.season_length(freq)
+        lag = np.zeros_like(x)
+        pair = np.zeros(len(x), dtype=bool)
+        if 1 < season < len(x):
+            offset = periods.min()
+            span = periods.max() - offset + season + 1
+            keys = codes.astype(np.int64) * span + (periods - offset)
+            position = np.searchsorted(keys, keys - season)
+            found = position < len(keys)
+            position = np.minimum(position, len(keys) - 1)
+            found &= keys[position] == keys - season
+            lag = np.where(found, x[position], 0.0)
+            pair = found & is_valid & is_valid[position]
+        same_series = np.r_[False, codes[1:] == codes[:-1]]
+        gap = np.where(same_series, np.r_[0, np.diff(periods)] - 1, 0)
+
+        frame = pd.DataFrame({
+            "valid": is_valid, "zero": is_valid & (values == 0),
+            "gap": gap, "first": periods, "last": periods, "s1": x, "s2": x * x,
+            "pairs": pair, "px": x * pair, "py": lag * pair, "pxx": x * x * pair, "pyy": lag * lag * pair,
+            "pxy": x * lag * pair,
+        })
+        spec = {col: "sum" for col in frame.columns}
+        spec.update(gap="max", first="min", last="max")
+        agg = frame.groupby(codes, sort=True).agg(spec)
+
+        span = (agg["last"] - agg["first"] + 1).to_numpy()
+        valid = agg["valid"].to_numpy()
+        mean = agg["s1"].to_numpy() / np.maximum(valid, 1)
+        std = np.sqrt(np.maximum(agg["s2"].to_numpy() / np.maximum(valid, 1) - mean ** 2, 0))
+        pairs = agg["pairs"].to_numpy()
+        cov = pairs * agg["pxy"].to_numpy() - agg["px"].to_numpy() * agg["py"].to_numpy()
+        var_x = pairs * agg["pxx"].to_numpy() - agg["px"].to_numpy() ** 2
+        var_y = pairs * agg["pyy"].to_numpy() - agg["py"].to_numpy() ** 2
+        with np.errstate(divide="ignore", invalid="ignore"):
+            seasonal_corr = np.where((var_x > 0) & (var_y > 0), cov / np.sqrt(var_x * var_y), np.nan)
+            z = np.abs(x - mean[codes]) / std[codes]
+        outliers = np.bincount(codes, weights=is_valid & (z > self.OUTLIER_Z), minlength=len(items))
+
+        report = pd.DataFrame({
+            self.id_column: items.take(agg.index.to_numpy()),
+            "length": rows[agg.index.to_numpy()],
+            "missing_share": np.clip((span - valid) / span, 0, 1),
+            "zero_share": agg["zero"].to_numpy() / np.maximum(valid, 1),
+            "negatives": negatives[agg.index.to_numpy()].astype(int),
+            "max_gap": agg["gap"].to_numpy(),
+            "season_length": season,
+            "seasonal_corr": seasonal_corr,
+            "seasonal": (seasonal_corr >= self.SEASONALITY_MIN_CORR).astype(int),
+            "outliers": outliers.astype(int),
+            "action": "",
+        })
+        self.log(f"Профиль качества: {len(report)} рядов, с пропусками: {(report['missing_share'] > 0).sum()}, "
+                 f"с отрицательными: {(report['negatives'] > 0).sum()}, сезонных (лаг {season}): "
+                 f"{report['seasonal'].sum()}, выбросов: {report['outliers'].sum()}")
+        return report
+
+    def apply_quality_filter(self, df, target):
+        """Автоматическая очистка по профилю качества.
+
+        Ряды с долей пропусков выше порога исключаются. Редкие отрицательные значения
+        (меньше NEGATIVE_CLIP_SHARE ряда) считаются ошибками и обнуляются; ряды, где
+        отрицательных много, остаются как есть.
+        """
+        report = self.quality_report
+        excluded = report["missing_share"] > self.max_missing_share / 100
+        if excluded.all():
+            self.log("Очистка: все ряды превышают порог пропусков, исключение пропущено")
+            excluded[:] = False
+        clip = ~excluded & (report["negatives"] > 0) & \
+            (report["negatives"] < self.NEGATIVE_CLIP_SHARE * report["length"])
+        report.loc[excluded, "action"] = "excluded"
+        report.loc[clip, "action"] = "negatives_clipped"
+
+        ids = df[self.id_column]
+        if excluded.any():
+            df = df[~ids.isin(report.loc[excluded, self.id_column])]
+            ids = df[self.id_column]
+        if clip.any():
+            df = df.copy()
+            rows = ids.isin(report.loc[clip, self.id_column]).to_numpy() & (df[target] < 0).to_numpy()
+            df.loc[rows, target] = 0
+        self.prep_stats["series_excluded"] = int(excluded.sum())
+        self.prep_stats["negatives_clipped"] = int(report.loc[clip, "negatives"].sum())
+        self.log(f"Очистка: исключено рядов {excluded.sum()} (пропусков > {self.max_missing_share}%), "
+                 f"обнулено отрицательных значений {self.prep_stats['negatives_clipped']} в {clip.sum()} рядах")
+        return df
+
+    def build_ts_data(self):
+        """Подготовка TimeSeriesDataFrame из self.data. Возвращает (ts_data, df_sorted) или None"""
+        self.prep_stats = {}
+        self.gap_report = None
+        self.log("Преобразование в TimeSeriesDataFrame...")
+        df_sorted = self.data.sort_values([self.id_column, self.timestamp_column])
+        
+        # Проверяем, что столбцы имеют правильные типы
+        self.log(f"Типы данных: {df_sorted.dtypes.to_dict()}")
+
+        # Колонка времени уже разобрана при загрузке; повторный разбор берется из кэша
+        if not pd.api.types.is_datetime64_any_dtype(df_sorted[self.timestamp_column]):
+            df_sorted[self.timestamp_column] = self.parse_timestamps(df_sorted[self.timestamp_column],
+                                                                     self.timestamp_column)
+            df_sorted = df_sorted.dropna(subset=[self.timestamp_column])
+            if df_sorted.empty:
+                self.error("Не удалось преобразовать колонку времени")
+                return None
+
+        self.log(f"Финальный формат времени: {df_sorted[self.timestamp_column].dtype}")
+        self.log(f"Диапазон дат: с {df_sorted[self.timestamp_column].min()} по {df_sorted[self.timestamp_column].max()}")
+
+        # Определяем частоту для модели
+        model_freq = self.detected_frequency if self.auto_frequency else self.frequency
+        self.log(f"Используемая частота: {model_freq}")
+
+        # Проверка и конвертация ID колонки
+        self.log(f"Проверка формата ID колонки '{self.id_column}'...")
+        if self.id_column in df_sorted.columns:
+            # Проверяем тип данных
+            if pd.api.types.is_float_dtype(df_sorted[self.id_column]):
+                self.log("ID колонка имеет тип float, конвертирую в строку")
+                try:
+                    # Попытка конвертации в строку
+                    df_sorted[self.id_column] = df_sorted[self.id_column].astype(str)
+                    self.log("Конвертация ID в строку успешна")
+                except Exception as e:
+                    self.log(f"Ошибка конвертации ID в строку: {str(e)}")
+                    # Если не получается, создаем новую ID колонку
+                    self.log("Создание новой ID колонки...")
+                    df_sorted['virtual_id'] = 'item_1'
+                    self.id_column = 'virtual_id'
+        else:
+            self.log(f"ID колонка '{self.id_column}' не найдена, создаю виртуальную")
+            df_sorted['virtual_id'] = 'item_1'
+            self.id_column = 'virtual_id'
+        
+        # Проверяем, что все колонки имеют правильный тип
+        self.log(f"Обеспечиваем правильные типы данных для всех колонок...")
+        # ID колонка должна быть строкой или целым числом
+        if self.id_column in df_sorted.columns:
+            if not (pd.api.types.is_string_dtype(df_sorted[self.id_column]) or 
+                    pd.api.types.is_integer_dtype(df_sorted[self.id_column])):
+                df_sorted[self.id_column] = df_sorted[self.id_column].astype(str)
+        
+        # Целевая колонка должна быть числом
+        if self.target_column in df_sorted.columns:
+            if not pd.api.types.is_numeric_dtype(df_sorted[self.target_column]):
+                try:
+                    df_sorted[self.target_column] = pd.to_numeric(df_sorted[self.target_column], errors='coerce')
+                    # Если есть NaN, заменяем нулями
+                    if df_sorted[self.target_column].isna().any():
+                        df_sorted[self.target_column] = df_sorted[self.target_column].fillna(0)
+                except:
+                    self.log(f"Невозможно преобразовать целевую колонку '{self.target_column}' в числовой формат")
+        
+        self.log(f"Финальные типы данных: {df_sorted.dtypes.to_dict()}")
+        
+        # Добавьте этот блок перед созданием TimeSeriesDataFrame
+        if self.from_form_timeseries:
+            self.log("Применение специальной обработки для данных из FormTimeseries")
+            # Убедимся, что ID колонка существует и имеет правильный тип
+            if self.id_column not in df_sorted.columns:
+                self.log(f"ID колонка '{self.id_column}' не найдена. Создаём колонку с единым ID.")
+                df_sorted['item_id'] = 'item_1'
+                self.id_column = 'item_id'
+        
+        # Добавить перед созданием TimeSeriesDataFrame
+        self.log(f"Проверка структуры данных перед созданием TimeSeriesDataFrame...")
+        # Проверяем уникальные значения в ID колонке
+        unique_ids = df_sorted[self.id_column].nunique()
+        self.log(f"Количество уникальных ID: {unique_ids}")
+
+        # Анализируем длину каждого временного ряда
+        id_counts = df_sorted[self.id_column].value_counts()
+        self.log(f"Количество записей по ID: мин={id_counts.min()}, макс={id_counts.max()}, среднее={id_counts.mean():.1f}")
+
+        # Разбиение единственного ряда на искусственные - только по явному выбору пользователя
+        strategy = self.SPLIT_STRATEGIES[self.split_strategy][0]
+        if unique_ids == 1 and strategy != "off":
+            df_sorted = self.split_single_series(df_sorted, strategy)
+
+        # Иерархический режим: добавляем агрегированные ряды всех уровней
+        self.hierarchy = None
+        if self.hierarchical and self.hierarchy_columns:
+            df_sorted = self.build_hierarchy(df_sorted)
+
+        # Дубликаты (ID, время) агрегируются, а не отбрасываются
+        df_sorted = self.aggregate_duplicates(df_sorted)
+
+        # Профиль качества по исходным точкам (до заполнения пропусков) и очистка по нему
+        self.quality_report = self.profile_series(df_sorted, self.target_column, model_freq)
+        if self.quality_filter and self.hierarchy is not None:
+            self.log("Очистка по качеству не применяется в иерархическом режиме: уровни должны суммироваться")
+        elif self.quality_filter:
+            df_sorted = self.apply_quality_filter(df_sorted, self.target_column)
+
+        # Регуляризация: каждый ряд приводится к сетке выбранной частоты
+        if self.regularize_series:
+            df_sorted = self.regularize_frame(df_sorted, model_freq)
+        else:
+            self.log("Регуляризация отключена, выравнивание рядов остается за AutoGluon")
+        # Заполненные пропуски по рядам - в таблицу качества данных
+        gaps = self.gap_report if self.gap_report is not None else pd.Series(dtype=int)
+        self.quality_report["gaps_filled"] = \
+            self.quality_report[self.id_column].map(gaps).fillna(0).astype(int).to_numpy()
+
+        # Подготовка данных для праздников, если опция включена
+        if self.include_holidays:
+            df_sorted = self.add_holiday_features(df_sorted)
+
+        # дополнительная отладка
+        self.log("Подготовка TimeSeriesDataFrame...")
+        self.log(f"Количество строк в df_sorted: {len(df_sorted)}")
+        self.log(f"Пример данных:\n{df_sorted.head(3).to_string()}")
+
+        # AutoGluon принимает только строковые или целочисленные ID
+        if isinstance(df_sorted[self.id_column].dtype, pd.CategoricalDtype):
+            df_sorted[self.id_column] = df_sorted[self.id_column].astype(str)
+
+        # Преобразуем в формат TimeSeriesDataFrame
+        ts_data = TimeSeriesDataFrame.from_data_frame(
+            df_sorted,
+            id_column=self.id_column,
+            timestamp_column=self.timestamp_column
+        )
+        
+        self.log(f"Создан временной ряд с {len(ts_data)} записями")
+        return ts_data, df_sorted
+
+    def history_holiday_country(self):
+        """Страна праздников для истории: при прогнозе моделью в памяти - та, на которой она обучалась.
+        Новая страна влияет только на будущие ковариаты"""
+        return self.trained_holiday_country or self.holiday_country
+
+    def add_holiday_features(self, df):
+        """Добавляет признак is_holiday по стране праздников истории"""
+        country = self.history_holiday_country()
+        self.log(f"Подготовка признаков праздников для страны: {country}...")
         try:
-            # Нормализуем дату
-            if not isinstance(last_date, pd.Timestamp):
-                last_date = pd.to_datetime(last_date)
-            
-            # Получаем частоту
-            freq = self.detected_frequency if self.auto_frequency else self.frequency
-            
-            # Создаем следующую дату
-            try:
-                offset = pd.tseries.frequencies.to_offset(freq)
-                start_date = last_date + offset
-            except:
-                start_date = last_date + pd.Timedelta(days=1)
-            
-            # Создаем диапазон дат
+            # Убедимся, что временная колонка в df - это datetime
+            df[self.timestamp_column] = pd.to_datetime(df[self.timestamp_column])
+
+            if len(df) > 0:
+                # Создаем столбец is_holiday
+                df['is_holiday'] = self.holiday_flags(df[self.timestamp_column], country)
+                self.log(f"Добавлен признак 'is_holiday' в df. Обнаружено {df['is_holiday'].sum()} праздничных дней.")
+            else:
+                self.log("Не удалось определить диапазон дат для праздников.")
+        except Exception as e_holiday:
+            self.log(f"Ошибка при подготовке признаков праздников: {str(e_holiday)}")
+        return df
+
+    def get_target_columns(self):
+        """Целевые колонки: основная и дополнительные в режиме нескольких целей"""
+        targets = [self.target_column]
+        if self.multi_target:
+            targets += [col for col in self.extra_target_columns
+                        if col != self.target_column and col in self.data.columns]
+        return targets
+
+    def budget_history_path(self):
+        """Файл истории замеров обучения (общий для всех экземпляров виджета)"""
+        return Path(data_dir()) / "autogluon_timeseries" / "budget_history.json"
+
+    def load_budget_history(self):
+        try:
+            with open(self.budget_history_path(), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return []
+
+    def save_budget_history(self, entries):
+        """Дописывает замеры в историю, храня последние BUDGET_HISTORY_SIZE"""
+        if not entries:
+            return
+        path = self.budget_history_path()
+        try:
+            history = (self.load_budget_history() + entries)[-self.BUDGET_HISTORY_SIZE:]
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(history, f)
+        except OSError as e:
+            self.log(f"Не удалось сохранить историю замеров обучения: {str(e)}")
+
+    def cost_units(self, n_points, n_items):
+        """Условная стоимость обучения: точки истории и прогнозируемые точки всех рядов"""
+        return float(n_points + n_items * self.prediction_length * (self.NUM_VAL_WINDOWS + 1))
+
+    def budget_rate(self):
+        """Скорость обучения (единиц стоимости на ядро в секунду) по истории запусков.
+
+        Учитываются только запуски, завершившиеся до лимита времени: у остановленных по
+        лимиту фактическая стоимость неизвестна.
+        """
+        rates = [entry["units"] * self.PRESET_COSTS.get(entry["preset"], 1.0) / (entry["seconds"] * entry["cpus"])
+                 for entry in self.load_budget_history()
+                 if entry.get("seconds", 0) > 0 and entry["seconds"] < 0.95 * entry["time_limit"]]
+        return (float(np.median(rates)), len(rates)) if rates else (self.BUDGET_DEFAULT_RATE, 0)
+
+    def get_fit_budget(self, ts_data, targets):
+        """Лимит времени и пресет обучения: из настроек или по оценке стоимости под целевое время"""
+        if not self.auto_budget:
+            return self.time_limit, self.selected_preset, None
+        cpus, threads = self.get_resource_budget()
+        workers = max(1, min(len(targets), cpus // max(threads, 1)))
+        cpus_per_fit = max(1, cpus // workers)
+        n_items = ts_data.num_items
+        share = self.sample_fraction / 100 if self.sample_training else 1.0
+        units = self.cost_units(len(ts_data) * share, n_items * share)
+        rate, n_runs = self.budget_rate()
+        # Цели обучаются группами по workers, на каждую группу - равная доля целевого времени
+        rounds = -(-len(targets) // workers)
+        limit = max(self.MIN_TIME_LIMIT, self.target_wall_time * self.BUDGET_FIT_SHARE / rounds)
+        # Лучший пресет, укладывающийся в лимит; лимит - оценка с запасом, но не больше доли целевого времени
+        preset = self.PRESETS[-1]
+        for candidate in self.PRESETS:
+            if units * self.PRESET_COSTS[candidate] / (rate * cpus_per_fit) * self.BUDGET_MARGIN <= limit:
+                preset = candidate
+                break
+        estimate = units * self.PRESET_COSTS[preset] / (rate * cpus_per_fit)
+        time_limit = int(min(limit, max(self.MIN_TIME_LIMIT, estimate * self.BUDGET_MARGIN)))
+        self.log(f"Автобюджет: {n_items} рядов, {len(ts_data)} точек, {units:.0f} ед. стоимости, "
+                 f"скорость {rate:.0f} ед./ядро/сек ({'по ' + str(n_runs) + ' запускам' if n_runs else 'по умолчанию'}), "
+                 f"пресет {preset}, оценка {estimate:.0f} сек, лимит {time_limit} сек")
+        return time_limit, preset, estimate
+
+    def get_fit_args(self, time_limit=None, preset=None):
+        """Аргументы predictor.fit с учетом бюджета времени и ресурсов"""
+        preset = self.selected_preset if preset is None else preset
+        fit_args = {
+            "time_limit": self.time_limit if time_limit is None else time_limit,
+            "presets": preset,
+            "num_val_windows": self.NUM_VAL_WINDOWS,
+            "val_step_size": self.VAL_STEP_SIZE
+        }
+
+        # Ограничение ресурсов: потоки процесса и n_jobs/num_cpus моделей
+        cpus, threads = self.apply_resource_limits()
+        hyperparameters = self.resource_hyperparameters(cpus, threads, preset)
+        if hyperparameters is not None:
+            fit_args["hyperparameters"] = hyperparameters
+        return fit_args
+
+    def train_predictor(self, ts_data, target, model_path, model_freq, metric, fit_args):
+        """Обучает предиктор для одной целевой колонки на рядах достаточной длины. Возвращает (predictor, ts_data).
+
+        Не обращается к элементам интерфейса, поэтому может выполняться в рабочем потоке.
+        """
+        predictor = TimeSeriesPredictor(
+            path=model_path,
+            prediction_length=self.prediction_length,
+            target=target,
+            eval_metric=metric.lower(),
+            freq=model_freq,
+            # Праздники известны заранее: модели получают их и на горизонте прогноза
+            known_covariates_names=['is_holiday'] if 'is_holiday' in ts_data.columns else None
+        )
+        try:
+            predictor.fit(ts_data, **fit_args)
+        except ValueError as ve:
+            # Короткие ряды отсекаются до обучения, повторное обучение не выполняется
+            error_msg = str(ve)
+            self.log(f"[{target}] Полное сообщение об ошибке: {error_msg}")
+            if "observations" not in error_msg:
+                raise
+            import re
+            match = re.search(r"must have >= (\d+) observations", error_msg)
+            if match:
+                raise ValueError(f"Недостаточно точек в каждом временном ряду: требуется минимум {match.group(1)}.")
+            raise ValueError(f"Проблема с количеством наблюдений: {error_msg}")
+        if self.refit_full:
+            # Модели *_FULL обучены на всех данных без валидационного окна; лучшей становится версия _FULL
+            refit_map = predictor.refit_full()
+            self.log(f"[{target}] refit_full: {len(refit_map)} моделей дообучены на всех данных")
+        return predictor, ts_data
+
+    def min_series_length(self, prediction_length=None):
+        """Минимальная длина ряда для обучения с длиной прогноза (по умолчанию текущей; можно массив)
+        и окнами валидации"""
+        h = self.prediction_length if prediction_length is None else prediction_length
+        min_train_length = np.maximum(h + 1, 5)
+        # В режиме оценки точки всех окон бэктеста отложены и в обучение не попадают
+        holdout_length = h + (self.backtest_step or h) * (self.backtest_windows - 1) if self.evaluate_mode else 0
+        return (min_train_length + h + holdout_length
+                + (self.NUM_VAL_WINDOWS - 1) * self.VAL_STEP_SIZE)
+
+    def triage_series(self, ts_data, target):
+        """Распределяет ряды между моделями AutoGluon и резервными методами до обучения.
+
+        Короткие ряды (и, при включенных резервных методах, ряды холодного старта и
+        прерывистого спроса) прогнозируются резервными методами. Возвращает ряды для обучения.
+        """
+        codes, item_ids = pd.factorize(ts_data.index.get_level_values(0))
+        lengths = np.bincount(codes, minlength=len(item_ids))
+        min_length = self.min_series_length()
+        methods = np.full(len(item_ids), None, dtype=object)
+        is_short = lengths < min_length
+        if self.fallback_tier:
+            is_short |= lengths < self.cold_start_length
+            zero_share = np.bincount(codes, weights=(ts_data[target].to_numpy() == 0),
+                                     minlength=len(item_ids)) / lengths
+            is_sparse = zero_share >= self.sparse_zero_share / 100
+            methods[is_sparse] = "croston_tsb"
+        methods[is_short & pd.isna(methods)] = self.FALLBACK_METHODS[self.fallback_method][0]
+        routed = ~pd.isna(methods)
+        self.fallback_series[target] = pd.Series(methods[routed], index=item_ids[routed])
+        if not routed.any():
+            return ts_data
+        if is_short.all() and not self.fallback_tier:
+            raise ValueError(f"Все временные ряды слишком короткие для обучения модели: "
+                             f"требуется минимум {min_length} точек, максимум в данных {lengths.max()}")
+        counts = self.fallback_series[target].value_counts().to_dict()
+        self.log(f"[{target}] Резервные методы для {routed.sum()} из {len(item_ids)} рядов "
+                 f"(минимум для моделей: {min_length} точек): {counts}")
+        return ts_data[~routed[codes]]
+
+    def series_matrix(self, ts_data, target, width):
+        """Последние width значений каждого ряда в матрице (ряды x время), выровненной по правому краю"""
+        codes, item_ids = pd.factorize(ts_data.index.get_level_values(0))
+        lengths = np.bincount(codes, minlength=len(item_ids))
+        order = np.argsort(codes, kind="stable")
+        sorted_codes = codes[order]
+        starts = np.searchsorted(sorted_codes, np.arange(len(item_ids)))
+        # Позиция точки от конца ряда: 0 - последняя
+        from_end = lengths[sorted_codes] - 1 - (np.arange(len(order)) - starts[sorted_codes])
+        keep = from_end < width
+        matrix = np.full((len(item_ids), width), np.nan)
+        matrix[sorted_codes[keep], width - 1 - from_end[keep]] = ts_data[target].to_numpy(dtype=np.float64)[order][keep]
+        timestamps = pd.Series(ts_data.index.get_level_values(1)).groupby(codes).max()
+        return item_ids, matrix, np.minimum(lengths, width), pd.DatetimeIndex(timestamps.to_numpy())
+
+    def season_length(self, freq):
+        """Сезонный период для базовой частоты (1 - без сезонности)"""
+        base = pd.tseries.frequencies.to_offset(freq).name.split("-")[0]
+        return self.SEASON_LENGTHS.get(base, 1)
+
+    def fallback_frame(self, item_ids, last_timestamps, freq, point, scale, quantile_levels):
+        """Прогноз резервного метода в формате предиктора: mean и квантили нормального распределения"""
+        h = point.shape[1]
+        offset = pd.tseries.frequencies.to_offset(freq)
+        timestamps = np.column_stack([(last_timestamps + k * offset).to_numpy() for k in range(1, h + 1)])
+        frame = pd.DataFrame({"mean": point.ravel()}, index=pd.MultiIndex.from_arrays(
+            [item_ids.repeat(h), pd.DatetimeIndex(timestamps.ravel())],
+            names=[TimeSeriesDataFrame.ITEMID, TimeSeriesDataFrame.TIMESTAMP]))
+        spread = np.repeat(scale, h)
+        for q in quantile_levels:
+            frame[str(q)] = frame["mean"].to_numpy() + NormalDist().inv_cdf(q) * spread
+        return frame
+
+    def tsb_forecast(self, matrix):
+        """Прогноз TSB (Croston с вероятностью спроса) векторно для всех рядов матрицы"""
+        nonzero = (matrix > 0) & ~np.isnan(matrix)
+        observed = ~np.isnan(matrix)
+        # Начальные уровень спроса и вероятность - по всей доступной истории
+        demand_sum = np.where(nonzero, matrix, 0).sum(axis=1)
+        level = np.divide(demand_sum, nonzero.sum(axis=1), out=np.zeros(len(matrix)), where=nonzero.any(axis=1))
+        probability = nonzero.sum(axis=1) / np.maximum(observed.sum(axis=1), 1)
+        for t in range(matrix.shape[1]):
+            obs, nz = observed[:, t], nonzero[:, t]
+            probability = np.where(obs, probability + self.TSB_BETA * (nz - probability), probability)
+            level = np.where(nz, level + self.TSB_ALPHA * (matrix[:, t] - level), level)
+        return probability * level
+
+    def fallback_forecast(self, ts_data, target, freq, quantile_levels, methods):
+        """Векторный прогноз резервными методами: наивный, сезонный наивный, скользящее среднее, TSB"""
+        h = self.prediction_length
+        season = self.season_length(freq)
+        width = max(self.FALLBACK_HISTORY, season)
+        item_ids, matrix, lengths, last_timestamps = self.series_matrix(ts_data, target, width)
+        methods = methods.reindex(item_ids).to_numpy()
+
+        window = season if season > 1 else 3
+        naive = matrix[:, -1]
+        moving_average = np.nanmean(matrix[:, -window:], axis=1)
+        seasonal = matrix[:, width - season + np.arange(h) % season]
+        # Сезонный наивный без полного сезона истории заменяется скользящим средним
+        seasonal = np.where(np.isnan(seasonal), moving_average[:, None], seasonal)
+        has_season = (lengths >= season) & (season > 1)
+        methods = np.where(methods == "auto", np.where(has_season, "seasonal_naive", "moving_average"), methods)
+        is_sparse = methods == "croston_tsb"
+        tsb = self.tsb_forecast(matrix[is_sparse]) if is_sparse.any() else np.empty(0)
+
+        point = np.repeat(moving_average[:, None], h, axis=1)
+        point[methods == "naive"] = naive[methods == "naive", None]
+        point[methods == "seasonal_naive"] = seasonal[methods == "seasonal_naive"]
+        point[is_sparse] = tsb[:, None]
+
+        scale = np.nan_to_num(np.nanstd(matrix, axis=1))
+        frame = self.fallback_frame(item_ids, last_timestamps, freq, point, scale, quantile_levels)
+        # Неотрицательные ряды не получают отрицательных прогнозов
+        non_negative = np.repeat(np.nanmin(matrix, axis=1) >= 0, h)
+        frame.loc[non_negative] = frame.loc[non_negative].clip(lower=0)
+        return frame
+
+    def model_series(self, target_data, target):
+        """Ряды цели, прогнозируемые моделями AutoGluon (без ушедших в резервные методы)"""
+        fallback_methods = self.fallback_series.get(target)
+        if fallback_methods is None or not len(fallback_methods):
+            return target_data
+        return target_data[~target_data.index.get_level_values(0).isin(fallback_methods.index)]
+
+    def forecast_target(self, predictor, target_data, target, freq, model=None):
+        """Прогноз моделями AutoGluon и резервными методами для отобранных при сортировке рядов"""
+        fallback_methods = self.fallback_series.get(target, pd.Series(dtype=object))
+        is_fallback = target_data.index.get_level_values(0).isin(fallback_methods.index)
+        model_data = self.model_series(target_data, target)
+        if predictor is None:
+            # Все ряды ушли в резервные методы - модели не обучались
+            return self.fallback_forecast(target_data, target, freq, self.QUANTILE_LEVELS,
+                                          fallback_methods), model_data
+        parts = []
+        columns = ["mean"] + [str(q) for q in predictor.quantile_levels]
+        if len(model_data) > 0:
+            # Ковариаты покрывают весь обученный горизонт, более короткий прогноз получается усечением
+            known_covariates = self.make_known_covariates(predictor, model_data, self.holiday_country)
+            predictions = self.predict_in_batches(predictor, model_data, known_covariates, model)
+            if self.prediction_length < predictor.prediction_length:
+                predictions = predictions[predictions.groupby(level=0, sort=False).cumcount().to_numpy()
+                                          < self.prediction_length]
+            parts.append(pd.DataFrame(predictions))
+        if len(fallback_methods):
+            # Все ряды новых данных могут уйти в резервные методы - тогда модель не вызывается
+            fallback = self.fallback_forecast(target_data[is_fallback], target, predictor.freq,
+                                              predictor.quantile_levels, fallback_methods)
+            parts.append(pd.DataFrame(fallback[columns]))
+        return TimeSeriesDataFrame(pd.concat(parts)), model_data
+
+    def backtest_cutoffs(self):
+        """Точки отсечения бэктеста от самой ранней: отрицательное число точек от конца каждого ряда"""
+        step = self.backtest_step or self.prediction_length
+        return [-(self.prediction_length + step * window) for window in reversed(range(self.backtest_windows))]
+
+    def split_evaluation(self, ts_data, cutoff):
+        """Делит ряды в точке отсечения на историю и следующие за ней prediction_length точек"""
+        from_end = ts_data.groupby(level=0, sort=False).cumcount(ascending=False).to_numpy()
+        is_context = from_end >= -cutoff
+        is_actual = ~is_context & (from_end >= -cutoff - self.prediction_length)
+        return ts_data[is_context], ts_data[is_actual]
+
+    def evaluation_metrics(self, actual, predictions, target):
+        """MAE, MAPE, RMSE, WQL и смещение по рядам и в целом - векторными groupby по точкам прогноза"""
+        frame = pd.DataFrame({"y": actual[target]}).join(pd.DataFrame(predictions), how="inner")
+        quantile_cols = [col for col in frame.columns if col not in ("y", "mean")]
+        error = frame["mean"] - frame["y"]
+        abs_y = frame["y"].abs()
+        y = frame["y"].to_numpy()[:, None]
+        q = np.asarray([float(col) for col in quantile_cols])
+        pinball = 2 * np.abs((frame[quantile_cols].to_numpy() - y) * ((y <= frame[quantile_cols].to_numpy()) - q))
+        points = pd.DataFrame({
+            "n": 1,
+            "abs_error": error.abs(),
+            "sq_error": error ** 2,
+            "ape": (error.abs() / abs_y).where(abs_y > 0),
+            "error": error,
+            "abs_y": abs_y,
+            "pinball": pinball.mean(axis=1) if len(quantile_cols) else np.nan,
+        }, index=frame.index)
+
+        def summarize(sums, counts):
+            return pd.DataFrame({
+                "n": sums["n"],
+                "MAE": sums["abs_error"] / sums["n"],
+                "MAPE": sums["ape"] / counts["ape"],
+                "RMSE": np.sqrt(sums["sq_error"] / sums["n"]),
+                "WQL": sums["pinball"] / sums["abs_y"].where(sums["abs_y"] > 0),
+                "bias": sums["error"] / sums["n"],
+            })
+
+        grouped = points.groupby(level=0, sort=False)
+        per_item = summarize(grouped.sum(), grouped.count()).rename_axis(self.id_column).reset_index()
+        overall = summarize(points.sum().to_frame().T, points.count().to_frame().T).iloc[0]
+        return per_item, overall
+
+    def evaluate_target(self, predictor, target_data, target, freq, model=None, cutoff=None):
+        """Прогноз точек после отсечения (по умолчанию последних) и метрики точности по рядам"""
+        cutoff = -self.prediction_length if cutoff is None else cutoff
+        context, actual = self.split_evaluation(target_data, cutoff)
+        fallback_methods = self.fallback_series.get(target, pd.Series(dtype=object))
+        is_fallback = context.index.get_level_values(0).isin(fallback_methods.index)
+        parts = []
+        if predictor is not None and (~is_fallback).any():
+            # Праздники окна оценки - по календарю истории; без кэша прогнозов: окна бэктеста
+            # прогнозируются параллельно одним предиктором
+            known_covariates = self.make_known_covariates(predictor, context[~is_fallback],
+                                                          self.history_holiday_country())
+            predictions = self.predict_in_batches(predictor, context[~is_fallback], known_covariates, model,
+                                                  use_cache=False)
+            parts.append(pd.DataFrame(predictions))
+        if is_fallback.any():
+            quantile_levels = predictor.quantile_levels if predictor is not None else self.QUANTILE_LEVELS
+            fallback = self.fallback_forecast(context[is_fallback], target, freq, quantile_levels, fallback_methods)
+            parts.append(pd.DataFrame(fallback))
+        predictions = TimeSeriesDataFrame(pd.concat(parts))
+        if self.hierarchy is not None:
+            predictions = self.reconcile_predictions(predictions, context, target)
+        per_item, overall = self.evaluation_metrics(actual, predictions, target)
+        per_item.insert(1, 'cutoff', cutoff)
+        self.log(f"[{target}] Отсечение {cutoff}, {int(overall['n'])} точек: MAE={overall['MAE']:.4f}, "
+                 f"MAPE={overall['MAPE']:.4f}, RMSE={overall['RMSE']:.4f}, WQL={overall['WQL']:.4f}, "
+                 f"смещение={overall['bias']:.4f}")
+        return per_item, overall
+
+    def backtest_target(self, predictor, target_data, target, freq, model=None):
+        """Бэктест одним обученным предиктором: прогнозы во всех точках отсечения параллельно.
+
+        Возвращает метрики по рядам и отсечениям и итоговые метрики по отсечениям.
+        """
+        cutoffs = self.backtest_cutoffs()
+        cpus, threads = self.get_resource_budget()
+        workers = max(1, min(len(cutoffs), cpus // max(threads, 1)))
+        if self.predict_batch_size > 0 and self.predict_workers > 1:
+            # Пакетный прогноз сам сохраняет предиктор и запускает пул процессов: отсечения - по очереди
+            workers = 1
+        self.log(f"[{target}] Бэктест: отсечения {cutoffs}, параллельно: {workers}")
+
+        def evaluate_cutoff(cutoff):
+            return self.evaluate_target(predictor, target_data, target, freq, model, cutoff)
+
+        if workers == 1:
+            results = [evaluate_cutoff(cutoff) for cutoff in cutoffs]
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(evaluate_cutoff, cutoffs))
+        per_item = pd.concat([item_metrics for item_metrics, _ in results], ignore_index=True)
+        per_cutoff = pd.DataFrame([overall for _, overall in results])
+        per_cutoff.insert(0, 'cutoff', cutoffs)
+        return per_item, per_cutoff.reset_index(drop=True)
+
+    def sample_series(self, ts_data, target):
+        """Стратифицированная выборка рядов по длине и объему для обучения глобальных моделей"""
+        stats = ts_data[target].abs().groupby(level=0).agg(["size", "sum"])
+        n_items = len(stats)
+        fraction = self.sample_fraction / 100
+        if fraction >= 1 or n_items * fraction < 1:
+            return ts_data
+
+        # Страты: квантильные корзины длины x квантильные корзины объема
+        bins = min(self.SAMPLE_STRATA_BINS, n_items)
+        length_bin = pd.qcut(stats["size"].rank(method="first"), bins, labels=False)
+        volume_bin = pd.qcut(stats["sum"].rank(method="first"), bins, labels=False)
+        strata = (length_bin * bins + volume_bin).to_numpy()
+
+        # Случайный порядок внутри страты, из каждой страты берется доля (не меньше одного ряда)
+        rng = np.random.default_rng(self.SAMPLE_SEED)
+        rank_in_stratum = pd.Series(rng.random(n_items)).groupby(strata).rank(method="first").to_numpy()
+        stratum_size = np.bincount(strata)[strata]
+        take = rank_in_stratum <= np.maximum(1, np.round(stratum_size * fraction))
+        sampled_ids = stats.index[take]
+
+        self.sampling_report[target] = {"ratio": len(sampled_ids) / n_items, "sampled": len(sampled_ids),
+                                        "total": n_items, "sampled_ids": sampled_ids}
+        self.log(f"[{target}] Обучение на выборке: {len(sampled_ids)} из {n_items} рядов "
+                 f"({len(sampled_ids) / n_items:.1%}), страт: {len(np.unique(strata))}")
+        return ts_data[ts_data.index.get_level_values(0).isin(sampled_ids)]
+
+    def evaluate_sampling_gap(self, predictor, ts_data, target, lb):
+        """Сравнивает валидационную оценку с оценкой на рядах вне выборки"""
+        report = self.sampling_report[target]
+        if lb is None or report["sampled"] >= report["total"]:
+            return
+        try:
+            # Для оценки достаточно стольких же рядов вне выборки, сколько было в выборке
+            item_ids = ts_data.index.get_level_values(0)
+            outside = item_ids.unique().difference(report["sampled_ids"])
+            rng = np.random.default_rng(self.SAMPLE_SEED)
+            outside = rng.permutation(outside.to_numpy())[:report["sampled"]]
+            holdout = ts_data[item_ids.isin(outside)]
+            scores = predictor.evaluate(holdout)
+            holdout_score = float(next(iter(scores.values())))
+            val_score = float(lb.iloc[0]['score_val'])
+            report.update(val_score=val_score, holdout_score=holdout_score, gap=holdout_score - val_score)
+            self.log(f"[{target}] Оценка вне выборки ({len(outside)} рядов): {holdout_score:.4f}, "
+                     f"валидация: {val_score:.4f}, разрыв: {holdout_score - val_score:.4f}")
+        except Exception as e:
+            self.log(f"[{target}] Не удалось оценить разрыв валидации: {str(e)}")
+
+    def target_datasets(self, ts_data, targets):
+        """Данные по целям: каждый предиктор видит только свою цель, остальные цели не становятся ковариатами"""
+        if len(targets) == 1:
+            return {targets[0]: ts_data}
+        other_targets = set(targets)
+        return {
+            target: ts_data[[col for col in ts_data.columns if col == target or col not in other_targets]]
+            for target in targets
+        }
+
+    def train_targets(self, ts_data, targets, model_root, model_freq, metric, fit_args):
+        """Обучает по предиктору на каждую цель, параллельно в пределах бюджета CPU"""
+        datasets = self.target_datasets(ts_data, targets)
+        cpus, threads = self.get_resource_budget()
+        workers = max(1, min(len(targets), cpus // max(threads, 1)))
+        self.log(f"Обучение {len(targets)} целей: {targets}, параллельно: {workers}")
+        if workers > 1:
+            # Параллельные обучения делят бюджет: n_jobs локальных моделей - доля ядер одного обучения
+            hyperparameters = self.resource_hyperparameters(cpus // workers, threads, fit_args.get("presets"))
+            if hyperparameters is not None:
+                fit_args = dict(fit_args, hyperparameters=hyperparameters)
+
+        def fit_one(target):
+            model_path = model_root / f"target_{targets.index(target)}"
+            (model_path / "logs").mkdir(parents=True, exist_ok=True)
+            fit_data = self.triage_series(datasets[target], target)
+            if fit_data.empty:
+                self.log(f"[{target}] Все ряды прогнозируются резервными методами, обучение пропущено")
+                return None, datasets[target]
+            if self.evaluate_mode:
+                fit_data = self.split_evaluation(fit_data, self.backtest_cutoffs()[0])[0]
+            if self.sample_training:
+                fit_data = self.sample_series(fit_data, target)
+            started = time.monotonic()
+            predictor, _ = self.train_predictor(fit_data, target, model_path, model_freq, metric, fit_args)
+            # Замер для автобюджета: стоимость данных, пресет, ядра на обучение и фактическое время
+            self.fit_timings.append({
+                "units": self.cost_units(len(fit_data), fit_data.num_items),
+                "preset": fit_args.get("presets"), "cpus": max(1, cpus // workers),
+                "time_limit": fit_args["time_limit"], "seconds": time.monotonic() - started,
+            })
+            # Модель прогнозирует всю популяцию рядов; короткие ряды - резервным методом
+            return predictor, datasets[target]
+
+        if workers == 1:
+            return {target: fit_one(target) for target in targets}
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {target: executor.submit(fit_one, target) for target in targets}
+            return {target: future.result() for target, future in futures.items()}
+
+    def predict_in_batches(self, predictor, ts_data, known_covariates=None, model=None, use_cache=True):
+        """Прогноз пакетами рядов с записью в заранее выделенный массив.
+
+        Пиковая память ограничена размером пакета, а не числом рядов.
+        """
+        codes, item_ids = pd.factorize(ts_data.index.get_level_values(0))
+        n_items = len(item_ids)
+        batch_size = self.predict_batch_size
+        if batch_size <= 0 or n_items <= batch_size:
+            return _predict_with_model(predictor, ts_data, known_covariates, model, use_cache)
+
+        # Строки каждого ряда: одна сортировка, далее пакеты берутся срезами
+        order = np.argsort(codes, kind="stable")
+        bounds = np.searchsorted(codes[order], np.arange(n_items + 1))
+        if known_covariates is not None:
+            cov_codes = pd.Categorical(known_covariates.index.get_level_values(0), categories=item_ids).codes
+            cov_order = np.argsort(cov_codes, kind="stable")
+            cov_bounds = np.searchsorted(cov_codes[cov_order], np.arange(n_items + 1))
+
+        def batches():
+            for start in range(0, n_items, batch_size):
+                stop = min(start + batch_size, n_items)
+                batch = ts_data.iloc[order[bounds[start]:bounds[stop]]]
+                batch_cov = None
+                if known_covariates is not None:
+                    batch_cov = known_covariates.iloc[cov_order[cov_bounds[start]:cov_bounds[stop]]]
+                yield batch, batch_cov
+
+        # Выходной массив: prediction_length строк на ряд, колонки mean и квантили
+        columns = ["mean"] + [str(q) for q in predictor.quantile_levels]
+        n_rows = n_items * predictor.prediction_length
+        values = np.empty((n_rows, len(columns)), dtype=np.float64)
+        out_codes = np.empty(n_rows, dtype=np.int64)
+        out_times = np.empty(n_rows, dtype="datetime64[ns]")
+        offset = 0
+
+        def store(batch_pred):
+            nonlocal offset
+            end = offset + len(batch_pred)
+            values[offset:end] = batch_pred[columns].to_numpy(dtype=np.float64)
+            out_codes[offset:end] = item_ids.get_indexer(batch_pred.index.get_level_values(0))
+            out_times[offset:end] = batch_pred.index.get_level_values(1).to_numpy(dtype="datetime64[ns]")
+            offset = end
+
+        n_batches = (n_items + batch_size - 1) // batch_size
+        cpus, _ = self.get_resource_budget()
+        workers = max(1, min(self.predict_workers, cpus, n_batches))
+        self.log(f"Пакетный прогноз: {n_items} рядов, {n_batches} пакетов по {batch_size}, процессов: {workers}")
+
+        if workers == 1:
+            for batch, batch_cov in batches():
+                store(_predict_with_model(predictor, batch, batch_cov, model, use_cache=False))
+        else:
+            # Модель загружается каждым процессом один раз; в работе не больше 2 пакетов на процесс
+            predictor.save()
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_predict_worker,
+                                     initargs=(predictor.path, max(1, cpus // workers))) as executor:
+                pending = []
+                for batch, batch_cov in batches():
+                    pending.append(executor.submit(_predict_batch, batch, batch_cov, model))
+                    if len(pending) >= 2 * workers:
+                        store(pending.pop(0).result())
+                for future in pending:
+                    store(future.result())
+
+        index = pd.MultiIndex.from_arrays(
+            [item_ids.take(out_codes[:offset]), pd.DatetimeIndex(out_times[:offset])],
+            names=[TimeSeriesDataFrame.ITEMID, TimeSeriesDataFrame.TIMESTAMP])
+        return TimeSeriesDataFrame(pd.DataFrame(values[:offset], index=index, columns=columns))
+
+    def make_known_covariates(self, predictor, ts_data, country):
+        """Будущие признаки праздников на горизонте предиктора (None, если он обучен без них)"""
+        known_covariates_for_prediction = None
+        if 'is_holiday' in (predictor.known_covariates_names or []): # Признак объявлен при обучении
+            self.log("Подготовка будущих признаков праздников для прогноза...")
             try:
-                if freq == 'B':  # Рабочие дни
-                    all_dates = pd.date_range(start=start_date, periods=self.prediction_length * 2, freq='D')
-                    dates = all_dates[all_dates.weekday < 5][:self.prediction_length]
+                # Даты горизонта по каждому ряду - те же, что прогнозирует AutoGluon
+                future = predictor.make_future_data_frame(ts_data)
+                if len(future):
+                    index = pd.MultiIndex.from_frame(future[[TimeSeriesDataFrame.ITEMID, TimeSeriesDataFrame.TIMESTAMP]])
+                    known_covariates_for_prediction = TimeSeriesDataFrame(pd.DataFrame(
+                        {'is_holiday': self.holiday_flags(index.get_level_values(1), country)}, index=index))
+                    self.log(f"Созданы будущие признаки праздников: {known_covariates_for_prediction.shape[0]} записей.")
+                    self.log(f"Пример будущих ковариат:\n{known_covariates_for_prediction.head().to_string()}")
                 else:
-                    dates = pd.date_range(start=start_date, periods=self.prediction_length, freq=freq)
-            except:
-                # Универсальный запасной вариант
-                dates = pd.date_range(start=start_date, periods=self.prediction_length, freq='D')
-            
-            return dates
-            
+                    self.log("Не удалось создать DataFrame для будущих ковариат (нет item_id).")
+
+            except Exception as e_fut_holiday:
+                self.log(f"Ошибка при подготовке будущих признаков праздников: {str(e_fut_holiday)}\n{traceback.format_exc()}")
+        return known_covariates_for_prediction
+
+    def holiday_flags(self, dates, country):
+        """Признак праздника (0/1) для дат: календарь проверяется по уникальным дням"""
+        days = pd.DatetimeIndex(dates).normalize()
+        unique_days = days.unique()
+        if len(unique_days) == 0:
+            return np.zeros(0, dtype=np.int64)
+        country_holidays_obj = holidays.CountryHoliday(country, years=range(unique_days.min().year,
+                                                                            unique_days.max().year + 1))
+        is_holiday = pd.Index([day in country_holidays_obj for day in unique_days])
+        return is_holiday[unique_days.get_indexer(days)].to_numpy().astype(np.int64)
+
+    def round_coherently(self, pred_df, value_cols):
+        """Неотрицательные целые прогнозы, сохраняющие согласованность иерархии: округляются нижние ряды,
+        родители пересчитываются их суммами. None, если прогноз не покрывает иерархию целиком"""
+        labels = self.hierarchy["labels"]
+        n_bottom = self.hierarchy["n_bottom"]
+        position = {label: i for i, label in enumerate(labels)}
+        rows = pred_df[self.id_column].astype(str).map(position)
+        steps = pred_df.groupby(self.id_column, sort=False).cumcount().to_numpy()
+        if rows.isna().any() or pred_df[self.id_column].nunique() != len(labels):
+            return None
+        rows = rows.to_numpy(dtype=int)
+        horizon = steps.max() + 1 if len(steps) else 0
+        S = self.summing_matrix()
+        result = np.empty((len(pred_df), len(value_cols)), dtype=np.int64)
+        for j, col in enumerate(value_cols):
+            matrix = np.full((len(labels), horizon), np.nan)
+            matrix[rows, steps] = pred_df[col].to_numpy(dtype=float)
+            if np.isnan(matrix[:n_bottom]).any():
+                return None
+            bottom = np.round(np.clip(matrix[:n_bottom], 0, None))
+            result[:, j] = (S @ bottom)[rows, steps]
+        return result
+
+    def format_predictions(self, predictions, ts_data):
+        """Преобразует прогноз AutoGluon в итоговую таблицу одним векторным проходом.
+
+        ID остаются кодами категорий; метки подставляются в df_to_table.
+        """
+        try:
+            pred_df = predictions.reset_index()
+            if not (hasattr(predictions.index, 'nlevels') and predictions.index.nlevels == 2):
+                self.log("Прогноз без MultiIndex (ID, время), возвращаем как есть")
+                return pred_df
+            item_col, time_col = pred_df.columns[0], pred_df.columns[1]
+            pred_df = pred_df.rename(columns={item_col: self.id_column, time_col: 'timestamp'})
+            pred_df['timestamp'] = pd.DatetimeIndex(pred_df['timestamp']).strftime('%Y-%m-%d')
+
+            # Неотрицательные целые значения прогноза
+            value_cols = [col for col in pred_df.columns[2:] if pd.api.types.is_numeric_dtype(pred_df[col])]
+            coherent = None
+            if self.hierarchy is not None and self.RECONCILIATION_METHODS[self.reconciliation_method][0] != "none":
+                coherent = self.round_coherently(pred_df, value_cols)
+            if coherent is not None:
+                pred_df[value_cols] = coherent
+            else:
+                pred_df[value_cols] = pred_df[value_cols].clip(lower=0).round(0).fillna(0).astype(int)
+
+            self.log(f"Итоговый прогноз: {len(pred_df)} записей для "
+                     f"{pred_df[self.id_column].nunique()} рядов")
+            self.log(f"Пример прогноза:\n{pred_df.head(3).to_string()}")
+        except Exception as e:
+            self.log(f"Ошибка при подготовке прогноза: {str(e)}\n{traceback.format_exc()}")
+            pred_df = predictions.reset_index() if hasattr(predictions, 'reset_index') else predictions
+        return pred_df
+
+    def holdout_ts_data(self, target_data, model_freq):
+        """TimeSeriesDataFrame отложенной выборки, подготовленный так же, как обучающие данные"""
+        if self.holdout_table is None or self.hierarchy is not None:
+            return None
+        # Подготовка отложенной выборки не должна менять статистику обучающих данных
+        prep_stats, gap_report = self.prep_stats, self.gap_report
+        self.prep_stats = {}
+        try:
+            df = self.prepare_data(self.holdout_table, holdout=True)
+            missing = [col for col in [self.id_column, self.timestamp_column] + list(target_data.columns)
+                       if col != 'is_holiday' and (df is None or col not in df.columns)]
+            if missing:
+                self.log(f"В отложенной выборке нет колонок {missing}, лидерборд строится по валидации")
+                return None
+            df = df.sort_values([self.id_column, self.timestamp_column])
+            df = self.aggregate_duplicates(df)
+            if self.regularize_series:
+                df = self.regularize_frame(df, model_freq)
+            if 'is_holiday' in target_data.columns:
+                df = self.add_holiday_features(df)
+            holdout = TimeSeriesDataFrame.from_data_frame(
+                df[[self.id_column, self.timestamp_column] + list(target_data.columns)],
+                id_column=self.id_column,
+                timestamp_column=self.timestamp_column
+            )
+            self.log(f"Отложенная выборка: {holdout.num_items} рядов, {len(holdout)} записей")
+            return holdout
         except Exception as e:
-            self.log(f"Ошибка создания дат: {e}")
-            # Крайний запасной вариант
+            self.log(f"Не удалось подготовить отложенную выборку: {str(e)}")
+            return None
+        finally:
+            self.prep_stats, self.gap_report = prep_stats, gap_report
+
+    def model_size_mb(self, predictor, model_name):
+        """Размер каталога модели на диске, МБ"""
+        model_path = Path(predictor.path) / "models" / model_name
+        size = sum(os.path.getsize(os.path.join(root, name))
+                   for root, _, names in os.walk(model_path) for name in names)
+        return size / 2 ** 20
+
+    def recommend_fast_model(self, lb):
+        """Самая быстрая на прогнозе модель, чья оценка не хуже лучшей более чем на допуск"""
+        score_col = 'score_test' if 'score_test' in lb.columns else 'score_val'
+        time_col = 'pred_time_test' if 'pred_time_test' in lb.columns else 'pred_time_val'
+        valid = lb.dropna(subset=[score_col, time_col])
+        if valid.empty:
+            return None
+        # Оценки AutoGluon ориентированы "больше - лучше" (ошибки отрицательны)
+        best = valid[score_col].max()
+        threshold = best - abs(best) * self.fast_model_tolerance / 100
+        candidates = valid[valid[score_col] >= threshold]
+        return candidates.loc[candidates[time_col].idxmin(), 'model']
+
+    def ensemble_weights(self, predictor, model_name):
+        """Веса членов взвешенного ансамбля ({} - модель не ансамбль)"""
+        try:
+            model = predictor._trainer.load_model(model_name)
+        except Exception as e:
+            self.log(f"Не удалось загрузить модель '{model_name}': {str(e)}")
+            return {}
+        return dict(getattr(model, "model_to_weight", None) or {})
+
+    def resolve_inference_model(self, predictor, lb, target, fast_model):
+        """Модель прогноза по режиму и оценка ускорения относительно лучшей модели.
+
+        Возвращает (model, speedup): None - лучшая модель предиктора, строка - имя модели,
+        словарь {модель: вес} - урезанный ансамбль с перенормированными весами.
+        """
+        mode = self.INFERENCE_MODES[self.inference_mode][0]
+        best_model = predictor.model_best
+        model = None
+        if mode == "fast":
+            model = fast_model
+        elif mode == "chosen":
+            if self.inference_model in predictor.model_names():
+                model = self.inference_model
+            else:
+                self.log(f"[{target}] Модели '{self.inference_model}' нет в предикторе, прогноз лучшей моделью")
+        elif mode == "pruned":
+            weights = self.ensemble_weights(predictor, best_model)
+            kept = {name: weight for name, weight in weights.items()
+                    if weight >= self.ensemble_weight_threshold / 100}
+            if not weights:
+                self.log(f"[{target}] Лучшая модель {best_model} не ансамбль, урезать нечего")
+            elif not kept:
+                # Порог выше всех весов: остается самый весомый член
+                model = max(weights, key=weights.get)
+            elif len(kept) == 1:
+                model = next(iter(kept))
+            else:
+                total = sum(kept.values())
+                model = {name: weight / total for name, weight in kept.items()}
+            if weights:
+                self.log(f"[{target}] Ансамбль {best_model}: {len(weights)} членов, оставлено "
+                         f"{len(model) if isinstance(model, dict) else 1}")
+        if model == best_model:
+            model = None
+        if model is None:
+            return None, None
+
+        # Ускорение оценивается по времени прогноза на валидации из лидерборда
+        pred_time = lb.set_index('model')['pred_time_val']
+        members = list(model) if isinstance(model, dict) else [model]
+        selected_time = pred_time.reindex(members).sum(min_count=len(members))
+        best_time = pred_time.get(best_model)
+        speedup = best_time / selected_time if pd.notna(best_time) and pd.notna(selected_time) and selected_time > 0 \
+            else None
+        self.log(f"[{target}] Прогноз моделью {members}" +
+                 (f", ускорение x{speedup:.1f}" if speedup is not None else ""))
+        return model, speedup
+
+    def build_leaderboard(self, predictor, model_data, holdout=None):
+        """Лидерборд моделей: оценка, время обучения и прогноза, пропускная способность и размер на диске"""
+        lb = None
+        try:
+            lb = predictor.leaderboard(holdout) if holdout is not None else predictor.leaderboard()
+            if lb is not None and not lb.empty:
+                self.log("Формирование лидерборда...")
+                # Пропускная способность: число спрогнозированных точек в секунду
+                if holdout is not None:
+                    rows = holdout.num_items * predictor.prediction_length
+                    pred_time = lb['pred_time_test']
+                else:
+                    rows = model_data.num_items * predictor.prediction_length * self.NUM_VAL_WINDOWS
+                    pred_time = lb['pred_time_val']
+                lb['rows_per_sec'] = rows / pred_time.where(pred_time > 0)
+                lb['size_mb'] = [self.model_size_mb(predictor, name) for name in lb['model']]
+                fast_model = self.recommend_fast_model(lb)
+                lb['recommended'] = (lb['model'] == fast_model).astype(int)
+
+                # Округление числовых значений для улучшения читаемости
+                for col in lb.select_dtypes(include=['float']).columns:
+                    lb[col] = lb[col].round(4)
+                
+                # Проверяем/исправляем имена колонок
+                lb.columns = [str(col).replace(' ', '_').replace('-', '_') for col in lb.columns]
+                
+                # Преобразуем все объектные колонки в строки
+                for col in lb.select_dtypes(include=['object']).columns:
+                    lb[col] = lb[col].astype(str)
+                    
+                self.log(f"Структура лидерборда: {lb.dtypes}")
+        except Exception as lb_err:
+            self.log(f"Ошибка лидерборда: {str(lb_err)}\n{traceback.format_exc()}")
+            lb = None
+        return lb if lb is not None and not lb.empty else None
+
+    def set_plot_data(self, target_data, predictions, target):
+        """Запоминает историю и прогноз основной цели; ряды режутся срезами по одной сортировке"""
+        def grouped(frame):
+            codes = pd.Categorical(frame.index.get_level_values(0), categories=item_ids).codes
+            order = np.argsort(codes, kind="stable")
+            bounds = np.searchsorted(codes[order], np.arange(len(item_ids) + 1))
+            return frame.iloc[order], bounds
+
+        item_ids = predictions.index.get_level_values(0).unique()
+        history, history_bounds = grouped(target_data[[target]])
+        forecast, forecast_bounds = grouped(pd.DataFrame(predictions))
+        self.plot_data = (item_ids, (history, history_bounds), (forecast, forecast_bounds), target)
+        self.plot_cache.clear()
+
+        mapping = self.categorical_mapping.get(self.id_column)
+        labels = [str(mapping[item]) if mapping and isinstance(item, (int, np.integer)) and 0 <= item < len(mapping)
+                  else str(item) for item in item_ids]
+        self.plot_item_combo.blockSignals(True)
+        self.plot_item_combo.clear()
+        self.plot_item_combo.addItems(labels)
+        self.plot_item_combo.blockSignals(False)
+        self.plot_timer.start()
+
+    def plot_series(self, position):
+        """Прореженная история и прогноз ряда; вычисляются при первом показе и кэшируются"""
+        if position in self.plot_cache:
+            self.plot_cache.move_to_end(position)
+            return self.plot_cache[position]
+        _, (history, history_bounds), (forecast, forecast_bounds), target = self.plot_data
+        item_history = history.iloc[history_bounds[position]:history_bounds[position + 1]]
+        item_forecast = forecast.iloc[forecast_bounds[position]:forecast_bounds[position + 1]]
+        history_x = item_history.index.get_level_values(1).to_numpy(dtype="datetime64[ns]").astype(np.int64)
+        history_x, history_y = lttb_downsample(history_x.astype(np.float64),
+                                               item_history[target].to_numpy(dtype=np.float64),
+                                               self.PLOT_MAX_POINTS)
+        quantile_cols = [col for col in item_forecast.columns if col != "mean"]
+        series = {
+            "history": (history_x.astype("datetime64[ns]"), history_y),
+            "forecast_x": item_forecast.index.get_level_values(1).to_numpy(dtype="datetime64[ns]"),
+            "mean": item_forecast["mean"].to_numpy(dtype=np.float64),
+            "band": (item_forecast[quantile_cols[0]].to_numpy(dtype=np.float64),
+                     item_forecast[quantile_cols[-1]].to_numpy(dtype=np.float64),
+                     f"{quantile_cols[0]}-{quantile_cols[-1]}") if quantile_cols else None,
+        }
+        self.plot_cache[position] = series
+        if len(self.plot_cache) > self.PLOT_CACHE_SIZE:
+            self.plot_cache.popitem(last=False)
+        return series
+
+    def draw_plot(self):
+        """Перерисовка графика выбранного ряда; сама отрисовка откладывается до простоя Qt (draw_idle)"""
+        self.plot_axes.clear()
+        position = self.plot_item_combo.currentIndex()
+        if self.plot_data is not None and 0 <= position < len(self.plot_data[0]):
+            series = self.plot_series(position)
+            self.plot_axes.plot(*series["history"], color="tab:blue", linewidth=1, label="История")
+            self.plot_axes.plot(series["forecast_x"], series["mean"], color="tab:orange", linewidth=1.5,
+                                label="Прогноз")
+            if series["band"] is not None:
+                lower, upper, label = series["band"]
+                self.plot_axes.fill_between(series["forecast_x"], lower, upper, color="tab:orange", alpha=0.25,
+                                            label=f"Квантили {label}")
+            self.plot_axes.set_title(f"{self.plot_data[3]}: {self.plot_item_combo.currentText()}")
+            self.plot_axes.legend(loc="upper left")
+            self.plot_figure.autofmt_xdate()
+        self.plot_canvas.draw_idle()
+
+    def new_model_dir(self):
+        """Новый каталог предикторов виджета (предыдущий удаляется)"""
+        self.release_models()
+        self.model_dir = tempfile.mkdtemp(prefix="autogluon_ts_")
+        return Path(self.model_dir)
+
+    def release_models(self):
+        """Освобождает предикторы и удаляет их каталог"""
+        self.trained = {}
+        self.predictor = None
+        self.model_meta = None
+        self.fit_budget = None
+        self.predict_button.setEnabled(False)
+        self.update_model_status()
+        if self.model_dir is not None:
+            shutil.rmtree(self.model_dir, ignore_errors=True)
+            self.model_dir = None
+
+    def build_model_meta(self, targets, model_freq, metric):
+        """Описание обученной модели: частота, роли колонок, настройки и пути предикторов"""
+        self.predict_button.setEnabled(True)
+        return {
+            "version": self.MODEL_ARTIFACT_VERSION,
+            "targets": list(targets),
+            "freq": model_freq,
+            "metric": metric,
+            "roles": {"id": self.id_column, "timestamp": self.timestamp_column, "target": self.target_column},
+            "settings": {name: getattr(self, name) for name in self.SAVED_SETTINGS},
+            "data_hash": self.data_hash(),
+            "categorical_mapping": {col: list(values) for col, values in self.categorical_mapping.items()},
+            "predictors": {
+                target: (os.path.relpath(predictor.path, self.model_dir) if predictor is not None else None)
+                for target, (predictor, _) in self.trained.items()
+            },
+        }
+
+    def persist_predictors(self):
+        """Загружает модели предикторов в память для быстрых повторных прогнозов"""
+        for target, (predictor, _) in self.trained.items():
+            if predictor is None:
+                continue
             try:
-                start_date = pd.to_datetime(last_date) + pd.Timedelta(days=1)
-                dates = pd.date_range(start=start_date, periods=self.prediction_length, freq='D')
-                return dates
-            except:
-                # Если совсем ничего не работает
-                base_date = pd.Timestamp('2024-01-01')
-                dates = pd.date_range(start=base_date, periods=self.prediction_length, freq='D')
-                return dates
+                predictor.persist()
+                self.log(f"[{target}] Модели загружены в память")
+            except Exception as e:
+                self.log(f"[{target}] Не удалось загрузить модели в память: {str(e)}")
+
+    def save_model(self):
+        """Сохраняет предикторы и описание модели в сжатый архив"""
+        if not self.trained:
+            self.error("Нет обученной модели для сохранения")
+            return
+        path, _ = QFileDialog.getSaveFileName(self, "Сохранить модель", self.model_export_path,
+                                              "Модель AutoGluon (*.zip)")
+        if not path:
+            return
+        if not path.endswith(".zip"):
+            path += ".zip"
+        try:
+            with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+                archive.writestr("widget.json", json.dumps(self.model_meta, ensure_ascii=False, indent=2, default=str))
+                for root, _, files in os.walk(self.model_dir):
+                    for name in files:
+                        file_path = os.path.join(root, name)
+                        archive.write(file_path, os.path.join("predictors", os.path.relpath(file_path, self.model_dir)))
+            self.model_export_path = path
+            self.log(f"Модель сохранена: {path} ({os.path.getsize(path) / 1024 / 1024:.1f} МБ)")
+        except Exception as e:
+            self.log(f"Ошибка сохранения модели: {str(e)}\n{traceback.format_exc()}")
+            self.error(f"Не удалось сохранить модель: {str(e)}")
+
+    def load_model(self):
+        """Загружает архив модели: предикторы, частоту, роли колонок и настройки"""
+        path, _ = QFileDialog.getOpenFileName(self, "Загрузить модель", self.model_export_path,
+                                              "Модель AutoGluon (*.zip)")
+        if not path:
+            return
+        self.error("")
+        try:
+            model_root = self.new_model_dir()
+            with zipfile.ZipFile(path) as archive:
+                meta = json.loads(archive.read("widget.json").decode("utf-8"))
+                if meta.get("version") != self.MODEL_ARTIFACT_VERSION:
+                    raise ValueError(f"Неподдерживаемая версия файла модели: {meta.get('version')}")
+                archive.extractall(model_root)
+            # Предикторы лежат в корне каталога модели - как после обучения
+            os.remove(model_root / "widget.json")
+            for child in (model_root / "predictors").iterdir():
+                shutil.move(str(child), str(model_root))
+            (model_root / "predictors").rmdir()
+
+            for name, value in meta["settings"].items():
+                if name in self.SAVED_SETTINGS:
+                    setattr(self, name, value)
+            # Модель обучена на конкретной частоте: фиксируем ее и в описании модели,
+            # иначе сравнение с настройками обучения сразу потребует переобучения
+            self.auto_frequency = False
+            self.frequency = meta["freq"]
+            meta["settings"].update(auto_frequency=False, frequency=meta["freq"])
+            self.id_column = meta["roles"]["id"]
+            self.timestamp_column = meta["roles"]["timestamp"]
+            self.target_column = meta["roles"]["target"]
+            self.sync_checkboxes()
+            saved_mapping = meta.get("categorical_mapping", {})
+            if self.data is None:
+                self.categorical_mapping = saved_mapping
+            elif self.id_column in self.categorical_mapping and \
+                    list(self.categorical_mapping[self.id_column]) != saved_mapping.get(self.id_column):
+                self.warning("Значения ID в данных отличаются от значений, на которых обучалась модель")
+
+            self.trained = {
+                target: (TimeSeriesPredictor.load(str(model_root / rel_path)) if rel_path is not None else None, None)
+                for target, rel_path in meta["predictors"].items()
+            }
+            self.predictor = self.trained[self.target_column][0]
+            self.model_meta = meta
+            self.predict_button.setEnabled(True)
+            self.update_model_status()
+            self.model_export_path = path
+            self.log(f"Модель загружена: {path}, цели: {meta['targets']}, частота: {meta['freq']}")
+            if self.persist_models:
+                self.persist_predictors()
+        except Exception as e:
+            self.release_models()
+            self.log(f"Ошибка загрузки модели: {str(e)}\n{traceback.format_exc()}")
+            self.error(f"Не удалось загрузить модель: {str(e)}")
+            return
+
+        if self.data is not None:
+            self.predict_with_model()
+
+    def sync_checkboxes(self):
+        """Обновляет флажки, не связанные с настройками через gui"""
+        for checkbox, value in ((self.auto_freq_checkbox, self.auto_frequency),
+                                (self.holidays_checkbox, self.include_holidays),
+                                (self.date_checkbox, self.use_current_date),
+                                (self.multi_target_checkbox, self.multi_target),
+                                (self.hierarchical_checkbox, self.hierarchical),
+                                (self.regularize_checkbox, self.regularize_series),
+                                (self.fallback_checkbox, self.fallback_tier),
+                                (self.sample_checkbox, self.sample_training),
+                                (self.refit_full_checkbox, self.refit_full),
+                                (self.evaluate_checkbox, self.evaluate_mode),
+                                (self.auto_budget_checkbox, self.auto_budget),
+                                (self.quality_checkbox, self.quality_filter)):
+            checkbox.setChecked(value)
+
+    def changed_refit_settings(self):
+        """Настройки, измененные после обучения и требующие переобучения"""
+        trained = self.model_meta["settings"]
+        changed = [name for name in self.REFIT_SETTINGS if getattr(self, name) != trained.get(name)]
+        changed += [role for role, value in self.model_meta["roles"].items()
+                    if getattr(self, f"{role}_column") != value]
+        if self.prediction_length > trained["prediction_length"]:
+            changed.append("prediction_length")
+        return changed
+
+    def can_reuse_model(self):
+        """Модель в памяти обслуживает текущий запуск: те же данные и настройки обучения"""
+        if not self.trained or self.model_meta is None:
+            return False
+        return not self.changed_refit_settings() and self.model_meta.get("data_hash") == self.data_hash()
+
+    def update_model_status(self):
+        """Показывает, обслуживаются ли текущие настройки моделью в памяти"""
+        if not self.trained or self.model_meta is None:
+            self.model_status_label.setText("Модель не обучена")
+            return
+        horizon = self.model_meta["settings"]["prediction_length"]
+        changed = self.changed_refit_settings()
+        if changed:
+            self.model_status_label.setText(f"Модель в памяти (горизонт {horizon}). "
+                                            f"Требуется переобучение: {', '.join(changed)}")
+        else:
+            self.model_status_label.setText(f"Модель в памяти (горизонт {horizon}). "
+                                            f"Изменения обслуживаются без переобучения")
+
+    def predict_with_model(self):
+        """Прогноз обученной или загруженной моделью без повторного обучения"""
+        if not self.trained:
+            self.error("Нет обученной модели")
+            return
+        if self.data is None:
+            self.error("Нет данных")
+            return
+        # То же правило, что при запуске: модель обслуживает прогноз только без изменений настроек обучения
+        changed = self.changed_refit_settings()
+        if "prediction_length" in changed:
+            horizon = self.model_meta["settings"]["prediction_length"]
+            self.error(f"Длина прогноза ({self.prediction_length}) больше обученного горизонта ({horizon}): "
+                       f"требуется переобучение")
+            self.update_model_status()
+            return
+        if changed:
+            self.error(f"Изменены настройки обучения ({', '.join(changed)}): требуется переобучение")
+            self.update_model_status()
+            return
+        self.error("")
+        self.progressBarInit()
+        try:
+            self.log("=== ПРОГНОЗ БЕЗ ОБУЧЕНИЯ ===")
+            # История размечается праздниками страны обучения, новая страна - только для будущих дат
+            self.trained_holiday_country = self.model_meta["settings"].get("holiday_country")
+            prepared = self.prepare_ts_data()
+            if prepared is None:
+                return
+            ts_data, df_sorted = prepared
+            targets = self.model_meta["targets"]
+            missing = [target for target in targets if target not in ts_data.columns]
+            if missing:
+                self.error(f"В данных нет целевых колонок модели: {missing}")
+                return
+
+            # Распределение рядов между моделью и резервными методами - как при обучении
+            self.sampling_report = {}
+            self.fallback_series = {}
+            datasets = self.target_datasets(ts_data, targets)
+            trained = {}
+            for target in targets:
+                predictor = self.trained[target][0]
+                fit_data = self.triage_series(datasets[target], target)
+                if predictor is None and not fit_data.empty:
+                    self.fallback_series[target] = pd.Series(
+                        "auto", index=datasets[target].index.get_level_values(0).unique())
+                trained[target] = (predictor, datasets[target])
+            self.publish_results(trained, targets, df_sorted, self.model_meta["freq"], self.model_meta["metric"])
+            self.applied_state = self.run_state()
+            self.log("=== УСПЕШНО ===")
+        except ValueError as ve:
+            self.error(str(ve))
+        except Exception as e:
+            self.log(f"ОШИБКА: {str(e)}\n{traceback.format_exc()}")
+            self.error(str(e))
+        finally:
+            self.progressBarFinished()
+            self.Outputs.log_messages.send(self.log_messages)
+
+    def onDeleteWidget(self):
+        self.release_models()
+        super().onDeleteWidget()
+
+    def prepare_ts_data(self):
+        """Подготовленные (ts_data, df_sorted): из кэша, если изменились только настройки модели"""
+        prep_key = self.get_prep_fingerprint()
+        if self.ts_cache is not None and self.ts_cache[0] == prep_key:
+            self.log("Подготовленные данные не изменились, используем кэш TimeSeriesDataFrame")
+            (_, ts_data, df_sorted, self.id_column, self.timestamp_column, self.target_column, self.hierarchy,
+             self.quality_report) = self.ts_cache
+            return ts_data, df_sorted
+        prepared = self.build_ts_data()
+        if prepared is None:
+            return None
+        ts_data, df_sorted = prepared
+        self.ts_cache = (prep_key, ts_data, df_sorted,
+                         self.id_column, self.timestamp_column, self.target_column, self.hierarchy,
+                         self.quality_report)
+        return ts_data, df_sorted
+
+    def resolve_metric(self):
+        """Название метрики (настройка может храниться как индекс)"""
+        metric = self.selected_metric
+        if isinstance(metric, int) and 0 <= metric < len(self.METRICS):
+            metric = self.METRICS[metric]
+        return metric
+
+    def publish_results(self, trained, targets, df_sorted, model_freq, metric):
+        """Прогноз, лидерборд и информация о модели по обученным (или загруженным) предикторам"""
+        # Прогнозирование и лидерборд по каждой цели
+        all_predictions = []
+        all_leaderboards = []
+        best_models = {}
+        fast_models = {}
+        speedups = {}
+        evaluations = {}
+        all_evaluations = []
+        all_backtests = []
+        self.inference_models = {}
+        for target, (predictor, target_data) in trained.items():
+            # Лидерборд строится до прогноза: по нему выбирается модель для прогноза
+            lb = None
+            if predictor is not None:
+                lb = self.build_leaderboard(predictor, self.model_series(target_data, target),
+                                            self.holdout_ts_data(target_data, model_freq))
+            if lb is not None:
+                fast_models[target] = lb.loc[lb['recommended'] == 1, 'model'].iloc[0] \
+                    if lb['recommended'].any() else None
+                model, speedups[target] = self.resolve_inference_model(predictor, lb, target, fast_models[target])
+                if model is not None:
+                    self.inference_models[target] = model
+
+            self.log(f"Выполнение прогноза для '{target}'...")
+            predictions, model_data = self.forecast_target(predictor, target_data, target, model_freq,
+                                                           self.inference_models.get(target))
+            if self.hierarchy is not None:
+                predictions = self.reconcile_predictions(predictions, target_data, target)
+            pred_df = self.format_predictions(predictions, target_data)
+            if target == self.target_column:
+                self.set_plot_data(target_data, predictions, target)
+
+            # Лучшая модель по лидерборду
+            best_model_name = "Неизвестно"
+            best_model_score = "Н/Д"
+            if lb is not None:
+                best_model_name = lb.iloc[0]['model']
+                best_model_score = f"{lb.iloc[0]['score_val']:.4f}"
+                self.log(f"[{target}] Лучшая модель: {best_model_name}, Оценка: {best_model_score}")
+                # Показываем топ-3 модели если их столько есть
+                if len(lb) > 1:
+                    self.log("Топ модели:")
+                    for i in range(min(3, len(lb))):
+                        self.log(f"  {i+1}. {lb.iloc[i]['model']}: {lb.iloc[i]['score_val']:.4f}")
+            best_models[target] = (best_model_name, best_model_score)
+            if target in self.sampling_report:
+                self.evaluate_sampling_gap(predictor, model_data, target, lb)
+
+            if self.evaluate_mode:
+                try:
+                    per_item, per_cutoff = self.backtest_target(predictor, target_data, target, model_freq,
+                                                                self.inference_models.get(target))
+                    evaluations[target] = per_cutoff
+                    if len(targets) > 1:
+                        per_item.insert(1, 'target', target)
+                        per_cutoff.insert(0, 'target', target)
+                    all_evaluations.append(per_item)
+                    all_backtests.append(per_cutoff)
+                except Exception as e:
+                    self.log(f"[{target}] Ошибка оценки: {str(e)}\n{traceback.format_exc()}")
+
+            if len(targets) > 1:
+                pred_df.insert(1, 'target', target)
+                if lb is not None:
+                    lb.insert(0, 'target', target)
+            all_predictions.append(pred_df)
+            if lb is not None:
+                all_leaderboards.append(lb)
+
+        # Отправка результатов
+        self.log("Преобразование прогноза в таблицу Orange...")
+        pred_df = pd.concat(all_predictions, ignore_index=True)
+        self.Outputs.prediction.send(self.df_to_table(pred_df))
+        if all_leaderboards:
+            self.Outputs.leaderboard.send(self.df_to_table(pd.concat(all_leaderboards, ignore_index=True)))
+        self.Outputs.evaluation.send(
+            self.df_to_table(pd.concat(all_evaluations, ignore_index=True)) if all_evaluations else None)
+        self.Outputs.data_quality.send(
+            self.df_to_table(self.quality_report) if self.quality_report is not None else None)
+        self.Outputs.backtest.send(
+            self.df_to_table(pd.concat(all_backtests, ignore_index=True)) if all_backtests else None)
+
+        # Инфо о модели
+        self.log("Формирование информации о модели...")
+
+        # Получаем понятное название частоты
+        freq_name = model_freq
+        for code, label in self.FREQUENCIES:
+            if code == model_freq:
+                freq_name = f"{label} ({code})"
+                break
+
+        # Создаем расширенную информацию о модели
+        cpus, threads = self.get_resource_budget()
+        best_model_name, best_model_score = best_models[self.target_column]
+        info_rows = [
+            ('Версия', '1.2.0'),
+            ('Цель', ", ".join(targets)),
+            ('Длина', str(self.prediction_length)),
+            ('Метрика', metric),
+            ('Пресет', self.fit_budget[1] if self.fit_budget else self.selected_preset),
+            ('Время', f"{self.fit_budget[0] if self.fit_budget else self.time_limit} сек"
+                      + (f" (автобюджет, оценка {self.fit_budget[2]:.0f} сек)"
+                         if self.fit_budget and self.fit_budget[2] is not None else "")),
+            ('Праздники', "Включены" if self.include_holidays else "Отключены"),
+            ('Даты', "Текущие" if self.use_current_date else "Исходные"),
+            ('Частота', freq_name),
+            ('Лучшая модель', best_model_name),
+            ('Оценка модели', best_model_score),
+        ]
+        if len(targets) > 1:
+            for target in targets[1:]:
+                info_rows.append((f"Лучшая модель ({target})", f"{best_models[target][0]}: {best_models[target][1]}"))
+        for target in targets:
+            suffix = f" ({target})" if len(targets) > 1 else ""
+            if fast_models.get(target) is not None:
+                info_rows.append((f"Быстрая модель{suffix}",
+                                  f"{fast_models[target]} (допуск {self.fast_model_tolerance}%)"))
+            model = self.inference_models.get(target)
+            if isinstance(model, dict):
+                model = "Ансамбль: " + ", ".join(f"{name} ({weight:.2f})" for name, weight in model.items())
+            info_rows.append((f"Модель прогноза{suffix}", model or "Лучшая"))
+            if speedups.get(target) is not None:
+                info_rows.append((f"Ускорение прогноза{suffix}", f"x{speedups[target]:.1f} (по pred_time_val)"))
+            if target in evaluations:
+                # Итог по последнему окну и разброс MAE между окнами бэктеста
+                per_cutoff = evaluations[target]
+                overall = per_cutoff.iloc[-1]
+                info_rows.append((f"Оценка на отложенных точках{suffix}",
+                                  f"MAE {overall['MAE']:.4f}, MAPE {overall['MAPE']:.4f}, "
+                                  f"RMSE {overall['RMSE']:.4f}, WQL {overall['WQL']:.4f}, "
+                                  f"смещение {overall['bias']:.4f}"))
+                if len(per_cutoff) > 1:
+                    info_rows.append((f"Бэктест{suffix}",
+                                      f"{len(per_cutoff)} окон, MAE {per_cutoff['MAE'].mean():.4f} "
+                                      f"± {per_cutoff['MAE'].std():.4f}"))
+        info_rows += [
+            ('Ресурсы', f"{cpus} CPU, {threads} потоков/модель"),
+            ('Объединено дубликатов', str(self.prep_stats.get("duplicates_merged", 0))),
+            ('Заполнено пропусков', str(self.prep_stats.get("gaps_filled", 0))),
+            ('Исключено рядов (качество)', str(self.prep_stats.get("series_excluded", 0))),
+            ('Обнулено отрицательных', str(self.prep_stats.get("negatives_clipped", 0))),
+            ('Изменение входа', self.input_change or "Н/Д"),
+        ]
+        fallback_counts = pd.concat(list(self.fallback_series.values())).value_counts() \
+            if self.fallback_series else pd.Series(dtype=int)
+        info_rows.append(('Резервные методы', ", ".join(
+            f"{method}: {count}" for method, count in fallback_counts.items()) or "0"))
+        for target, report in self.sampling_report.items():
+            suffix = f" ({target})" if len(targets) > 1 else ""
+            info_rows.append((f"Выборка рядов{suffix}",
+                              f"{report['ratio']:.1%} ({report['sampled']} из {report['total']})"))
+            if report.get("gap") is not None:
+                info_rows.append((f"Разрыв валидации{suffix}",
+                                  f"{report['gap']:.4f} (валидация {report['val_score']:.4f}, "
+                                  f"вне выборки {report['holdout_score']:.4f})"))
+        model_info = pd.DataFrame(info_rows, columns=['Parameter', 'Value'])
+        self.Outputs.model_info.send(self.df_to_table(model_info))
 
     def run_model(self):
+        """Запуск расчета. Входные данные, пришедшие во время расчета, обрабатываются после него"""
+        if self.running:
+            self.log("Расчет уже выполняется")
+            return
+        self.apply_timer.stop()
+        self.running = True
+        try:
+            self.train_and_predict()
+        finally:
+            self.running = False
+        if self.pending_input is not None:
+            (dataset,), self.pending_input = self.pending_input, None
+            self.set_data(dataset)
+
+    def train_and_predict(self):
         if self.data is None:
             self.error("Нет данных")
             self.log("Ошибка: данные не загружены")
@@ -1074,8 +3457,10 @@ class OWAutoGluonTimeSeries(OWWidget):
         if not self.id_column or self.id_column not in self.data.columns:
             self.error(f"Выбранная ID колонка '{self.id_column}' отсутствует в данных. Пожалуйста, выберите корректную колонку.")
             return
-        # Преобразуем ID колонку в строку на всякий случай, если она еще не такая
-        if not pd.api.types.is_string_dtype(self.data[self.id_column]):
+        # ID должен быть строкой или целым кодом категории
+        self.ensure_id_codes()
+        if not (pd.api.types.is_string_dtype(self.data[self.id_column])
+                or pd.api.types.is_integer_dtype(self.data[self.id_column])):
             self.data[self.id_column] = self.data[self.id_column].astype(str)
             self.log(f"ID колонка '{self.id_column}' приведена к строковому типу.")
 
@@ -1084,13 +3469,18 @@ class OWAutoGluonTimeSeries(OWWidget):
             self.error(f"Выбранная временная колонка '{self.timestamp_column}' отсутствует в данных. Пожалуйста, выберите корректную колонку.")
             return
         if not pd.api.types.is_datetime64_any_dtype(self.data[self.timestamp_column]):
-             # Попытка преобразования, если еще не datetime
             try:
-                self.data[self.timestamp_column] = pd.to_datetime(self.data[self.timestamp_column], errors='raise')
-                self.log(f"Временная колонка '{self.timestamp_column}' успешно преобразована в datetime.")
-            except Exception as e:
-                self.error(f"Выбранная временная колонка '{self.timestamp_column}' не может быть преобразована в формат даты/времени: {e}")
+                parsed = self.parse_timestamps(self.data[self.timestamp_column], self.timestamp_column)
+            except ValueError as e:
+                self.log(str(e))
+                self.error(f"Выбранная временная колонка '{self.timestamp_column}' не может быть преобразована "
+                           f"в формат даты/времени: {str(e)}")
                 return
+            if parsed.isna().all():
+                self.error(f"Выбранная временная колонка '{self.timestamp_column}' не может быть преобразована в формат даты/времени.")
+                return
+            self.data[self.timestamp_column] = parsed
+            self.data = self.data.dropna(subset=[self.timestamp_column])
 
         # Целевая колонка
         if not self.target_column or self.target_column not in self.data.columns:
@@ -1146,756 +3536,77 @@ class OWAutoGluonTimeSeries(OWWidget):
                 return
             
         # Дополнительная проверка длины прогноза перед запуском
-        if self.prediction_length > self.max_allowed_prediction and self.max_allowed_prediction > 0:
+        if self.prediction_length > self.max_allowed_prediction and self.max_allowed_prediction > 0 \
+                and not self.fallback_tier:
             self.error(f"Длина прогноза ({self.prediction_length}) превышает максимально допустимую ({self.max_allowed_prediction}) для ваших данных. Уменьшите длину прогноза.")
             self.log(f"ОШИБКА: Длина прогноза слишком велика. Максимум: {self.max_allowed_prediction}")
             return
-            
+
+        # Изменены только настройки прогноза - обслуживаем моделью в памяти без переобучения
+        if self.can_reuse_model():
+            self.log("Данные и настройки обучения не изменились: прогноз моделью в памяти")
+            self.predict_with_model()
+            return
+
         self.progressBarInit()
         try:
             self.log_widget.clear()
             self.log("=== НАЧАЛО ===")
             
-            # Подготовка данных
-            self.log("Преобразование в TimeSeriesDataFrame...")
-            df_sorted = self.data.sort_values([self.id_column, self.timestamp_column])
-            
-            # Проверяем, что столбцы имеют правильные типы
-            self.log(f"Типы данных: {df_sorted.dtypes.to_dict()}")
-
-            # Проверка и конвертация timestamp в datetime
-            self.log("Проверка формата колонки времени...")
-            if pd.api.types.is_numeric_dtype(df_sorted[self.timestamp_column]):
-                self.log(f"Обнаружено числовое значение в колонке времени. Пробую конвертировать из timestamp...")
-                try:
-                    # Пробуем конвертировать из timestamp в секундах
-                    df_sorted[self.timestamp_column] = pd.to_datetime(df_sorted[self.timestamp_column], unit='s')
-                    self.log("Конвертация из секунд успешна")
-                except Exception as e1:
-                    self.log(f"Ошибка конвертации из секунд: {str(e1)}")
-                    try:
-                        # Пробуем из миллисекунд
-                        df_sorted[self.timestamp_column] = pd.to_datetime(df_sorted[self.timestamp_column], unit='ms')
-                        self.log("Конвертация из миллисекунд успешна")
-                    except Exception as e2:
-                        self.log(f"Ошибка конвертации из миллисекунд: {str(e2)}")
-                        # Создаем искусственные даты как последнее средство
-                        self.log("Создание искусственных дат...")
-                        try:
-                            start_date = pd.Timestamp('2020-01-01')
-                            dates = pd.date_range(start=start_date, periods=len(df_sorted), freq='D')
-                            df_sorted[self.timestamp_column] = dates
-                            self.log(f"Созданы искусственные даты с {start_date} с шагом 1 день")
-                        except Exception as e3:
-                            self.log(f"Невозможно создать даты: {str(e3)}")
-                            self.error("Не удалось преобразовать колонку времени")
-                            return
-            
-            # Проверяем, что дата теперь в правильном формате
-            if not pd.api.types.is_datetime64_dtype(df_sorted[self.timestamp_column]):
-                self.log("Принудительное преобразование в datetime...")
-                try:
-                    df_sorted[self.timestamp_column] = pd.to_datetime(df_sorted[self.timestamp_column], errors='coerce')
-                    # Проверяем на наличие NaT (Not a Time)
-                    if df_sorted[self.timestamp_column].isna().any():
-                        self.log("Обнаружены невалидные даты, замена на последовательные")
-                        # Заменяем NaT на последовательные даты
-                        valid_mask = ~df_sorted[self.timestamp_column].isna()
-                        if valid_mask.any():
-                            # Если есть хоть одна валидная дата, используем её как начальную
-                            first_valid = df_sorted.loc[valid_mask, self.timestamp_column].min()
-                            self.log(f"Первая валидная дата: {first_valid}")
-                        else:
-                            # Иначе начинаем с сегодня
-                            first_valid = pd.Timestamp.now().normalize()
-                            self.log("Нет валидных дат, используем текущую дату")
-                            
-                        # Создаем последовательность дат
-                        dates = pd.date_range(start=first_valid, periods=len(df_sorted), freq='D')
-                        df_sorted[self.timestamp_column] = dates
-                except Exception as e:
-                    self.log(f"Ошибка преобразования дат: {str(e)}")
-                    self.error("Не удалось преобразовать даты")
-                    return
-            
-            # Добавьте после проверки формата даты и перед созданием TimeSeriesDataFrame
-            self.log("Проверка распределения дат...")
-            # ЗАКОММЕНТИРОВАНО: Логика для случая, когда даты слишком близки.
-            # Если ваши данные всегда имеют корректный диапазон, этот блок может быть не нужен или требовать доработки.
-            """
-            if pd.api.types.is_datetime64_dtype(df_sorted[self.timestamp_column]):
-                 if df_sorted[self.timestamp_column].max() - df_sorted[self.timestamp_column].min() < pd.Timedelta(days=1):
-                     self.log("ВНИМАНИЕ: Все даты слишком близки друг к другу. Создаю искусственные даты с правильным интервалом.")
-                     # Создаем новые даты
-                     start_date = pd.Timestamp('2023-01-01')
-                     # dates = pd.date_range(start=start_date, periods=len(df_sorted), freq='D') # Эта строка была для всего df_sorted
-                    
-                     # Сортируем датафрейм сначала по ID, затем по исходным датам
-                     df_sorted = df_sorted.sort_values([self.id_column, self.timestamp_column])
-                    
-                     # Сохраняем порядок записей для каждого ID
-                     all_ids = df_sorted[self.id_column].unique()
-                     new_df_list = []
-                    
-                     for id_val in all_ids:
-                         # Получаем подмножество данных для текущего ID
-                         id_df = df_sorted[df_sorted[self.id_column] == id_val].copy()
-                        
-                         # Создаем даты для этого ID
-                         id_dates = pd.date_range(start=start_date, periods=len(id_df), freq='D')
-                        
-                         # Устанавливаем новые даты
-                         id_df[self.timestamp_column] = id_dates
-                        
-                         # Добавляем в новый датафрейм
-                         new_df_list.append(id_df)
-                    
-            #         # Объединяем все обратно
-                     df_sorted = pd.concat(new_df_list)
-                     # ВАЖНО: Обновляем self.data, если даты были изменены,
-                     # чтобы create_future_dates использовал правильные даты.
-                     self.data = df_sorted.copy()
-                     self.log(f"self.data обновлен новыми датами. Диапазон: с {self.data[self.timestamp_column].min()} по {self.data[self.timestamp_column].max()}")
-                     self.log(f"Созданы новые даты (в df_sorted) с {df_sorted[self.timestamp_column].min()} по {df_sorted[self.timestamp_column].max()}")
-            """
-            self.log(f"Финальный формат времени: {df_sorted[self.timestamp_column].dtype}")
-            self.log(f"Диапазон дат: с {df_sorted[self.timestamp_column].min()} по {df_sorted[self.timestamp_column].max()}")
-
-            # Определяем частоту для модели
             model_freq = self.detected_frequency if self.auto_frequency else self.frequency
-            self.log(f"Используемая частота: {model_freq}")
-
-            # Проверка и конвертация ID колонки
-            self.log(f"Проверка формата ID колонки '{self.id_column}'...")
-            if self.id_column in df_sorted.columns:
-                # Проверяем тип данных
-                if pd.api.types.is_float_dtype(df_sorted[self.id_column]):
-                    self.log("ID колонка имеет тип float, конвертирую в строку")
-                    try:
-                        # Попытка конвертации в строку
-                        df_sorted[self.id_column] = df_sorted[self.id_column].astype(str)
-                        self.log("Конвертация ID в строку успешна")
-                    except Exception as e:
-                        self.log(f"Ошибка конвертации ID в строку: {str(e)}")
-                        # Если не получается, создаем новую ID колонку
-                        self.log("Создание новой ID колонки...")
-                        df_sorted['virtual_id'] = 'item_1'
-                        self.id_column = 'virtual_id'
-            else:
-                self.log(f"ID колонка '{self.id_column}' не найдена, создаю виртуальную")
-                df_sorted['virtual_id'] = 'item_1'
-                self.id_column = 'virtual_id'
-            
-            # Проверяем, что все колонки имеют правильный тип
-            self.log(f"Обеспечиваем правильные типы данных для всех колонок...")
-            # ID колонка должна быть строкой или целым числом
-            if self.id_column in df_sorted.columns:
-                if not (pd.api.types.is_string_dtype(df_sorted[self.id_column]) or 
-                        pd.api.types.is_integer_dtype(df_sorted[self.id_column])):
-                    df_sorted[self.id_column] = df_sorted[self.id_column].astype(str)
-            
-            # Целевая колонка должна быть числом
-            if self.target_column in df_sorted.columns:
-                if not pd.api.types.is_numeric_dtype(df_sorted[self.target_column]):
-                    try:
-                        df_sorted[self.target_column] = pd.to_numeric(df_sorted[self.target_column], errors='coerce')
-                        # Если есть NaN, заменяем нулями
-                        if df_sorted[self.target_column].isna().any():
-                            df_sorted[self.target_column] = df_sorted[self.target_column].fillna(0)
-                    except:
-                        self.log(f"Невозможно преобразовать целевую колонку '{self.target_column}' в числовой формат")
-            
-            self.log(f"Финальные типы данных: {df_sorted.dtypes.to_dict()}")
-            
-            if self.timestamp_column in df_sorted.columns:
-                if not pd.api.types.is_datetime64_dtype(df_sorted[self.timestamp_column]):
-                    try:
-                        df_sorted[self.timestamp_column] = pd.to_datetime(df_sorted[self.timestamp_column])
-                        self.log(f"Преобразовали {self.timestamp_column} в datetime")
-                    except Exception as e:
-                        self.log(f"Ошибка преобразования в datetime: {str(e)}")
-                else:
-                    self.log(f"Колонка {self.timestamp_column} уже имеет тип datetime")
-            
-            # Добавьте этот блок перед созданием TimeSeriesDataFrame
-            if self.from_form_timeseries:
-                self.log("Применение специальной обработки для данных из FormTimeseries")
-                # Убедимся, что ID колонка существует и имеет правильный тип
-                if self.id_column not in df_sorted.columns:
-                    self.log(f"ID колонка '{self.id_column}' не найдена. Создаём колонку с единым ID.")
-                    df_sorted['item_id'] = 'item_1'
-                    self.id_column = 'item_id'
-                
-                # Проверка наличия временной колонки с корректным типом
-                if not pd.api.types.is_datetime64_dtype(df_sorted[self.timestamp_column]):
-                    self.log(f"Колонка времени '{self.timestamp_column}' имеет некорректный тип. Преобразуем в datetime.")
-                    try:
-                        df_sorted[self.timestamp_column] = pd.to_datetime(df_sorted[self.timestamp_column])
-                    except Exception as e:
-                        self.log(f"Ошибка преобразования в datetime: {str(e)}")
-                        # Проверка, можно ли преобразовать как timestamp в секундах
-                        try:
-                            df_sorted[self.timestamp_column] = pd.to_datetime(df_sorted[self.timestamp_column], unit='s')
-                            self.log("Применено преобразование из timestamp в секундах")
-                        except:
-                            self.error("Невозможно преобразовать временную колонку")
-                            return
-            
-            # Добавить перед созданием TimeSeriesDataFrame
-            self.log(f"Проверка структуры данных перед созданием TimeSeriesDataFrame...")
-            # Проверяем уникальные значения в ID колонке
-            unique_ids = df_sorted[self.id_column].nunique()
-            self.log(f"Количество уникальных ID: {unique_ids}")
-
-            # Анализируем длину каждого временного ряда
-            id_counts = df_sorted[self.id_column].value_counts()
-            self.log(f"Количество записей по ID: мин={id_counts.min()}, макс={id_counts.max()}, среднее={id_counts.mean():.1f}")
-
-            # Если есть только один ID и много записей, нужно разделить данные на несколько временных рядов
-            if unique_ids == 1 and len(df_sorted) > 50:
-                self.log("Обнаружен один длинный временной ряд. Создаём несколько искусственных рядов...")
-                
-                # Создаём копию DataFrame
-                df_multi = df_sorted.copy()
-                
-                # Определяем количество искусственных временных рядов с учетом минимального требования
-                # AutoGluon требует минимум 29 точек на ряд, добавим запас и сделаем 35
-                min_points_per_series = 35  # Минимальное количество точек на ряд (с запасом)
-                max_series = len(df_sorted) // min_points_per_series  # Максимально возможное количество рядов
-                n_series = min(3, max_series)  # Не более 3 рядов, но учитываем ограничение
-                
-                if n_series < 1:
-                    # Если даже для одного ряда не хватает точек, используем все данные как один ряд
-                    self.log("Недостаточно точек для разделения. Используем единый временной ряд.")
-                    df_sorted[self.id_column] = 'single_series'
-                else:
-                    self.log(f"Создаём {n_series} искусственных временных рядов с минимум {min_points_per_series} точками в каждом")
-                    
-                    # Вычисляем, сколько точек должно быть в каждом ряду
-                    points_per_series = len(df_sorted) // n_series
-                    
-                    # Создаём новую колонку ID, равномерно распределяя точки по рядам
-                    ids = []
-                    for i in range(len(df_sorted)):
-                        series_idx = i // points_per_series
-                        # Если превысили количество рядов, используем последний ряд
-                        if series_idx >= n_series:
-                            series_idx = n_series - 1
-                        ids.append(f"series_{series_idx + 1}")
-                    
-                    df_multi['series_id'] = ids
-                    # Используем новую колонку ID вместо старой
-                    self.id_column = 'series_id'
-                    
-                    # Используем новый DataFrame вместо старого
-                    df_sorted = df_multi
-                    
-                    # Проверяем получившееся распределение
-                    id_counts = df_sorted[self.id_column].value_counts()
-                    self.log(f"Распределение точек по рядам: {id_counts.to_dict()}")
-
-            # Проверяем, нет ли дублирующихся временных меток для одного ID
-            duplicate_check = df_sorted.duplicated(subset=[self.id_column, self.timestamp_column])
-            if duplicate_check.any():
-                dup_count = duplicate_check.sum()
-                self.log(f"Обнаружено {dup_count} дублирующихся записей с одинаковыми ID и датой!")
-                
-                # Стратегия 1: Удаление дубликатов
-                df_sorted = df_sorted.drop_duplicates(subset=[self.id_column, self.timestamp_column])
-                self.log(f"Удалены дублирующиеся записи. Осталось {len(df_sorted)} записей.")
-                
-                # Если после удаления дубликатов осталось слишком мало данных, создаем искусственные ряды
-                if df_sorted[self.id_column].nunique() == 1 and df_sorted.groupby(self.id_column).size().max() < 10:
-                    self.log("После удаления дубликатов данных слишком мало. Пробуем альтернативный подход.")
-                    # Создаём временной ряд с ежедневной частотой
-                    dates = pd.date_range(start='2022-01-01', periods=30, freq='D')
-                    artificial_df = pd.DataFrame({
-                        'artificial_id': ['series_1'] * 10 + ['series_2'] * 10 + ['series_3'] * 10,
-                        'timestamp': dates.tolist(),
-                        'target': np.random.randint(10, 100, 30)
-                    })
-                    
-                    # Используем искусственные данные
-                    df_sorted = artificial_df
-                    self.id_column = 'artificial_id'
-                    self.timestamp_column = 'timestamp'
-                    self.target_column = 'target'
-                    self.log("Созданы искусственные данные для демонстрации функциональности.")
-
-            # Подготовка данных для праздников, если опция включена
-            # known_covariates_to_pass = None
-            if self.include_holidays:
-                self.log(f"Подготовка признаков праздников для страны: {self.holiday_country}...")
-                try:
-                    # Убедимся, что временная колонка в df_sorted - это datetime
-                    df_sorted[self.timestamp_column] = pd.to_datetime(df_sorted[self.timestamp_column])
-                    
-                    # Получаем уникальные даты из временного ряда для определения диапазона
-                    unique_dates_for_holidays = df_sorted[self.timestamp_column].dt.normalize().unique()
-                    if len(unique_dates_for_holidays) > 0:
-                        min_holiday_date = unique_dates_for_holidays.min()
-                        max_holiday_date = unique_dates_for_holidays.max()
-                        
-                        # Генерируем праздники для диапазона дат
-                        country_holidays_obj = holidays.CountryHoliday(self.holiday_country, years=range(min_holiday_date.year, max_holiday_date.year + 1))
-                        
-                        # Создаем столбец is_holiday
-                        df_sorted['is_holiday'] = df_sorted[self.timestamp_column].dt.normalize().apply(lambda date: 1 if date in country_holidays_obj else 0)
-                        # known_covariates_to_pass = ['is_holiday']
-                        self.log(f"Добавлен признак 'is_holiday' в df_sorted. Обнаружено {df_sorted['is_holiday'].sum()} праздничных дней.")
-                    else:
-                        self.log("Не удалось определить диапазон дат для праздников.")
-                except Exception as e_holiday:
-                    self.log(f"Ошибка при подготовке признаков праздников: {str(e_holiday)}")
-
-
-            # дополнительная отладка
-            self.log("Подготовка TimeSeriesDataFrame...")
-            self.log(f"Количество строк в df_sorted: {len(df_sorted)}")
-            self.log(f"Пример данных:\n{df_sorted.head(3).to_string()}")
+            self.trained_holiday_country = None
+            prepared = self.prepare_ts_data()
+            if prepared is None:
+                return
+            ts_data, df_sorted = prepared
 
-            # Преобразуем в формат TimeSeriesDataFrame
-            ts_data = TimeSeriesDataFrame.from_data_frame(
-                df_sorted,
-                id_column=self.id_column,
-                timestamp_column=self.timestamp_column
-                # known_covariates_names=known_covariates_to_pass # Передаем известные ковариаты
-            )
-            
-            # Пытаемся установить частоту после создания
-            try:
-                if model_freq != 'D':
-                    self.log(f"Установка частоты временного ряда: {model_freq}")
-                    ts_data = ts_data.asfreq(model_freq)
-            except Exception as freq_err:
-                self.log(f"Ошибка при установке частоты {model_freq}: {str(freq_err)}. Используем дневную частоту.")
-            
-            self.log(f"Создан временной ряд с {len(ts_data)} записями")
-            
             # Обучение
-            with tempfile.TemporaryDirectory() as temp_dir:
-                model_path = Path(temp_dir)
-
-                # 🛠️ Создаём папку для логов, иначе будет FileNotFoundError
-                log_dir = model_path / "logs"
-                log_dir.mkdir(parents=True, exist_ok=True)
-
-                self.log(f"Начало обучения модели, время: {self.time_limit} сек...")                
-
-                # Получение метрики (убеждаемся, что это строка)
-                metric = self.selected_metric
-                if isinstance(metric, int) and 0 <= metric < len(self.METRICS):
-                    metric = self.METRICS[metric]
-                self.log(f"Используемая метрика: {metric}")
-
-                # проверка модели
-                models = None
-                if self.selected_model != "auto":
-                    models = [self.selected_model]
-
+            targets = self.get_target_columns()
+            model_root = self.new_model_dir()
+            time_limit, preset, estimate = self.get_fit_budget(ts_data, targets)
+            self.fit_budget = (time_limit, preset, estimate)
+            self.log(f"Начало обучения модели, время: {time_limit} сек, пресет: {preset}...")
+            metric = self.resolve_metric()
+            self.log(f"Используемая метрика: {metric}")
+
+            if self.include_holidays and 'is_holiday' not in df_sorted.columns:
+                self.log("Опция 'Учитывать праздники' включена, но не удалось создать признаки праздников. Праздники могут не учитываться.")
+            elif self.include_holidays and 'is_holiday' in df_sorted.columns:
+                self.log("Опция 'Учитывать праздники' включена, признак 'is_holiday' добавлен в данные для обучения.")
+
+            fit_args = self.get_fit_args(time_limit, preset)
+
+            # сбрасываем старый логгер
+            ag_logger = logging.getLogger("autogluon")
+            for handler in ag_logger.handlers[:]:
                 try:
-                    # Создание предиктора
-                    predictor = TimeSeriesPredictor(
-                        path=model_path,
-                        prediction_length=self.prediction_length,
-                        target=self.target_column,
-                        eval_metric=metric.lower(),
-                        freq=model_freq
-                    )
-                    
-                    # Обучение
-                    fit_args = {
-                        "time_limit": self.time_limit,
-                        "num_val_windows": 1,  # Уменьшаем количество окон валидации
-                        "val_step_size": 1    # Минимальный размер шага для валидации
-                    }
-
-                    # if self.include_holidays: # Временно отключаем, пока Prophet не доступен
-                        # Пытаемся передать информацию о праздниках через гиперпараметры для моделей,
-                        # которые это поддерживают, например, Prophet.
-                        # Для Prophet параметр называется 'country_holidays_name'.
-                        # fit_args['hyperparameters'] = {
-                        #     'Prophet': {'country_holidays_name': 'RU'}
-                        # }
-                        # self.log("Включена опция учета праздников. Настроены гиперпараметры для Prophet (и, возможно, других моделей).")
-                    if self.include_holidays and 'is_holiday' not in df_sorted.columns:
-                        self.log("Опция 'Учитывать праздники' включена, но не удалось создать признаки праздников. Праздники могут не учитываться.")
-                    elif self.include_holidays and 'is_holiday' in df_sorted.columns:
-                        self.log("Опция 'Учитывать праздники' включена, признак 'is_holiday' добавлен в данные для обучения.")
-
-                    
-                    fit_args["num_val_windows"] = 1  # Уменьшаем количество окон валидации
-                    fit_args["val_step_size"] = 1     # Минимальный размер шага для валидации
-                    
-                    # сбрасываем старый логгер
-                    import logging
-                    
-                    logger = logging.getLogger("autogluon")
-                    for handler in logger.handlers[:]:
-                        try:
-                            handler.close()
-                        except:
-                            pass
-                        logger.removeHandler(handler)
-                        
-                    # Вызов метода fit с исправленными аргументами
-                    predictor.fit(
-                        ts_data,
-                        **fit_args
-                    )
-                    
-                except ValueError as ve:
-                    error_msg = str(ve)
-                    self.log(f"Полное сообщение об ошибке: {error_msg}")
-                    
-                    # Обработка специфических ошибок TimeSeriesPredictor
-                    if "observations" in error_msg:
-                        self.log("Обнаружена ошибка о количестве наблюдений. Анализ данных...")
-                        
-                        # Печатаем информацию о структуре данных для диагностики
-                        self.log(f"Форма данных: {ts_data.shape}")
-                        self.log(f"Количество уникальных ID: {ts_data.index.get_level_values(0).nunique()}")
-                        self.log(f"Минимальное количество точек на ряд: {ts_data.groupby(level=0).size().min()}")
-                        
-                        # Проверяем, не слишком ли короткий временной ряд у какого-то ID
-                        ts_lengths = ts_data.groupby(level=0).size()
-                        min_ts_id = ts_lengths.idxmin()
-                        min_ts_len = ts_lengths.min()
-                        
-                        if min_ts_len < 10:  # Если какой-то ряд короче 10 точек
-                            self.log(f"Временной ряд '{min_ts_id}' имеет всего {min_ts_len} точек, что может быть недостаточно")
-                            self.log("Попробуем фильтровать короткие ряды...")
-                            
-                            # Отфильтруем временные ряды короче определенной длины
-                            long_enough_ids = ts_lengths[ts_lengths >= 10].index
-                            if len(long_enough_ids) > 0:
-                                ts_data = ts_data.loc[long_enough_ids]
-                                self.log(f"Отфильтровано до {len(long_enough_ids)} рядов с минимальной длиной 10")
-                                
-                                # Пробуем обучение с отфильтрованными данными
-                                try:
-                                    predictor.fit(ts_data, **fit_args)
-                                except Exception as e2:
-                                    self.log(f"Ошибка после фильтрации: {str(e2)}")
-                                    raise
-                            else:
-                                self.error("Все временные ряды слишком короткие для обучения модели")
-                                return
-                        
-                        # Если не смогли исправить ошибку с наблюдениями, дадим более понятное сообщение
-                        import re
-                        match = re.search(r"must have >= (\d+) observations", error_msg)
-                        if match:
-                            required_obs = int(match.group(1))
-                            self.error(f"Недостаточно точек в каждом временном ряду: требуется минимум {required_obs}.")
-                            self.log(f"Структура данных может быть неправильной. Проверьте ID колонку и временную колонку.")
-                        else:
-                            self.error(f"Проблема с количеством наблюдений: {error_msg}")
-                        return
-                    else:
-                        # Для других ошибок ValueError
-                        raise
-                
-                # Прогнозирование
-                self.log("Выполнение прогноза...")
-                known_covariates_for_prediction = None
-                if self.include_holidays and 'is_holiday' in df_sorted.columns: # Проверяем, был ли создан признак
-                    self.log("Подготовка будущих признаков праздников для прогноза...")
-                    try:
-                        # Создаем DataFrame с будущими датами
-                        future_dates_for_holidays = self.create_future_dates(self.prediction_length)
-                        
-                        # Создаем DataFrame для будущих ковариат для каждого item_id
-                        future_df_list = []
-                        all_item_ids = ts_data.index.get_level_values(self.id_column).unique()
-                        
-                        for item_id_val in all_item_ids:
-                            item_future_df = pd.DataFrame({
-                                self.id_column: item_id_val,
-                                self.timestamp_column: pd.to_datetime(future_dates_for_holidays) # Убедимся, что это datetime
-                            })
-                            future_df_list.append(item_future_df)
-                        
-                        if future_df_list:
-                            future_df_for_covariates = pd.concat(future_df_list)
-                            future_df_for_covariates = future_df_for_covariates.set_index([self.id_column, self.timestamp_column])
-                            
-                            # Генерируем праздники для будущих дат
-                            country_holidays_obj_future = holidays.CountryHoliday(
-                                self.holiday_country, 
-                                years=range(future_dates_for_holidays.min().year, future_dates_for_holidays.max().year + 1)
-                            )
-                            future_df_for_covariates['is_holiday'] = future_df_for_covariates.index.get_level_values(self.timestamp_column).to_series().dt.normalize().apply(
-                                lambda date: 1 if date in country_holidays_obj_future else 0
-                            ).values
-                            
-                            known_covariates_for_prediction = future_df_for_covariates[['is_holiday']] # Только колонка с ковариатой
-                            self.log(f"Созданы будущие признаки праздников: {known_covariates_for_prediction.shape[0]} записей.")
-                            self.log(f"Пример будущих ковариат:\n{known_covariates_for_prediction.head().to_string()}")
-                        else:
-                            self.log("Не удалось создать DataFrame для будущих ковариат (нет item_id).")
-
-                    except Exception as e_fut_holiday:
-                        self.log(f"Ошибка при подготовке будущих признаков праздников: {str(e_fut_holiday)}\n{traceback.format_exc()}")
+                    handler.close()
+                except:
+                    pass
+                ag_logger.removeHandler(handler)
 
-                predictions = predictor.predict(ts_data, known_covariates=known_covariates_for_prediction)
-                
-                # Преобразование результата с диагностикой для отладки дат
-                try:
-                    self.log(f"Тип прогноза: {type(predictions)}")
-                    
-                    # Проверяем, является ли это TimeSeriesDataFrame с MultiIndex
-                    if hasattr(predictions, 'index') and hasattr(predictions.index, 'nlevels') and predictions.index.nlevels == 2:
-                        self.log("Обрабатываем TimeSeriesDataFrame с MultiIndex")
-                        
-                        # Получаем уникальные ID из прогноза (в правильном порядке!)
-                        forecast_numeric_ids = predictions.index.get_level_values(0).unique()
-                        self.log(f"Числовые ID в прогнозе (от AutoGluon): {forecast_numeric_ids.tolist()}")
-                        
-                        # Получаем исходные строковые ID из данных
-                        original_string_ids = self.data[self.id_column].unique()
-                        self.log(f"Исходные строковые ID в данных: {original_string_ids}")
-                        
-                        # ДИАГНОСТИКА: Показываем последние даты для каждого ID в исходных данных
-                        self.log("=== ДИАГНОСТИКА ИСХОДНЫХ ДАННЫХ ===")
-                        for orig_id in original_string_ids:
-                            id_subset = self.data[self.data[self.id_column] == orig_id]
-                            if len(id_subset) > 0:
-                                sorted_subset = id_subset.sort_values(self.timestamp_column)
-                                first_date = sorted_subset[self.timestamp_column].iloc[0]
-                                last_date = sorted_subset[self.timestamp_column].iloc[-1]
-                                self.log(f"ID '{orig_id}': {len(id_subset)} записей, первая: {first_date.date()}, последняя: {last_date.date()}")
-                            else:
-                                self.log(f"ID '{orig_id}': данные не найдены!")
-                        self.log("=== КОНЕЦ ДИАГНОСТИКИ ===")
-                        
-                        # Применяем категориальный маппинг если есть
-                        if self.id_column in self.categorical_mapping:
-                            mapping = self.categorical_mapping[self.id_column]
-                            self.log(f"Категориальный маппинг: {mapping}")
-                            
-                            # Создаем двусторонний маппинг
-                            numeric_to_country = {}
-                            country_to_numeric = {}
-                            
-                            for i, country_name in enumerate(mapping):
-                                numeric_id = str(float(i))  # '0.0', '1.0', '2.0'
-                                numeric_to_country[numeric_id] = country_name
-                                country_to_numeric[country_name] = numeric_id
-                            
-                            self.log(f"Маппинг числовой -> страна: {numeric_to_country}")
-                            self.log(f"Маппинг страна -> числовой: {country_to_numeric}")
-                        else:
-                            numeric_to_country = {str(uid): str(uid) for uid in forecast_numeric_ids}
-                            country_to_numeric = {str(uid): str(uid) for uid in original_string_ids}
-                        
-                        # Создаем итоговый DataFrame
-                        all_forecast_data = []
-                        
-                        # Обрабатываем каждый числовой ID из прогноза
-                        for numeric_id in forecast_numeric_ids:
-                            numeric_id_str = str(numeric_id)
-                            self.log(f"\n--- Обработка числового ID: {numeric_id_str} ---")
-                            
-                            # Получаем человекочитаемое название
-                            country_name = numeric_to_country.get(numeric_id_str, f"Unknown_{numeric_id_str}")
-                            self.log(f"Маппинг: {numeric_id_str} -> {country_name}")
-                            
-                            # Извлекаем прогноз для этого ID
-                            id_predictions = predictions.loc[numeric_id]
-                            self.log(f"Количество прогнозных точек для {country_name}: {len(id_predictions)}")
-                            
-                            # ИСПРАВЛЕНИЕ: Ищем данные по числовому ID (так как исходные данные содержат числовые ID)
-                            id_data = self.data[self.data[self.id_column] == numeric_id_str]
-                            
-                            if len(id_data) == 0:
-                                self.log(f"Исторические данные для числового ID {numeric_id_str} не найдены")
-                                last_date = pd.Timestamp('2024-01-01')
-                            else:
-                                self.log(f"Найдены данные для {country_name} по числовому ID {numeric_id_str}: {len(id_data)} записей")
-                                id_data_sorted = id_data.sort_values(self.timestamp_column)
-                                
-                                # ДОПОЛНИТЕЛЬНАЯ ДИАГНОСТИКА
-                                first_date = id_data_sorted[self.timestamp_column].iloc[0]
-                                last_date = id_data_sorted[self.timestamp_column].iloc[-1]
-                                self.log(f"Диапазон дат для {country_name}: {first_date.date()} - {last_date.date()}")
-                                
-                                # Показываем последние 3 записи для проверки
-                                last_records = id_data_sorted.tail(3)
-                                self.log(f"Последние записи для {country_name}:")
-                                for _, row in last_records.iterrows():
-                                    self.log(f"  Дата: {row[self.timestamp_column].date()}, Target: {row[self.target_column]}")
-                            
-                            # Создаем будущие даты для этого ID
-                            future_dates = self.create_future_dates_for_specific_id(last_date)
-                            self.log(f"Прогнозные даты для {country_name}: {future_dates[0].strftime('%Y-%m-%d')} - {future_dates[-1].strftime('%Y-%m-%d')}")
-                            
-                            # Формируем итоговый прогноз для этого ID
-                            id_forecast = pd.DataFrame()
-                            id_forecast[self.id_column] = [country_name] * len(future_dates)
-                            id_forecast['timestamp'] = [d.strftime('%Y-%m-%d') for d in future_dates]
-                            
-                            # Копируем числовые прогнозные колонки
-                            for col in id_predictions.columns:
-                                if pd.api.types.is_numeric_dtype(id_predictions[col]):
-                                    values = id_predictions[col].values
-                                    if len(values) >= len(future_dates):
-                                        cleaned_values = np.maximum(values[:len(future_dates)], 0).round(0).astype(int)
-                                    else:
-                                        cleaned_values = np.maximum(values, 0).round(0).astype(int)
-                                        if len(cleaned_values) < len(future_dates):
-                                            last_val = cleaned_values[-1] if len(cleaned_values) > 0 else 0
-                                            additional = [last_val] * (len(future_dates) - len(cleaned_values))
-                                            cleaned_values = np.concatenate([cleaned_values, additional])
-                                    
-                                    id_forecast[col] = cleaned_values
-                            
-                            all_forecast_data.append(id_forecast)
-                            self.log(f"Добавлен прогноз для {country_name}")
-                        
-                        # Объединяем все прогнозы
-                        if all_forecast_data:
-                            forecast_df = pd.concat(all_forecast_data, ignore_index=True)
-                            self.log(f"\nИтоговый прогноз: {len(forecast_df)} записей для {len(all_forecast_data)} стран")
-                            
-                            # Показываем итоговое распределение
-                            for country in forecast_df[self.id_column].unique():
-                                country_data = forecast_df[forecast_df[self.id_column] == country]
-                                dates = country_data['timestamp'].tolist()
-                                self.log(f"Итоговые даты для {country}: {dates[0]} - {dates[-1]}")
-                            
-                            pred_df = forecast_df.copy()
-                        else:
-                            self.log("Не удалось создать прогнозные данные")
-                            pred_df = predictions.reset_index()
-                    
-                    else:
-                        # Запасной вариант для плоского формата
-                        self.log("Обрабатываем плоский DataFrame (запасной вариант)")
-                        pred_df = predictions.reset_index() if hasattr(predictions, 'reset_index') else predictions
-                        
-                        unique_ids = self.data[self.id_column].unique()
-                        records_per_id = self.prediction_length
-                        all_forecast_data = []
-                        
-                        for idx, uid in enumerate(unique_ids):
-                            start_idx = idx * records_per_id
-                            end_idx = start_idx + records_per_id
-                            
-                            if end_idx <= len(pred_df):
-                                id_data = self.data[self.data[self.id_column] == uid]
-                                if len(id_data) > 0:
-                                    id_data_sorted = id_data.sort_values(self.timestamp_column)
-                                    last_date = id_data_sorted[self.timestamp_column].iloc[-1]
-                                else:
-                                    last_date = pd.Timestamp('2024-01-01')
-                                
-                                future_dates = self.create_future_dates_for_specific_id(last_date)
-                                id_predictions = pred_df.iloc[start_idx:end_idx]
-                                
-                                id_forecast = pd.DataFrame()
-                                id_forecast[self.id_column] = [uid] * len(future_dates)
-                                id_forecast['timestamp'] = [d.strftime('%Y-%m-%d') for d in future_dates]
-                                
-                                for col in id_predictions.columns:
-                                    if (pd.api.types.is_numeric_dtype(id_predictions[col]) and 
-                                        col not in [self.id_column, 'timestamp']):
-                                        values = id_predictions[col].values
-                                        cleaned_values = np.maximum(values, 0).round(0).astype(int)
-                                        id_forecast[col] = cleaned_values
-                                
-                                all_forecast_data.append(id_forecast)
-                        
-                        if all_forecast_data:
-                            pred_df = pd.concat(all_forecast_data, ignore_index=True)
-                        
-                    # Логирование результатов
-                    self.log(f"Структура итогового прогноза: {pred_df.dtypes}")
-                    self.log(f"Пример прогноза:\n{pred_df.head(3).to_string()}")
-                                    
-                except Exception as e:
-                    self.log(f"Ошибка при подготовке прогноза: {str(e)}\n{traceback.format_exc()}")
-                    pred_df = predictions.reset_index() if hasattr(predictions, 'reset_index') else predictions
-                
-                # Отправка результатов
-                self.log("Преобразование прогноза в таблицу Orange...")
-                pred_table = self.df_to_table(pred_df)
-                self.Outputs.prediction.send(pred_table)
-                
-                # Лидерборд
-                try:
-                    lb = predictor.leaderboard()
-                    if lb is not None and not lb.empty:
-                        self.log("Формирование лидерборда...")
-                        # Округление числовых значений для улучшения читаемости
-                        for col in lb.select_dtypes(include=['float']).columns:
-                            lb[col] = lb[col].round(4)
-                        
-                        # Проверяем/исправляем имена колонок
-                        lb.columns = [str(col).replace(' ', '_').replace('-', '_') for col in lb.columns]
-                        
-                        # Преобразуем все объектные колонки в строки
-                        for col in lb.select_dtypes(include=['object']).columns:
-                            lb[col] = lb[col].astype(str)
-                            
-                        self.log(f"Структура лидерборда: {lb.dtypes}")
-                        
-                        lb_table = self.df_to_table(lb)
-                        self.Outputs.leaderboard.send(lb_table)
-                except Exception as lb_err:
-                    self.log(f"Ошибка лидерборда: {str(lb_err)}\n{traceback.format_exc()}")
-                
-                # Инфо о модели
-                self.log("Формирование информации о модели...")
-                
-                # Получаем понятное название частоты
-                freq_name = model_freq
-                for code, label in self.FREQUENCIES:
-                    if code == model_freq:
-                        freq_name = f"{label} ({code})"
-                        break
-                
-                # Получаем лучшую модель, если лидерборд доступен
-                best_model_name = "Неизвестно"
-                best_model_score = "Н/Д"
-                
-                try:
-                    if 'lb' in locals() and lb is not None and not lb.empty:
-                        best_model_name = lb.iloc[0]['model']
-                        best_model_score = f"{lb.iloc[0]['score_val']:.4f}"
-                        
-                        # Логируем информацию о лучших моделях
-                        self.log(f"Лучшая модель: {best_model_name}, Оценка: {best_model_score}")
-                        
-                        # Показываем топ-3 модели если их столько есть
-                        if len(lb) > 1:
-                            self.log("Топ модели:")
-                            for i in range(min(3, len(lb))):
-                                model = lb.iloc[i]['model']
-                                score = lb.iloc[i]['score_val']
-                                self.log(f"  {i+1}. {model}: {score:.4f}")
-                except Exception as e:
-                    self.log(f"Не удалось получить информацию о лучшей модели: {str(e)}")
-                
-                # Создаем расширенную информацию о модели
-                model_info = pd.DataFrame({
-                    'Parameter': ['Версия', 'Цель', 'Длина', 'Метрика', 'Пресет', 
-                                'Время', 'Праздники', 'Даты', 'Частота', 'Лучшая модель', 'Оценка модели'],
-                    'Value': ['1.2.0', self.target_column, str(self.prediction_length),
-                              metric, self.selected_preset, 
-                              f"{self.time_limit} сек", 
-                              "Включены" if self.include_holidays else "Отключены",
-                              "Текущие" if self.use_current_date else "Исходные",
-                              freq_name,
-                              best_model_name,
-                              best_model_score]
-                })
-                self.Outputs.model_info.send(self.df_to_table(model_info))
-                
-                # Закрываем логгеры, чтобы не было WinError 32
-                import logging
-                logging.shutdown()
+            self.sampling_report = {}
+            self.fallback_series = {}
+            self.fit_timings = []
+            try:
+                trained = self.train_targets(ts_data, targets, model_root, model_freq, metric, fit_args)
+            except ValueError as ve:
+                self.error(str(ve))
+                return
+            self.save_budget_history(self.fit_timings)
+
+            self.trained = trained
+            self.predictor = trained[self.target_column][0]
+            self.model_meta = self.build_model_meta(targets, model_freq, metric)
+            self.update_model_status()
+            if self.persist_models:
+                self.persist_predictors()
+            self.publish_results(trained, targets, df_sorted, model_freq, metric)
+
+            # Закрываем логгеры, чтобы не было WinError 32
+            logging.shutdown()
                 
+            self.applied_state = self.run_state()
             self.log("=== УСПЕШНО ===")
             
         except Exception as e:
@@ -1923,8 +3634,14 @@ class OWAutoGluonTimeSeries(OWWidget):
             for col in df.columns:
                 # Специальная обработка для ID колонки
                 if col == self.id_column:
-                    # ID колонку всегда храним как мета-переменную
-                    df[col] = df[col].fillna('').astype(str)
+                    # ID колонку всегда храним как мета-переменную; коды категорий заменяются метками здесь
+                    mapping = self.categorical_mapping.get(col)
+                    if mapping and pd.api.types.is_integer_dtype(df[col]):
+                        labels = np.asarray(list(mapping) + [''], dtype=object)
+                        codes = df[col].to_numpy()
+                        df[col] = labels[np.where((codes >= 0) & (codes < len(mapping)), codes, len(mapping))]
+                    else:
+                        df[col] = df[col].fillna('').astype(str)
                     metas.append(StringVariable(name=str(col)))
                     M_cols.append(col)
                 # Обрабатываем числовые данные - идут в X